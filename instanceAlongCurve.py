@@ -1,7 +1,13 @@
 import sys
+import time
 import math
-import random
+import heapq
 import traceback
+import os
+import json
+import collections
+import struct
+import multiprocessing
 import maya.mel as mel
 import pymel.core as pm
 import maya.OpenMaya as OpenMaya
@@ -9,15 +15,32 @@ import maya.OpenMayaUI as OpenMayaUI
 import maya.OpenMayaMPx as OpenMayaMPx
 import maya.OpenMayaRender as OpenMayaRender
 
+# The evaluation kernel does not depend on Maya, so that it can be tested and benchmarked without it.
+# It is installed beside the plugin, whose folder is not always in the python path
+kPluginDirectory = os.path.dirname(os.path.abspath(__file__))
+
+if kPluginDirectory not in sys.path:
+    sys.path.append(kPluginDirectory)
+
+from instanceAlongCurveKernel import *
+
 kPluginVersion = "1.1.0"
 kPluginCmdName = "instanceAlongCurve"
 kPluginCtxCmdName = "instanceAlongCurveCtx"
+kPluginProfileCmdName = "instanceAlongCurveProfile"
+kPluginBakeCmdName = "instanceAlongCurveBake"
 kPluginNodeName = 'instanceAlongCurveLocator'
 kPluginManipNodeName = 'instanceAlongCurveLocatorManip'
 kPluginNodeClassify = 'utility/general'
 kPluginNodeId = OpenMaya.MTypeId( 0x55555 ) 
 kPluginNodeManipId = OpenMaya.MTypeId( 0x55556 ) 
 
+# When True, the time spent creating/removing instances is printed to the script editor
+kReportTimings = False
+
+# Amount of evaluations kept by each node when profiling
+kProfileHistorySize = 100
+
 class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
 
     # Simple container class for compound vector attributes
@@ -36,14 +59,64 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
             self.parameter = OpenMaya.MObject()
             self.angle = OpenMaya.MObject() # The angle over the tangent axis
 
+    # Additional curves, each with its own distribution
+    class CurveArrayAttribute(object):
+
+        def __init__(self):
+            self.compound = OpenMaya.MObject()
+            self.curve = OpenMaya.MObject()
+            self.instanceCount = OpenMaya.MObject() # Used in count mode
+            self.instanceLength = OpenMaya.MObject() # Used in distance mode
+
+    # A curve with data and its distribution, read on each evaluation
+    class InputCurve(object):
+
+        def __init__(self, key, curve, instanceCount, instanceLength):
+            self.key = key
+            self.curve = curve
+            self.curveFn = OpenMaya.MFnNurbsCurve(curve)
+            self.instanceCount = instanceCount
+            self.instanceLength = instanceLength
+
+    # Cached data of a curve, so that editing a curve only samples that curve again
+    class CurveState(object):
+
+        def __init__(self):
+            self.arcLengthTable = None
+            self.frameTable = None
+            self.samples = None
+
+        def invalidate(self):
+            self.arcLengthTable = None
+            self.frameTable = None
+            self.samples = None
+
+    # Key of inputCurve on the curve states. Curves from inputCurves use their logical index
+    kPrimaryCurve = -1
+
+    # Additional source objects, each with its own selection weight
+    class PrototypeArrayAttribute(object):
+
+        def __init__(self):
+            self.compound = OpenMaya.MObject()
+            self.matrix = OpenMaya.MObject()
+            self.weight = OpenMaya.MObject()
+
     # Legacy attributes to support backward compatibility
     legacyInputTransformAttr = OpenMaya.MObject()
 
     # Input attributes
     inputCurveAttr = OpenMaya.MObject()
+    inputCurvesAttr = CurveArrayAttribute()
     inputTransformAttr = OpenMaya.MObject()
     inputShadingGroupAttr = OpenMaya.MObject()
 
+    # Prototypes: the input transform is always the first one, inputPrototypes are added after it
+    inputPrototypesAttr = PrototypeArrayAttribute()
+    prototypeWeightAttr = OpenMaya.MObject()
+    prototypeSelectionModeAttr = OpenMaya.MObject()
+    prototypeRampAttr = OpenMaya.MObject()
+
     # Translation offsets
     inputLocalTranslationOffsetAttr = OpenMaya.MObject()
     inputGlobalTranslationOffsetAttr = OpenMaya.MObject()
@@ -61,6 +134,12 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
     instanceLengthAttr = OpenMaya.MObject()
     maxInstancesByLengthAttr = OpenMaya.MObject()
 
+    # Seed of the per-instance random values
+    randomSeedAttr = OpenMaya.MObject()
+
+    # Modeling mode creates a transform per instance, Animation mode feeds a particle instancer
+    evaluationModeAttr = OpenMaya.MObject()
+
     # Curve axis data, to be manipulated by user
     enableManipulatorsAttr = OpenMaya.MObject()
     curveAxisHandleAttr = CurveAxisHandleAttribute()
@@ -85,7 +164,7 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
     # Simple container class for compound vector attributes
     class RampValueContainer(object):
 
-        def __init__(self, mObject, dataBlock, rampAttr, normalize, instanceCount):            
+        def __init__(self, mObject, dataBlock, rampAttr, normalize, amplitudeValues):
             self.ramp = OpenMaya.MRampAttribute(OpenMaya.MPlug(mObject, rampAttr.ramp))
             self.rampOffset = dataBlock.inputValue(rampAttr.rampOffset).asFloat()
             self.rampRandomAmplitude = dataBlock.inputValue(rampAttr.rampRandomAmplitude).asFloat()
@@ -97,49 +176,43 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
             else:
                 self.rampAxis = dataBlock.inputValue(rampAttr.rampAxis.compound).asVector()
 
-            self.useDynamicAmplitudeValues = False
-
-            amplitudePlug = OpenMaya.MPlug(mObject, rampAttr.rampAmplitude)
+            # Per-instance amplitudes, sampled from a connected shading network
+            self.useDynamicAmplitudeValues = amplitudeValues is not None
+            self.rampAmplitudeValues = amplitudeValues
 
-            if amplitudePlug.isConnected():
-
-                # Get connected input plugs
-                connections = OpenMaya.MPlugArray()
-                amplitudePlug.connectedTo(connections, True, False)
-
-                # Find input transform
-                if connections.length() == 1:
-                    node = connections[0].node()
-                    nodeFn = OpenMaya.MFnDependencyNode(node)
+    # Ramps base offset
+    distOffsetAttr = OpenMaya.MObject()
 
-                    resultColors = OpenMaya.MFloatVectorArray()
-                    resultTransparencies = OpenMaya.MFloatVectorArray()
+    # Normalized thresholds for curve evaluation
+    curveStartAttr = OpenMaya.MObject()
+    curveEndAttr = OpenMaya.MObject()
 
-                    uValues = OpenMaya.MFloatArray(instanceCount, 0.0)
-                    vValues = OpenMaya.MFloatArray(instanceCount, 0.0)
+    # Distribution of the instances over the normalized arc length
+    enableDensityAttr = OpenMaya.MObject()
+    densityRampAttr = OpenMaya.MObject()
 
-                    # Sample a line, for more user flexibility
-                    for i in xrange(instanceCount):
-                        uValues.set(i / float(instanceCount), i)
-                        vValues.set(i / float(instanceCount), i)
+    # Instances are hidden where the visibility ramp is below the threshold
+    enableVisibilityAttr = OpenMaya.MObject()
+    visibilityRampAttr = OpenMaya.MObject()
+    visibilityThresholdAttr = OpenMaya.MObject()
 
-                    # For now... then we can just use the plug (TODO)
-                    if(node.hasFn(OpenMaya.MFn.kTexture2d)):                        
-                        
-                        OpenMayaRender.MRenderUtil.sampleShadingNetwork(nodeFn.name() + ".outColor", instanceCount, False, False, OpenMaya.MFloatMatrix(), None, uValues, vValues, None, None, None, None, None, resultColors, resultTransparencies)
+    # Relative error allowed when building the arc length table
+    arcLengthToleranceAttr = OpenMaya.MObject()
 
-                        self.rampAmplitudeValues = []
-                        self.useDynamicAmplitudeValues = True
+    # Amount of rotation minimizing frames sampled over the curve, for the parallel transport orientation mode
+    frameTableResolutionAttr = OpenMaya.MObject()
 
-                        for i in xrange(resultColors.length()):
-                            self.rampAmplitudeValues.append(resultColors[i].length() / math.sqrt(3))
+    # When enabled, the bounding box is expanded by the source object bounds
+    includeSourceBoundsAttr = OpenMaya.MObject()
 
-    # Ramps base offset
-    distOffsetAttr = OpenMaya.MObject()
+    # Parallel evaluation settings
+    workerCountAttr = OpenMaya.MObject()
+    parallelThresholdAttr = OpenMaya.MObject()
 
-    # Normalized thresholds for curve evaluation
-    curveStartAttr = OpenMaya.MObject()
-    curveEndAttr = OpenMaya.MObject()
+    # Playback of baked frames instead of evaluating the curve
+    useCacheAttr = OpenMaya.MObject()
+    cacheFileAttr = OpenMaya.MObject()
+    cacheTimeAttr = OpenMaya.MObject()
 
     # Ramp attributes
     positionRampAttr = RampAttributes()
@@ -151,74 +224,180 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
     outputRotationAttr = Vector3CompoundAttribute()
     outputScaleAttr = Vector3CompoundAttribute()
 
+    # Per-point arrays (position, rotation, scale) for the instancer
+    outputInstancerPointsAttr = OpenMaya.MObject()
+
+    # Prototype of each instance
+    outputPrototypeAttr = OpenMaya.MObject()
+
+    # Visibility of each instance
+    outputVisibilityAttr = OpenMaya.MObject()
+
+    # Profiling of the last evaluation, by stage
+    enableProfilingAttr = OpenMaya.MObject()
+    profileStagesAttr = OpenMaya.MObject()
+    profileTimesAttr = OpenMaya.MObject()
+    profileCallsAttr = OpenMaya.MObject()
+
+    # Attributes that invalidate the cached instance samples when dirtied. Filled on nodeInitializer
+    instanceSamplingAttrs = []
+
+    # Attributes that invalidate the cached values of all channels, or of a single channel. Filled on nodeInitializer
+    sharedChannelAttrs = []
+    channelAttrs = {}
+
     def __init__(self):
         OpenMayaMPx.MPxLocatorNode.__init__(self)
+        self.instanceSamples = None # Samples of all curves, joined in order
+        self.curveStates = {}
+        self.curveRanges = [] # (key, start, end) of the instances owned by each curve
+        self.bakedRamps = {}
+        self.amplitudeSamples = {}
+        self.handleIndex = None
+        self.handleAnglesDirty = False
+        self.channelValues = {}
+        self.channelVisibility = {} # Visibility of the instances when each channel was evaluated, None if all were visible
+        self.indexAllocator = None
+        self.shadingGroup = None
+        self.shadingGroupCached = False
+        self.profileHistory = collections.deque(maxlen=kProfileHistorySize)
+        self.reconciledInstanceCount = None
+        self.boundingBoxCache = None
+        self.instancePivot = (0.0, 0.0, 0.0)
+        self.instanceCache = None
+        self.prototypeIndices = None
+        self.reconciledPrototypeIndices = None
+        self.instancePrototypes = None # Prototype of each instance by logical index, None until all instances are checked
+        self.legacyInstancesUpgraded = False
+        self.densityTable = None
+        self.newInstancerNode = None # Created by the last reconcileInstances, named by finishInstances
 
     def postConstructor(self):
         OpenMaya.MFnDependencyNode(self.thisMObject()).setName("instanceAlongCurveLocatorShape#")
         self.callbackId = OpenMaya.MNodeMessage.addAttributeChangedCallback(self.thisMObject(), self.attrChangeCallback)
-        self.updateInstanceConnections()
+        kInstanceUpdateScheduler.schedule(self)
 
-    # Find original SG to reassign it to instance
+    # Find original SG to reassign it to instance. Cached until inputShadingGroup connections change
     def getShadingGroup(self):
-        inputSGPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputShadingGroupAttr)
-        sgNode = getSingleSourceObjectFromPlug(inputSGPlug)
 
-        if sgNode is not None and sgNode.hasFn(OpenMaya.MFn.kSet):
-            return OpenMaya.MFnSet(sgNode)
+        if not self.shadingGroupCached:
+            inputSGPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputShadingGroupAttr)
+            sgNode = getSingleSourceObjectFromPlug(inputSGPlug)
 
-        return None
+            self.shadingGroup = None
+            self.shadingGroupCached = True
 
-    def assignShadingGroup(self, fnDagNode):
+            if sgNode is not None and sgNode.hasFn(OpenMaya.MFn.kSet):
+                self.shadingGroup = OpenMaya.MFnSet(sgNode)
+
+        return self.shadingGroup
+
+    # Assigns the SG only to the given (new) instances, in a single command
+    def assignShadingGroup(self, instances):
 
         fnSet = self.getShadingGroup()
 
-        if fnSet is not None:
+        if fnSet is None:
+            return
+
+        names = []
+
+        for instance in instances:
+            path = OpenMaya.MDagPath()
+            OpenMaya.MFnDagNode(instance).getPath(path)
+
+            # Skip instances whose shape is already a member of the set
+            shapePath = OpenMaya.MDagPath(path)
+
+            if shapePath.childCount() == 1 and shapePath.child(0).hasFn(OpenMaya.MFn.kShape):
+                shapePath.extendToShape()
+
+                if fnSet.isMember(shapePath):
+                    continue
+
+            names.append(path.fullPathName())
+
+        if len(names) > 0:
             # Easiest, cleanest way seems to be calling MEL.
             # sets command handles everything, even nested instanced dag paths
             mdgm = OpenMaya.MDGModifier()
-            mdgm.commandToExecute("sets -e -nw -fe " + fnSet.name() + " " + fnDagNode.name())
+            mdgm.commandToExecute("sets -e -nw -fe " + fnSet.name() + " " + " ".join(names))
             mdgm.doIt()
 
-    # Helper function to get an array of available logical indices from the sparse array
-    # TODO: maybe it can be precalculated?
-    def getAvailableLogicalIndices(self, plug, numIndices):
-        
-        # Allocate and initialize
-        outIndices = OpenMaya.MIntArray(numIndices)
-        indices = OpenMaya.MIntArray(plug.numElements())
-        plug.getExistingArrayAttributeIndices(indices)
+    # Helper function to get a list of available logical indices from the sparse array
+    def getAvailableLogicalIndices(self, numIndices):
+        return self.getIndexAllocator().allocate(numIndices)
+
+    # Returns the free index allocator for the output arrays, scanning the existing connections only once.
+    # Afterwards, it is kept up to date by connectionMade/connectionBroken
+    def getIndexAllocator(self):
+
+        if self.indexAllocator is None:
+
+            plug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputTranslationAttr.compound)
+            indices = OpenMaya.MIntArray()
+            plug.getExistingArrayAttributeIndices(indices)
+
+            self.indexAllocator = LogicalIndexAllocator([i for i in indices if plug.elementByLogicalIndex(i).isConnected()])
+
+        return self.indexAllocator
+
+    def isOutputTranslationElement(self, plug):
+        return plug.isElement() and plug.array().attribute() == instanceAlongCurveLocator.outputTranslationAttr.compound
+
+    def connectionMade(self, plug, otherPlug, asSrc):
+
+        if plug.attribute() == instanceAlongCurveLocator.inputShadingGroupAttr:
+            self.shadingGroupCached = False
+
+        # Instances of the new prototype are created once the connections settle
+        if plug.attribute() == instanceAlongCurveLocator.inputPrototypesAttr.matrix:
+            self.prototypeIndices = None
+            self.instancePrototypes = None
+            kInstanceUpdateScheduler.schedule(self)
+
+        if plug.attribute() == instanceAlongCurveLocator.inputTransformAttr:
+            self.instancePrototypes = None
+
+        if asSrc and self.isOutputTranslationElement(plug):
+
+            # New instances need all their values written
+            self.channelValues = {}
 
-        currentAvailableIndex = 0
-        indicesFound = 0
+            if self.indexAllocator is not None:
+                self.indexAllocator.markUsed(plug.logicalIndex())
 
-        # Assuming indices are SORTED :)
-        for i in indices:
+        return OpenMayaMPx.MPxLocatorNode.connectionMade(self, plug, otherPlug, asSrc)
 
-            connectedPlug = plug.elementByLogicalIndex(i).isConnected()
+    def connectionBroken(self, plug, otherPlug, asSrc):
 
-            # Iteratively find available indices in the sparse array
-            while i > currentAvailableIndex:
-                outIndices[indicesFound] = currentAvailableIndex
-                indicesFound += 1
-                currentAvailableIndex += 1
+        if plug.attribute() == instanceAlongCurveLocator.inputShadingGroupAttr:
+            self.shadingGroupCached = False
 
-            # Check against this index, add it if it is not connected
-            if i == currentAvailableIndex and not connectedPlug:
-                outIndices[indicesFound] = currentAvailableIndex
-                indicesFound += 1
+        if plug.attribute() == instanceAlongCurveLocator.inputPrototypesAttr.matrix:
+            self.prototypeIndices = None
+            self.instancePrototypes = None
+            kInstanceUpdateScheduler.schedule(self)
 
-            currentAvailableIndex += 1
+        if plug.attribute() == instanceAlongCurveLocator.inputTransformAttr:
+            self.instancePrototypes = None
 
-            if indicesFound == numIndices:
-                return outIndices
+        # A replaced instance may be disconnected after its replacement was connected to the same index,
+        # so the index is only released if no other instance is still connected to it
+        if asSrc and self.isOutputTranslationElement(plug):
+            self.channelValues = {}
 
-        # Fill remaining expected indices
-        for i in xrange(indicesFound, numIndices):
-            outIndices[i] = currentAvailableIndex
-            currentAvailableIndex += 1
+            if self.indexAllocator is not None and not self.hasOtherDestination(plug, otherPlug):
+                self.indexAllocator.release(plug.logicalIndex())
 
-        return outIndices
+        return OpenMayaMPx.MPxLocatorNode.connectionBroken(self, plug, otherPlug, asSrc)
+
+    def hasOtherDestination(self, plug, otherPlug):
+
+        connections = OpenMaya.MPlugArray()
+        plug.connectedTo(connections, False, True)
+
+        return any(connections[i] != otherPlug for i in xrange(connections.length()))
 
     def getNodeTransformFn(self):
         dagNode = OpenMaya.MFnDagNode(self.thisMObject())
@@ -226,110 +405,341 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         dagNode.getPath(dagPath)
         return OpenMaya.MFnDagNode(dagPath.transform())
 
-    def updateInstanceConnections(self):
+    # Creates or removes instances to match the expected count. Parenting, connections and deletions
+    # are added to mdagModifier, so that many nodes can share it. Returns the new instances,
+    # which must be passed to finishInstances once the modifier is executed
+    def reconcileInstances(self, mdagModifier):
 
         # If the locator is being instanced, just stop updating its children.
         # This is to prevent losing references to the locator instances' children
         # If you want to change this locator, prepare the source before instantiating
         if OpenMaya.MFnDagNode(self.thisMObject()).isInstanced():
-            return OpenMaya.kUnknownParameter
+            return []
 
         # Plugs
+        outputTranslationPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputTranslationAttr.compound)
+
+        if not self.legacyInstancesUpgraded:
+            self.upgradeLegacyInstances(mdagModifier)
+
+        # In animation mode, the instancer does all the work, so no transforms are needed
+        animationMode = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.evaluationModeAttr).asShort() == 1
+        self.updateInstancer(animationMode, mdagModifier)
+
+        expectedInstanceCount = 0 if animationMode else self.getInstanceCountByMode()
+
+        # When playing a cache, there must be enough instances for its most populated frame
+        if not animationMode and OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.useCacheAttr).asBool():
+            instanceCache = self.getInstanceCache(OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.cacheFileAttr).asString())
+
+            if instanceCache is not None:
+                expectedInstanceCount = instanceCache.maxInstanceCount
+        numConnectedElements = outputTranslationPlug.numConnectedElements()
+
+        # Even if instances can't be created now, there is no need to try again until the count changes
+        self.reconciledInstanceCount = expectedInstanceCount
+
+        # Remove instances if necessary
+        if numConnectedElements > expectedInstanceCount:
+            self.removeInstances(numConnectedElements - expectedInstanceCount, mdagModifier)
+            numConnectedElements = expectedInstanceCount
+
+        prototypeFns = self.getPrototypeTransformFns()
+
+        if not prototypeFns:
+            return []
+
+        # Instances take their prototype by order. Cached frames may have more instances than the node, those use the input transform
+        prototypeIndices = self.getOutputPrototypes() if expectedInstanceCount > 0 else []
+        prototypeIndices = prototypeIndices[:expectedInstanceCount] + [0] * max(expectedInstanceCount - len(prototypeIndices), 0)
+        self.reconciledPrototypeIndices = prototypeIndices
+
+        # Logical indices of all instances once the missing ones are connected, so that new and existing instances
+        # can be matched with their prototype. The allocator already knows the connected ones, in the same order
+        # as their physical indices, and removed instances are the last ones
+        connectedIndices = sorted(self.getIndexAllocator().usedIndices)[:numConnectedElements]
+
+        # Duplicates are created right away, unlike the rest of the changes, which are only applied if the
+        # whole reconcile succeeds. If anything fails they are deleted, and the new indices are free again
+        newIndices = []
+        instances = []
+
+        try:
+            newIndices = self.getAvailableLogicalIndices(expectedInstanceCount - numConnectedElements) if numConnectedElements < expectedInstanceCount else []
+            instanceIndices = sorted(connectedIndices + newIndices)
+
+            # Existing instances are only checked if their prototype changed since the last reconcile, or all of them
+            # after loading or changing the prototype connections. With a single prototype, any instance is valid
+            instancePrototypes = self.instancePrototypes
+            checkAll = instancePrototypes is None
+            checkChanged = not checkAll and len(prototypeFns) > 1
+
+            # Instances whose prototype changed are deleted and created again on the same index
+            newIndices = set(newIndices)
+            replacedIndices = set()
+            indicesByPrototype = {}
+            connections = OpenMaya.MPlugArray()
+
+            for i in xrange(len(instanceIndices)):
+                index = instanceIndices[i]
+                prototypeIndex = prototypeIndices[i]
+
+                if index not in newIndices:
+
+                    if not checkAll and not (checkChanged and instancePrototypes.get(index) != prototypeIndex):
+                        continue
+
+                    outputTranslationPlug.elementByLogicalIndex(index).connectedTo(connections, False, True)
+
+                    if connections.length() == 0 or self.isInstanceOfPrototype(connections[0].node(), prototypeFns, prototypeIndex):
+                        continue
+
+                    mdagModifier.deleteNode(connections[0].node())
+                    replacedIndices.add(index)
+
+                indicesByPrototype.setdefault(prototypeIndex, []).append(index)
+
+            self.instancePrototypes = dict(zip(instanceIndices, prototypeIndices))
+
+            # Duplications are grouped by prototype, so that each one needs a single template
+            for prototypeIndex in sorted(indicesByPrototype):
+                self.createInstances(prototypeFns[prototypeIndex], indicesByPrototype[prototypeIndex], mdagModifier, replacedIndices, instances)
+
+            return instances
+        except:
+            self.rollbackInstances(instances, newIndices)
+            raise
+
+    # Undoes the immediate changes of a failed reconcile. Its modifier must not be executed
+    def rollbackInstances(self, instances, newIndices):
+
+        mdagModifier = OpenMaya.MDagModifier()
+
+        for instance in instances:
+            mdagModifier.deleteNode(instance)
+
+        mdagModifier.doIt()
+
+        for index in newIndices:
+            self.getIndexAllocator().release(index)
+
+        self.instancePrototypes = None
+        self.newInstancerNode = None
+
+    # Instances created by previous versions have no visibility connection. They are connected once, the first
+    # time the node reconciles its instances after being created or loaded
+    def upgradeLegacyInstances(self, mdagModifier):
+
+        self.legacyInstancesUpgraded = True
+
+        outputTranslationPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputTranslationAttr.compound)
+        outputVisibilityPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputVisibilityAttr)
+        connections = OpenMaya.MPlugArray()
+
+        for i in xrange(outputTranslationPlug.numConnectedElements()):
+            outputTranslationPlugElement = outputTranslationPlug.connectionByPhysicalIndex(i)
+            outputVisibilityPlugElement = outputVisibilityPlug.elementByLogicalIndex(outputTranslationPlugElement.logicalIndex())
+
+            if outputVisibilityPlugElement.isConnected():
+                continue
+
+            outputTranslationPlugElement.connectedTo(connections, False, True)
+
+            if connections.length() > 0:
+                mdagModifier.connect(outputVisibilityPlugElement, OpenMaya.MFnDagNode(connections[0].node()).findPlug("visibility", False))
+
+    # Instances share the children of their prototype. If a prototype has no children, any prototype is accepted
+    def isInstanceOfPrototype(self, instance, prototypeFns, prototypeIndex):
+
+        instanceFn = OpenMaya.MFnDagNode(instance)
+        prototypeFn = prototypeFns[prototypeIndex]
+
+        if prototypeFn.childCount() == 0:
+            return True
+
+        return instanceFn.childCount() > 0 and instanceFn.child(0) == prototypeFn.child(0)
+
+    def finishInstances(self, instances):
+
+        # Nodes can only be renamed with a pattern once they exist
+        if self.newInstancerNode is not None:
+            OpenMaya.MFnDagNode(self.newInstancerNode).setName("instanceAlongCurveInstancer#")
+            self.newInstancerNode = None
+
+        # Finally, assign SG to the new instances
+        if len(instances) > 0:
+            self.assignShadingGroup(instances)
+
+    # Creates a new instance for each logical index, in one pass. Parenting and connections are added to mdagModifier.
+    # Replaced indices are still connected to the instances being deleted, so they are always connected again.
+    # Duplicates exist as soon as they are created, so they are added to instances right away
+    def createInstances(self, inputTransformFn, indices, mdagModifier, replacedIndices, instances):
+
+        startTime = time.time()
+
+        transformFn = self.getNodeTransformFn()
+
         outputTranslationPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputTranslationAttr.compound)
         outputRotationPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputRotationAttr.compound)
         outputScalePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputScaleAttr.compound)
+        outputVisibilityPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputVisibilityAttr)
 
-        expectedInstanceCount = self.getInstanceCountByMode()
-        numConnectedElements = outputTranslationPlug.numConnectedElements()
+        displayPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.displayTypeAttr)
+        LODPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.bboxAttr)
 
-        # Only instance if we are missing elements
-        # TODO: handle mismatches in translation/rotation plug connected elements (user deleted a plug? use connectionBroken method?)
-        if numConnectedElements < expectedInstanceCount:
+        # The first instance is used as template, so that pivots, visibility and overrides are set only once
+        # InstanceLeaf must be set to False to prevent crashes :)
+        firstInstance = len(instances)
+        template = inputTransformFn.duplicate(True, False)
+        instances.append(template)
+        templateFn = OpenMaya.MFnTransform(template)
 
-            inputTransformFn = self.getInputTransformFn()
+        templateFn.setRotatePivot(inputTransformFn.rotatePivot(OpenMaya.MSpace.kTransform ), OpenMaya.MSpace.kTransform , False)
+        templateFn.setScalePivot(inputTransformFn.scalePivot(OpenMaya.MSpace.kTransform ), OpenMaya.MSpace.kTransform , False)
 
-            if inputTransformFn is not None:
+        # Make instance visible, and enable drawing overrides
+        templateFn.findPlug("visibility", False).setBool(True)
+        templateFn.findPlug("overrideEnabled", False).setBool(True)
 
-                rotatePivot = inputTransformFn.rotatePivot(OpenMaya.MSpace.kTransform )
-                scalePivot = inputTransformFn.scalePivot(OpenMaya.MSpace.kTransform )
+        # Clones copy the template values
+        for i in xrange(len(indices) - 1):
+            instances.append(templateFn.duplicate(True, False))
 
-                transformFn = self.getNodeTransformFn()
-                newInstancesCount = expectedInstanceCount - numConnectedElements
-                availableIndices = self.getAvailableLogicalIndices(outputTranslationPlug, newInstancesCount)
+        # Attributes are looked up once, plugs are then built directly for each instance
+        translateAttr = templateFn.attribute("translate")
+        rotateAttr = templateFn.attribute("rotate")
+        scaleAttr = templateFn.attribute("scale")
+        visibilityAttr = templateFn.attribute("visibility")
+        displayTypeAttr = templateFn.attribute("overrideDisplayType")
+        LODAttr = templateFn.attribute("overrideLevelOfDetail")
 
-                displayPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.displayTypeAttr)
-                LODPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.bboxAttr)
+        # All parenting and connections are done by the same modifier
+        for i in xrange(len(indices)):
 
-                mdgModifier = OpenMaya.MDagModifier()
+            instance = instances[firstInstance + i]
+            index = indices[i]
 
-                for i in availableIndices:
-                    
-                    # Instance transform
-                    # InstanceLeaf must be set to False to prevent crashes :)
-                    trInstance = inputTransformFn.duplicate(True, False)
-                    instanceFn = OpenMaya.MFnTransform(trInstance)
+            mdagModifier.reparentNode(instance, transformFn.object())
 
-                    # Parent new instance
-                    transformFn.addChild(trInstance)
+            outputTranslationPlugElement = outputTranslationPlug.elementByLogicalIndex(index)
+            outputRotationPlugElement = outputRotationPlug.elementByLogicalIndex(index)
+            outputScalePlugElement = outputScalePlug.elementByLogicalIndex(index)
+            replaced = index in replacedIndices
 
-                    # Pivots
-                    instanceFn.setRotatePivot(rotatePivot, OpenMaya.MSpace.kTransform , False)
-                    instanceFn.setScalePivot(scalePivot, OpenMaya.MSpace.kTransform , False)
+            if replaced or not outputTranslationPlugElement.isConnected():
+                mdagModifier.connect(outputTranslationPlugElement, OpenMaya.MPlug(instance, translateAttr))
 
-                    instanceTranslatePlug = instanceFn.findPlug('translate', False)
-                    outputTranslationPlugElement = outputTranslationPlug.elementByLogicalIndex(i)
+            if replaced or not outputRotationPlugElement.isConnected():
+                mdagModifier.connect(outputRotationPlugElement, OpenMaya.MPlug(instance, rotateAttr))
 
-                    instanceRotationPlug = instanceFn.findPlug('rotate', False)
-                    outputRotationPlugElement = outputRotationPlug.elementByLogicalIndex(i)
+            if replaced or not outputScalePlugElement.isConnected():
+                mdagModifier.connect(outputScalePlugElement, OpenMaya.MPlug(instance, scaleAttr))
 
-                    instanceScalePlug = instanceFn.findPlug('scale', False)
-                    outputScalePlugElement = outputScalePlug.elementByLogicalIndex(i)
+            outputVisibilityPlugElement = outputVisibilityPlug.elementByLogicalIndex(index)
 
-                    # Make instance visible
-                    instanceFn.findPlug("visibility", False).setBool(True)
+            if replaced or not outputVisibilityPlugElement.isConnected():
+                mdagModifier.connect(outputVisibilityPlugElement, OpenMaya.MPlug(instance, visibilityAttr))
 
-                    # Enable drawing overrides
-                    overrideEnabledPlug = instanceFn.findPlug("overrideEnabled", False)
-                    overrideEnabledPlug.setBool(True)
+            # Overrides may have been connected to the source, e.g. by a display layer
+            displayTypePlug = OpenMaya.MPlug(instance, displayTypeAttr)
+            LODPlugElement = OpenMaya.MPlug(instance, LODAttr)
 
-                    instanceDisplayPlug = instanceFn.findPlug("overrideDisplayType", False)
-                    instanceLODPlug = instanceFn.findPlug("overrideLevelOfDetail", False)
+            if not displayTypePlug.isConnected():
+                mdagModifier.connect(displayPlug, displayTypePlug)
 
-                    if not outputTranslationPlugElement.isConnected():
-                        mdgModifier.connect(outputTranslationPlugElement, instanceTranslatePlug)
+            if not LODPlugElement.isConnected():
+                mdagModifier.connect(LODPlug, LODPlugElement)
 
-                    if not outputRotationPlugElement.isConnected():
-                        mdgModifier.connect(outputRotationPlugElement, instanceRotationPlug)
+        reportTiming("Created " + str(len(indices)) + " instances", startTime)
 
-                    if not outputScalePlugElement.isConnected():
-                        mdgModifier.connect(outputScalePlugElement, instanceScalePlug)
+    # Deletes the last connected instances
+    def removeInstances(self, toRemove, mdgModifier):
 
-                    if not instanceDisplayPlug.isConnected():
-                        mdgModifier.connect(displayPlug, instanceDisplayPlug)
+        startTime = time.time()
 
-                    if not instanceLODPlug.isConnected():
-                        mdgModifier.connect(LODPlug, instanceLODPlug)
+        outputTranslationPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputTranslationAttr.compound)
+        numConnectedElements = outputTranslationPlug.numConnectedElements()
 
-                mdgModifier.doIt()
+        connections = OpenMaya.MPlugArray()
 
-                # Finally, assign SG to all children
-                self.assignShadingGroup(transformFn)
+        for i in xrange(toRemove):
+            outputTranslationPlugElement = outputTranslationPlug.connectionByPhysicalIndex(numConnectedElements - 1 - i)
+            outputTranslationPlugElement.connectedTo(connections, False, True)
 
-        # Remove instances if necessary
-        elif numConnectedElements > expectedInstanceCount:
+            for c in xrange(connections.length()):
+                mdgModifier.deleteNode(connections[c].node())
 
-            connections = OpenMaya.MPlugArray()        
-            toRemove = numConnectedElements - expectedInstanceCount
-            mdgModifier = OpenMaya.MDGModifier()
+        reportTiming("Removed " + str(toRemove) + " instances", startTime)
 
-            for i in xrange(toRemove):
-                outputTranslationPlugElement = outputTranslationPlug.connectionByPhysicalIndex(numConnectedElements - 1 - i)
-                outputTranslationPlugElement.connectedTo(connections, False, True)
+    def getInstancerNode(self):
 
-                for c in xrange(connections.length()):
-                    mdgModifier.deleteNode(connections[c].node())
+        instancerPointsPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputInstancerPointsAttr)
+        connections = OpenMaya.MPlugArray()
+        instancerPointsPlug.connectedTo(connections, False, True)
 
-            mdgModifier.doIt()
+        for c in xrange(connections.length()):
+            if connections[c].node().hasFn(OpenMaya.MFn.kInstancer):
+                return connections[c].node()
+
+        return None
+
+    # Creates or removes the particle instancer used by the animation mode. All changes are added to
+    # mdagModifier, like the rest of the instance updates. A new instancer is named by finishInstances
+    def updateInstancer(self, enabled, mdagModifier):
+
+        instancerNode = self.getInstancerNode()
+
+        if enabled and instancerNode is None:
+
+            inputTransformFn = self.getInputTransformFn()
+
+            if inputTransformFn is not None:
+
+                # The node is created right away, and added under the locator transform when the modifier executes
+                instancerNode = mdagModifier.createNode("instancer", self.getNodeTransformFn().object())
+                instancerFn = OpenMaya.MFnDagNode(instancerNode)
+                mdagModifier.connect(self.thisMObject(), instanceAlongCurveLocator.outputInstancerPointsAttr, instancerNode, instancerFn.attribute("inputPoints"))
+                self.newInstancerNode = instancerNode
+
+        elif not enabled and instancerNode is not None:
+            mdagModifier.deleteNode(instancerNode)
+            return
+
+        if enabled and instancerNode is not None:
+            self.updateInstancerHierarchy(instancerNode, mdagModifier)
+
+    # Connects the matrix of each prototype to the instancer hierarchy, in prototype order, so that
+    # the object index of each point picks its prototype
+    def updateInstancerHierarchy(self, instancerNode, mdgModifier):
+
+        prototypeFns = self.getPrototypeTransformFns()
+        hierarchyPlug = OpenMaya.MFnDagNode(instancerNode).findPlug("inputHierarchy", False)
+        connections = OpenMaya.MPlugArray()
+
+        for i in xrange(len(prototypeFns)):
+            elementPlug = hierarchyPlug.elementByLogicalIndex(i)
+            sourcePlug = prototypeFns[i].findPlug("matrix", False)
+            elementPlug.connectedTo(connections, True, False)
+
+            if connections.length() == 1 and connections[0] == sourcePlug:
+                continue
+
+            if connections.length() == 1:
+                mdgModifier.disconnect(connections[0], elementPlug)
+
+            mdgModifier.connect(sourcePlug, elementPlug)
+
+        # Prototypes that were removed
+        indices = OpenMaya.MIntArray()
+        hierarchyPlug.getExistingArrayAttributeIndices(indices)
+
+        for index in indices:
+            if index >= len(prototypeFns):
+                elementPlug = hierarchyPlug.elementByLogicalIndex(index)
+                elementPlug.connectedTo(connections, True, False)
+
+                if connections.length() == 1:
+                    mdgModifier.disconnect(connections[0], elementPlug)
 
     def attrChangeCallback(self, msg, plug, otherPlug, clientData):
 
@@ -338,15 +748,26 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         isCorrectAttribute = (plug.attribute() == instanceAlongCurveLocator.instanceCountAttr) 
         isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.instancingModeAttr)
         isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.instanceLengthAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.inputCurvesAttr.instanceCount)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.inputCurvesAttr.instanceLength)
         isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.maxInstancesByLengthAttr)
         isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.curveStartAttr)
         isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.curveEndAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.evaluationModeAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.useCacheAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.cacheFileAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.prototypeWeightAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.inputPrototypesAttr.weight)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.prototypeSelectionModeAttr)
+        isCorrectAttribute = isCorrectAttribute or (getRootPlug(plug).attribute() == instanceAlongCurveLocator.prototypeRampAttr)
+        isCorrectAttribute = isCorrectAttribute or (plug.attribute() == instanceAlongCurveLocator.randomSeedAttr)
 
         isCorrectNode = OpenMaya.MFnDependencyNode(plug.node()).typeName() == kPluginNodeName
 
         try:
+            # Dragging a slider sets the attribute many times, so only the last value is reconciled
             if isCorrectNode and isCorrectAttribute and attributeSet and incomingDirection:
-                self.updateInstanceConnections()
+                kInstanceUpdateScheduler.scheduleFromCallback(self)
         except:    
             sys.stderr.write('Failed trying to update instances. stack trace: \n')
             sys.stderr.write(traceback.format_exc())
@@ -365,16 +786,91 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
     def getInputTransformFn(self):
 
         inputTransformPlug = self.getInputTransformPlug()
-        transform = getSingleSourceObjectFromPlug(inputTransformPlug)
+        return getTransformFnFromPlug(inputTransformPlug)
 
-        # Get Fn from a DAG path to get the world transformations correctly
-        if transform is not None and transform.hasFn(OpenMaya.MFn.kTransform):
-                path = OpenMaya.MDagPath()
-                trFn = OpenMaya.MFnDagNode(transform)
-                trFn.getPath(path)
-                return OpenMaya.MFnTransform(path)
+    # Connected elements of inputPrototypes, in order
+    def getPrototypeElementPlugs(self):
 
-        return None
+        inputPrototypesPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputPrototypesAttr.compound)
+        elementPlugs = []
+
+        for i in xrange(inputPrototypesPlug.numElements()):
+            elementPlug = inputPrototypesPlug.elementByPhysicalIndex(i)
+
+            if elementPlug.child(instanceAlongCurveLocator.inputPrototypesAttr.matrix).isConnected():
+                elementPlugs.append(elementPlug)
+
+        return elementPlugs
+
+    # The input transform followed by each connected prototype, or an empty list without input transform.
+    # Sources that are not transforms are replaced by the input transform, so that indices are kept
+    def getPrototypeTransformFns(self):
+
+        inputTransformFn = self.getInputTransformFn()
+
+        if inputTransformFn is None:
+            return []
+
+        prototypeFns = [inputTransformFn]
+
+        for elementPlug in self.getPrototypeElementPlugs():
+            prototypeFn = getTransformFnFromPlug(elementPlug.child(instanceAlongCurveLocator.inputPrototypesAttr.matrix))
+            prototypeFns.append(prototypeFn if prototypeFn is not None else inputTransformFn)
+
+        return prototypeFns
+
+    # Weights of the input transform and each connected prototype
+    def getPrototypeWeights(self, dataBlock):
+
+        weights = [dataBlock.inputValue(instanceAlongCurveLocator.prototypeWeightAttr).asFloat()]
+        connectedIndices = set(elementPlug.logicalIndex() for elementPlug in self.getPrototypeElementPlugs())
+        arrayHandle = dataBlock.inputArrayValue(instanceAlongCurveLocator.inputPrototypesAttr.compound)
+
+        for i in xrange(arrayHandle.elementCount()):
+            arrayHandle.jumpToArrayElement(i)
+
+            if arrayHandle.elementIndex() in connectedIndices:
+                weights.append(arrayHandle.inputValue().child(instanceAlongCurveLocator.inputPrototypesAttr.weight).asFloat())
+
+        return weights
+
+    # Returns the cached prototype of each instance. The assignment only depends on the curves in ramp mode,
+    # so otherwise it is kept until the selection inputs change
+    def getInstancePrototypes(self, dataBlock, samples, count, resampledIndices):
+
+        selectionMode = dataBlock.inputValue(instanceAlongCurveLocator.prototypeSelectionModeAttr).asShort()
+        rampChanged = selectionMode == 2 and resampledIndices != []
+
+        if self.prototypeIndices is None or len(self.prototypeIndices) != count or rampChanged:
+            weights = self.getPrototypeWeights(dataBlock)
+            seed = dataBlock.inputValue(instanceAlongCurveLocator.randomSeedAttr).asInt()
+            rampValues = None
+
+            if selectionMode == 2 and len(weights) > 1:
+                ramp = OpenMaya.MRampAttribute(OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.prototypeRampAttr))
+                rampValues = self.getBakedRamp(instanceAlongCurveLocator.prototypeRampAttr, ramp).evaluate(samples.normalizedDistances[:count], 1.0, 0.0)
+
+            self.prototypeIndices = getPrototypeIndices(weights, selectionMode, seed, count, rampValues)
+
+        return self.prototypeIndices
+
+    # Prototype of each instance, as computed by the node
+    def getOutputPrototypes(self):
+
+        outputPrototypePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.outputPrototypeAttr)
+        prototypes = OpenMaya.MFnIntArrayData(outputPrototypePlug.asMObject()).array()
+        return [prototypes[i] for i in xrange(prototypes.length())]
+
+    def writePrototypes(self, dataBlock, prototypeIndices):
+
+        prototypeArray = OpenMaya.MIntArray()
+
+        for prototypeIndex in prototypeIndices:
+            prototypeArray.append(prototypeIndex)
+
+        outputHandle = dataBlock.outputValue(instanceAlongCurveLocator.outputPrototypeAttr)
+        outputHandle.setMObject(OpenMaya.MFnIntArrayData().create(prototypeArray))
+        outputHandle.setClean()
 
     def getCurveFn(self):
         inputCurvePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputCurveAttr)
@@ -393,442 +889,870 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
 
         return None
 
-    # Calculate expected instances by the instancing mode
-    def getInstanceCountByMode(self):
+    # Calculate expected instances of a curve by the instancing mode
+    def getCurveInstanceCount(self, curveLength, instanceCount, instanceLength):
         instancingModePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instancingModeAttr)
-        inputCurvePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputCurveAttr)
 
-        if inputCurvePlug.isConnected() and instancingModePlug.asInt() == 1:
-            instanceLengthPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instanceLengthAttr)
+        if instancingModePlug.asInt() == 1:
             maxInstancesByLengthPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.maxInstancesByLengthAttr)
-            curveFn = self.getCurveFn()
-
-            # Known issue: even if the curve fn is dag path constructed, its length is not worldspace... 
-            # If you want perfect distance-based instancing, freeze the transformations of the curve
-            curveLength = curveFn.length()
 
             curveStart = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.curveStartAttr).asFloat() * curveLength
             curveEnd = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.curveEndAttr).asFloat() * curveLength
 
             effectiveCurveLength = min(max(curveEnd - curveStart, 0.001), curveLength)
 
-            return min(maxInstancesByLengthPlug.asInt(), int(math.ceil(effectiveCurveLength / instanceLengthPlug.asFloat())))
+            return min(maxInstancesByLengthPlug.asInt(), int(math.ceil(effectiveCurveLength / instanceLength)))
+
+        return instanceCount
+
+    # Calculate expected instances of all curves. In distance mode, curve lengths are taken from the
+    # arc length tables when available, which are measured over the world space curves
+    def getInstanceCountByMode(self):
+
+        instanceCount = 0
+        inputCurvePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputCurveAttr)
+        inputCurvesPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputCurvesAttr.compound)
+        hasCurves = inputCurvePlug.isConnected()
+
+        if hasCurves:
+            arcLengthTable = self.getPlugArcLengthTable(instanceAlongCurveLocator.kPrimaryCurve, inputCurvePlug)
+
+            if arcLengthTable is not None:
+                instanceCount += self.getCurveInstanceCount(arcLengthTable.curveLength, OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instanceCountAttr).asInt(),
+                                                            OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instanceLengthAttr).asFloat())
+
+        for i in xrange(inputCurvesPlug.numElements()):
+            elementPlug = inputCurvesPlug.elementByPhysicalIndex(i)
+            curvePlug = elementPlug.child(instanceAlongCurveLocator.inputCurvesAttr.curve)
+
+            if curvePlug.isConnected():
+                hasCurves = True
+                arcLengthTable = self.getPlugArcLengthTable(elementPlug.logicalIndex(), curvePlug)
 
-        instanceCountPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instanceCountAttr)
-        return instanceCountPlug.asInt()
+                if arcLengthTable is not None:
+                    instanceCount += self.getCurveInstanceCount(arcLengthTable.curveLength, elementPlug.child(instanceAlongCurveLocator.inputCurvesAttr.instanceCount).asInt(),
+                                                                elementPlug.child(instanceAlongCurveLocator.inputCurvesAttr.instanceLength).asFloat())
 
-    def getRandomizedValueUnified(self, randomValue, randomAmplitude, value):
-        return (randomValue * 2.0 - 1.0) * randomAmplitude + value
+        # Without curves, the count is kept so that instances are not removed while reconnecting
+        if not hasCurves:
+            return OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instanceCountAttr).asInt()
 
-    def getRandomizedValue(self, random, randomAmplitude, value):
-        return (random.random() * 2.0 - 1.0) * randomAmplitude + value
+        return instanceCount
 
-    # Calculate expected instances by the instancing mode
-    def getIncrementByMode(self, count, effectiveCurveLength):
+    # Calculate the distance between instances by the instancing mode
+    def getIncrementByMode(self, count, effectiveCurveLength, instanceLength):
         instancingModePlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instancingModeAttr)
        
         # Distance defined manually
         if instancingModePlug.asInt() == 1:
-            instanceLengthPlug = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.instanceLengthAttr)            
-            return instanceLengthPlug.asFloat()
+            return instanceLength
         
         # Distance driven by count
-        return effectiveCurveLength / float(count)
-
-    def updateInstancePositions(self, curveFn, dataBlock, count, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement, inputTransformPlug, inputTransformFn, axisHandlesSorted):
-
-            # Common data
-            translateArrayHandle = dataBlock.outputArrayValue(instanceAlongCurveLocator.outputTranslationAttr.compound)
-            curveLength = curveFn.length()
-            maxParam = curveFn.findParamFromLength(curveLength)
-            curveForm = curveFn.form()
-
-            # Important: enums are short! If not, the resulting int may be incorrect
-            rotMode = dataBlock.inputValue(instanceAlongCurveLocator.orientationModeAttr).asShort()
-            localRotationAxisMode = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalOrientationAxisAttr).asShort()
-
-            if localRotationAxisMode == 0:
-                forward = OpenMaya.MVector.xAxis
-                up = OpenMaya.MVector.yAxis
-                right = OpenMaya.MVector.zAxis
-            elif localRotationAxisMode == 1:
-                forward = OpenMaya.MVector.yAxis
-                up = OpenMaya.MVector.zAxis
-                right = OpenMaya.MVector.xAxis
-            elif localRotationAxisMode == 2:
-                forward = OpenMaya.MVector.zAxis
-                up = OpenMaya.MVector.yAxis
-                right = OpenMaya.MVector.xAxis
-
-            # We use Z axis as forward, and adjust locally to that axis
-            referenceAxis = OpenMaya.MVector.zAxis
-            referenceUp = OpenMaya.MVector.yAxis
-
-            # Local offset is not considered for position
-            localRotation = forward.rotateTo(referenceAxis)
-
-            # Manipulator data
-            enableManipulators = dataBlock.inputValue(instanceAlongCurveLocator.enableManipulatorsAttr).asBool()
-
-            # Local translation offsets
-            localTranslationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalTranslationOffsetAttr.compound).asVector()
-            globalTranslationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputGlobalTranslationOffsetAttr.compound).asVector()
-            
-            # Get pivot
-            rotatePivot = OpenMaya.MVector()
+        return effectiveCurveLength / float(max(count, 1))
 
-            if inputTransformPlug.isConnected():
-                rotatePivot = OpenMaya.MVector(inputTransformFn.rotatePivot(OpenMaya.MSpace.kTransform ))
-                rotatePivot += OpenMaya.MVector(inputTransformFn.rotatePivotTranslation(OpenMaya.MSpace.kTransform ))
+    # Returns every curve with data, inputCurve first and then inputCurves by index
+    def getInputCurves(self, dataBlock):
 
-            # Deterministic random
-            random.seed(count)
-            rampValues = instanceAlongCurveLocator.RampValueContainer(self.thisMObject(), dataBlock, instanceAlongCurveLocator.positionRampAttr, False, count)
+        inputCurves = []
+        curve = dataBlock.inputValue(instanceAlongCurveLocator.inputCurveAttr).asNurbsCurveTransformed()
 
-            inputTransformRotation = OpenMaya.MQuaternion()
+        if not curve.isNull():
+            inputCurves.append(instanceAlongCurveLocator.InputCurve(instanceAlongCurveLocator.kPrimaryCurve, curve,
+                                                                    dataBlock.inputValue(instanceAlongCurveLocator.instanceCountAttr).asInt(),
+                                                                    dataBlock.inputValue(instanceAlongCurveLocator.instanceLengthAttr).asFloat()))
 
-            # First, map parameter
-            if inputTransformPlug.isConnected():
-                inputTransformFn.getRotation(inputTransformRotation, OpenMaya.MSpace.kWorld)
+        arrayHandle = dataBlock.inputArrayValue(instanceAlongCurveLocator.inputCurvesAttr.compound)
 
-            # Make sure there are enough handles...
-            for i in xrange(min(count, translateArrayHandle.elementCount())):
+        for i in xrange(arrayHandle.elementCount()):
+            arrayHandle.jumpToArrayElement(i)
+            elementHandle = arrayHandle.inputValue()
+            curve = elementHandle.child(instanceAlongCurveLocator.inputCurvesAttr.curve).asNurbsCurveTransformed()
 
-                dist = math.fmod(curveStart + math.fmod(lengthIncrement * i + distOffset, effectiveCurveLength), curveLength)
-                param = max( min( curveFn.findParamFromLength( dist ), maxParam ), 0.0)
+            if not curve.isNull():
+                inputCurves.append(instanceAlongCurveLocator.InputCurve(arrayHandle.elementIndex(), curve,
+                                                                        elementHandle.child(instanceAlongCurveLocator.inputCurvesAttr.instanceCount).asInt(),
+                                                                        elementHandle.child(instanceAlongCurveLocator.inputCurvesAttr.instanceLength).asFloat()))
 
-                # Ramps are not modified by curve start/end, so objects can "slide"
-                normalizedDistance = dist / curveFn.length()
-                rampValue = self.getRampValueAtNormalizedPosition(rampValues, normalizedDistance)
-                
-                # Get the actual point on the curve...
-                point = OpenMaya.MPoint()
-                curveFn.getPointAtParam(param, point)
+        return inputCurves
 
-                tangent = curveFn.tangent(param)
-                rot = referenceAxis.rotateTo(tangent)
+    def getCurveState(self, key):
 
-                # If the axis is parallel, but with inverse direction, rotate it PI over the up vector
-                if referenceAxis.isParallel(tangent) and (referenceAxis * tangent < 0):
-                    rot = OpenMaya.MQuaternion(math.pi, referenceUp)
+        if key not in self.curveStates:
+            self.curveStates[key] = instanceAlongCurveLocator.CurveState()
 
-                # Transform rotation so that it is aligned with the tangent. This fixes unintentional twisting
-                rot = localRotation * rot
-                
-                # Modify resulting rotation based on mode
-                if rotMode == 0:                    # Identity
-                    rot = OpenMaya.MQuaternion()
-                elif rotMode == 1:                  # Input rotation
-                    rot = inputTransformRotation;
-                elif rotMode == 3 and i % 2 == 1:   # Chain mode, interesting for position ;)
-                    rot *= OpenMaya.MQuaternion(math.pi * .5, tangent)
+        return self.curveStates[key]
 
-                # Get the angle from handles, and rotate over tangent axis
-                if enableManipulators:
-                    angle = self.getRotationForParam(param, axisHandlesSorted, curveForm, maxParam)
-                    rot = rot * OpenMaya.MQuaternion(-angle, tangent)
+    # Returns the samples of all curves joined in order, sampling again only the curves whose inputs were dirtied.
+    # Also returns the indices of the instances whose samples changed, and of those whose curve was sampled again
+    # (the rest only changed their manipulator angles). Both are None if instances changed their owner curve
+    def getInstanceSamples(self, dataBlock, inputCurves, counts, orientationMode):
 
-                # The curve basis used for twisting
-                basisForward = forward.rotateBy(rot)
-                basisUp = up.rotateBy(rot)
-                basisRight = right.rotateBy(rot)
+        # Manipulator data, only for the primary curve
+        handleIndex = None
 
-                rampAmplitude = self.getRampAmplitudeForInstance(rampValues, i)
+        if dataBlock.inputValue(instanceAlongCurveLocator.enableManipulatorsAttr).asBool():
+            handleIndex = self.getHandleIndex(dataBlock)
 
-                twistNormal = basisRight * self.getRandomizedValue(random, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.x
-                twistTangent = basisUp * self.getRandomizedValue(random, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.y
-                twistBitangent = basisForward * self.getRandomizedValue(random, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.z
+        distOffset = dataBlock.inputValue(instanceAlongCurveLocator.distOffsetAttr).asFloat()
+        curveStartFactor = dataBlock.inputValue(instanceAlongCurveLocator.curveStartAttr).asFloat()
+        curveEndFactor = dataBlock.inputValue(instanceAlongCurveLocator.curveEndAttr).asFloat()
+        densityTable = self.getDensityTable(dataBlock)
 
-                twist = (twistNormal + twistTangent + twistBitangent)
+        resampledIndices = []
+        handleChangedIndices = []
+        curveRanges = []
+        joinSamples = self.instanceSamples is None
+        start = 0
 
-                # Twist + global offset, without pivot
-                point += twist + globalTranslationOffset - rotatePivot
+        for inputCurve, count in zip(inputCurves, counts):
 
-                # Local offset
-                point += basisRight * localTranslationOffset.x + basisUp * localTranslationOffset.y + basisForward * localTranslationOffset.z
+            state = self.getCurveState(inputCurve.key)
+            arcLengthTable = state.arcLengthTable
+            isPrimary = inputCurve.key == instanceAlongCurveLocator.kPrimaryCurve
 
-                translateArrayHandle.jumpToArrayElement(i)
-                translateHandle = translateArrayHandle.outputValue()
-                translateHandle.set3Double(point.x, point.y, point.z)
+            if state.samples is None or len(state.samples) != count:
+                curveLength = arcLengthTable.curveLength
 
-            translateArrayHandle.setAllClean()
-            translateArrayHandle.setClean()
+                # Curve thresholds
+                curveStart = curveStartFactor * curveLength
+                effectiveCurveLength = min(max(curveEndFactor * curveLength - curveStart, 0.001), curveLength)
+                lengthIncrement = self.getIncrementByMode(count, effectiveCurveLength, inputCurve.instanceLength)
 
-    def getRampAmplitudeForInstance(self, rampValues, instanceIndex):
+                state.samples = sampleInstances(MayaCurve(inputCurve.curveFn), arcLengthTable, count, distOffset, curveStart, effectiveCurveLength,
+                                                lengthIncrement, handleIndex if isPrimary else None, densityTable)
+                resampledIndices.extend(xrange(start, start + count))
+                joinSamples = True
 
-        if rampValues.useDynamicAmplitudeValues:
+            elif isPrimary and self.handleAnglesDirty:
+                handleAngles = getHandleAngles(handleIndex, state.samples.params, MayaCurve(inputCurve.curveFn).isClosed(), arcLengthTable.maxParam)
+                handleChangedIndices.extend(start + i for i in state.samples.updateHandleAngles(handleAngles))
+                joinSamples = True
 
-            if len(rampValues.rampAmplitudeValues) > instanceIndex:
-                return rampValues.rampAmplitudeValues[instanceIndex]
+            if orientationMode == 4 and state.samples.frameRotations is None:
+                self.updateFrameRotations(inputCurve, state, dataBlock)
+                joinSamples = True
 
-        return rampValues.rampAmplitude
+            curveRanges.append((inputCurve.key, start, start + count))
+            start += count
 
-    def getRampValueAtNormalizedPosition(self, rampValues, v):
+        self.handleAnglesDirty = False
 
-        util = OpenMaya.MScriptUtil()
-        util.createFromDouble(0.0)
-        valuePtr = util.asFloatPtr()
-        
-        position = math.fmod((v * rampValues.rampRepeat) + rampValues.rampOffset, 1.0)
-        rampValues.ramp.getValueAtPosition(position, valuePtr)
+        if joinSamples:
+            self.instanceSamples = InstanceSamples.join([self.curveStates[inputCurve.key].samples for inputCurve in inputCurves])
 
-        return util.getFloat(valuePtr)
+        # If curves were added or removed, or changed their count, instances may now belong to other curves
+        if curveRanges != self.curveRanges:
+            self.curveRanges = curveRanges
+            return (self.instanceSamples, None, None)
 
-    def updateInstanceScale(self, curveFn, dataBlock, count, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement):
+        return (self.instanceSamples, sorted(resampledIndices + handleChangedIndices), resampledIndices)
 
-            point = OpenMaya.MPoint()
-            curveLength = curveFn.length()
-            maxParam = curveFn.findParamFromLength(curveLength)
-            scaleArrayHandle = dataBlock.outputArrayValue(instanceAlongCurveLocator.outputScaleAttr.compound)
+    # Returns the cached density table, building it again only if the density ramp changed.
+    # None means a uniform distribution, either disabled or without density anywhere
+    def getDensityTable(self, dataBlock):
 
-            localScaleOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalScaleOffsetAttr.compound).asVector()
+        if not dataBlock.inputValue(instanceAlongCurveLocator.enableDensityAttr).asBool():
+            return None
 
-            # Deterministic random
-            random.seed(count)
-            rampValues = instanceAlongCurveLocator.RampValueContainer(self.thisMObject(), dataBlock, instanceAlongCurveLocator.scaleRampAttr, False, count)
+        if self.densityTable is None:
+            ramp = OpenMaya.MRampAttribute(OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.densityRampAttr))
+            self.densityTable = DensityTable.fromDensities(self.getBakedRamp(instanceAlongCurveLocator.densityRampAttr, ramp).values) or False
 
-            # Make sure there are enough handles...
-            for i in xrange(min(count, scaleArrayHandle.elementCount())):
+        return self.densityTable or None
 
-                dist = math.fmod(curveStart + math.fmod(lengthIncrement * i + distOffset, effectiveCurveLength), curveLength)
-                param = max( min( curveFn.findParamFromLength( dist ), maxParam ), 0.0)
+    # Returns the cached manipulator handles, reading them again only if some handle changed
+    def getHandleIndex(self, dataBlock):
 
-                # Ramps are not modified by curve start/end, so objects can "slide"
-                normalizedDistance = dist / curveFn.length()
-                rampValue = self.getRampValueAtNormalizedPosition(rampValues, normalizedDistance)
+        if self.handleIndex is None:
+            curveAxisHandleArray = dataBlock.inputArrayValue(instanceAlongCurveLocator.curveAxisHandleAttr.compound)
+            self.handleIndex = HandleIndex(getSortedCurveAxisArray(self.thisMObject(), curveAxisHandleArray))
 
-                unifiedRandom = random.random()
-                rampAmplitude = self.getRampAmplitudeForInstance(rampValues, i)
+        return self.handleIndex
 
-                # Scales are unified... because it makes more sense
-                point.x = localScaleOffset.x + self.getRandomizedValueUnified(unifiedRandom, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.x
-                point.y = localScaleOffset.y + self.getRandomizedValueUnified(unifiedRandom, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.y
-                point.z = localScaleOffset.z + self.getRandomizedValueUnified(unifiedRandom, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.z
+    # Rotation minimizing frames are only built when the orientation mode needs them, and interpolated
+    # for each instance when the samples change
+    def updateFrameRotations(self, inputCurve, state, dataBlock):
 
-                scaleArrayHandle.jumpToArrayElement(i)
-                scaleHandle = scaleArrayHandle.outputValue()
-                scaleHandle.set3Double(point.x, point.y, point.z)
+        if state.frameTable is None:
+            resolution = dataBlock.inputValue(instanceAlongCurveLocator.frameTableResolutionAttr).asInt()
+            state.frameTable = FrameTable.fromCurve(MayaCurve(inputCurve.curveFn), state.arcLengthTable, resolution)
 
-            scaleArrayHandle.setAllClean()
-            scaleArrayHandle.setClean()
+        state.samples.frameRotations = state.frameTable.getRotations(state.samples.normalizedDistances, state.samples.tangents)
 
-    # TODO: cache this data to prevent recalculating when there is no manipulator being updated
-    def getRotationForParam(self, param, axisHandlesSorted, curveForm, curveMaxParam):
+    # Returns the cached arc length table of a curve, rebuilding it if the curve or the tolerance changed
+    def getArcLengthTable(self, inputCurve, dataBlock):
 
-        indexRange = (-1, -1)
-        wrapAround = not (curveForm is OpenMaya.MFnNurbsCurve.kOpen)
+        state = self.getCurveState(inputCurve.key)
 
-        # Find the range of indices that make up this curve segment
-        for i in xrange(len(axisHandlesSorted)):
+        if state.arcLengthTable is None:
+            tolerance = dataBlock.inputValue(instanceAlongCurveLocator.arcLengthToleranceAttr).asFloat()
+            state.arcLengthTable = ArcLengthTable.fromCurve(MayaCurve(inputCurve.curveFn), tolerance)
 
-            # TODO: could use a binary search
-            if param < axisHandlesSorted[i][1]:
+        return state.arcLengthTable
 
-                if i > 0:
-                    indexRange = (i - 1, i)
-                    break
-                elif wrapAround:
-                    indexRange = (len(axisHandlesSorted) - 1, 0)
-                    break
-                else:
-                    indexRange = (0, 0)
-                    break
+    # Same as getArcLengthTable, outside of compute. The table is built from the same world space curve that
+    # compute reads, so both agree on the instance count and share the table. None if the curve has no data
+    def getPlugArcLengthTable(self, key, curvePlug):
+
+        state = self.getCurveState(key)
+
+        if state.arcLengthTable is None:
+            curveHandle = curvePlug.asMDataHandle()
+
+            try:
+                curve = curveHandle.asNurbsCurveTransformed()
+            finally:
+                curvePlug.destructHandle(curveHandle)
+
+            if curve.isNull():
+                return None
+
+            tolerance = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.arcLengthToleranceAttr).asFloat()
+            state.arcLengthTable = ArcLengthTable.fromCurve(MayaCurve(OpenMaya.MFnNurbsCurve(curve)), tolerance)
+
+        return state.arcLengthTable
+
+    def setDependentsDirty(self, plug, plugArray):
+
+        attribute = getRootPlug(plug).attribute()
+
+        # Arc length and frame tables only depend on the curve shape
+        if attribute == instanceAlongCurveLocator.inputCurveAttr:
+            self.getCurveState(instanceAlongCurveLocator.kPrimaryCurve).invalidate()
+            self.instanceSamples = None
 
-        # Edge case
-        if indexRange[0] == -1 and indexRange[1] == -1 and len(axisHandlesSorted) > 0:
-            if wrapAround:
-                indexRange = (len(axisHandlesSorted) - 1, 0)
+        # Each element of inputCurves only invalidates its own curve. If the array itself is dirtied,
+        # elements may have been removed, so all of them are invalidated
+        if attribute == instanceAlongCurveLocator.inputCurvesAttr.compound:
+            elementPlug = plug.parent() if plug.isChild() else plug
+
+            if elementPlug.isElement():
+                state = self.getCurveState(elementPlug.logicalIndex())
+
+                if plug.attribute() == instanceAlongCurveLocator.inputCurvesAttr.curve or not plug.isChild():
+                    state.invalidate()
+                else:
+                    state.samples = None
             else:
-                indexRange = (len(axisHandlesSorted) - 1, len(axisHandlesSorted) - 1)
-            
-        # Now find the lerp value based on the range
-        if indexRange[0] > -1 and indexRange[1] > -1:
-            minParam = axisHandlesSorted[indexRange[0]][1]
-            maxParam = axisHandlesSorted[indexRange[1]][1]
+                primaryState = self.getCurveState(instanceAlongCurveLocator.kPrimaryCurve)
+                self.curveStates = {instanceAlongCurveLocator.kPrimaryCurve: primaryState}
 
-            minAxis = axisHandlesSorted[indexRange[0]][2]
-            maxAxis = axisHandlesSorted[indexRange[1]][2]
+            self.instanceSamples = None
 
-            if(math.fabs(minParam - maxParam) > 0.001):
+        if attribute == instanceAlongCurveLocator.arcLengthToleranceAttr:
+            for state in self.curveStates.values():
+                state.invalidate()
 
-                if minParam > maxParam and wrapAround:
+            self.instanceSamples = None
 
-                    if param < maxParam:
-                        param = param + curveMaxParam
+        # The frame table is sampled over the arc length table
+        if attribute == instanceAlongCurveLocator.frameTableResolutionAttr:
+            for state in self.curveStates.values():
+                state.frameTable = None
 
-                    maxParam = maxParam + curveMaxParam
-                
-                t = min(max((param - minParam) / (maxParam - minParam), 0.0), 1.0)
+                if state.samples is not None:
+                    state.samples.frameRotations = None
 
-                return minAxis + (maxAxis - minAxis) * t
+            self.instanceSamples = None
 
-            return minAxis
+        # Prototype assignment. Moving a prototype does not change it
+        if attribute == instanceAlongCurveLocator.inputPrototypesAttr.compound and plug.attribute() != instanceAlongCurveLocator.inputPrototypesAttr.matrix:
+            self.prototypeIndices = None
 
-        return 0.0
+        if attribute in [instanceAlongCurveLocator.prototypeWeightAttr, instanceAlongCurveLocator.prototypeSelectionModeAttr, instanceAlongCurveLocator.randomSeedAttr]:
+            self.prototypeIndices = None
 
-    def updateInstanceRotations(self, curveFn, dataBlock, count, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement, inputTransformPlug, inputTransformFn, axisHandlesSorted):
+        if attribute == instanceAlongCurveLocator.prototypeRampAttr:
+            self.bakedRamps.pop(instanceAlongCurveLocator.prototypeRampAttr, None)
+            self.prototypeIndices = None
 
-        # Common data
-        curveLength = curveFn.length()
-        maxParam = curveFn.findParamFromLength(curveLength)
-        curveForm = curveFn.form()
-        rotationArrayHandle = dataBlock.outputArrayValue(instanceAlongCurveLocator.outputRotationAttr.compound)
+        if attribute == instanceAlongCurveLocator.visibilityRampAttr:
+            self.bakedRamps.pop(instanceAlongCurveLocator.visibilityRampAttr, None)
 
-        # All offsets are in degrees
-        localRotationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalRotationOffsetAttr.compound).asVector() * math.radians(1)
-        globalRotationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputGlobalRotationOffsetAttr.compound).asVector() * math.radians(1)
+        # The density table only depends on the ramp. Samples are invalidated with the rest of the sampling inputs
+        if attribute == instanceAlongCurveLocator.densityRampAttr:
+            self.bakedRamps.pop(instanceAlongCurveLocator.densityRampAttr, None)
+            self.densityTable = None
+
+        # The count and length of the node only distribute the primary curve
+        if attribute == instanceAlongCurveLocator.instanceCountAttr or attribute == instanceAlongCurveLocator.instanceLengthAttr:
+            self.getCurveState(instanceAlongCurveLocator.kPrimaryCurve).samples = None
+            self.instanceSamples = None
+
+        # Handles only modify the instances around them, so the samples are kept
+        if attribute == instanceAlongCurveLocator.curveAxisHandleAttr.compound or attribute == instanceAlongCurveLocator.curveAxisHandleCountAttr:
+            self.handleIndex = None
+            self.handleAnglesDirty = True
+
+        if attribute in instanceAlongCurveLocator.sharedChannelAttrs:
+            self.channelValues = {}
+
+        if attribute == instanceAlongCurveLocator.includeSourceBoundsAttr:
+            self.boundingBoxCache = None
+
+        # The cache file is mapped again the next time a frame is read
+        if attribute == instanceAlongCurveLocator.cacheFileAttr:
+            self.closeInstanceCache()
+
+        for channelAttr, attrs in instanceAlongCurveLocator.channelAttrs.items():
+            if attribute in attrs:
+                self.channelValues.pop(channelAttr, None)
 
-        localRotationOffset = OpenMaya.MEulerRotation(localRotationOffset.x, localRotationOffset.y, localRotationOffset.z).asQuaternion()
-        globalRotationOffset = OpenMaya.MEulerRotation(globalRotationOffset.x, globalRotationOffset.y, globalRotationOffset.z).asQuaternion()
+        for rampAttr in [instanceAlongCurveLocator.positionRampAttr, instanceAlongCurveLocator.rotationRampAttr, instanceAlongCurveLocator.scaleRampAttr]:
+
+            # Ramp entries changed, so they must be baked again
+            if attribute == rampAttr.ramp:
+                self.bakedRamps.pop(rampAttr, None)
+
+            # Amplitude sources are sampled again when any of them is dirtied, either by a change on
+            # the shading network or by a new connection
+            if attribute == rampAttr.rampAmplitude:
+                self.amplitudeSamples = {}
+
+        # Any change on the shared sampling inputs (mode, offsets, thresholds...) invalidates the frames of all curves
+        if attribute in instanceAlongCurveLocator.instanceSamplingAttrs:
+            for state in self.curveStates.values():
+                state.samples = None
+
+            self.instanceSamples = None
+
+        return OpenMayaMPx.MPxLocatorNode.setDependentsDirty(self, plug, plugArray)
+
+    # Reads all the node settings needed by the kernel
+    def getTransformSettings(self, dataBlock, inputTransformPlug, inputTransformFn):
+
+        settings = TransformSettings()
 
         # Important: enums are short! If not, the resulting int may be incorrect
-        rotMode = dataBlock.inputValue(instanceAlongCurveLocator.orientationModeAttr).asShort()
-        localRotationAxisMode = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalOrientationAxisAttr).asShort()
-
-        if localRotationAxisMode == 0:
-            forward = OpenMaya.MVector.xAxis
-            up = OpenMaya.MVector.yAxis
-            right = OpenMaya.MVector.zAxis
-        elif localRotationAxisMode == 1:
-            forward = OpenMaya.MVector.yAxis
-            up = OpenMaya.MVector.zAxis
-            right = OpenMaya.MVector.xAxis
-        elif localRotationAxisMode == 2:
-            forward = OpenMaya.MVector.zAxis
-            up = OpenMaya.MVector.yAxis
-            right = OpenMaya.MVector.xAxis
-
-        # We use Z axis as forward, and adjust locally to that axis
-        referenceAxis = OpenMaya.MVector.zAxis
-        referenceUp = OpenMaya.MVector.yAxis
-
-        # Rotation to align selected (local) forward axis to the reference forward axis (which is aligned with tangent)
-        localRotation = localRotationOffset * forward.rotateTo(referenceAxis)
-
-        # Deterministic random
-        random.seed(count)
-        rampValues = instanceAlongCurveLocator.RampValueContainer(self.thisMObject(), dataBlock, instanceAlongCurveLocator.rotationRampAttr, True, count)
-
-        # Manipulator stuff
-        enableManipulators = dataBlock.inputValue(instanceAlongCurveLocator.enableManipulatorsAttr).asBool()
-
-        # Original transform data
-        inputTransformRotation = OpenMaya.MQuaternion()
-
-        # First, map parameter
+        settings.orientationMode = dataBlock.inputValue(instanceAlongCurveLocator.orientationModeAttr).asShort()
+        settings.localAxisMode = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalOrientationAxisAttr).asShort()
+        settings.enableManipulators = dataBlock.inputValue(instanceAlongCurveLocator.enableManipulatorsAttr).asBool()
+
+        # Deterministic random, independent of the instance count
+        settings.randomSeed = dataBlock.inputValue(instanceAlongCurveLocator.randomSeedAttr).asInt()
+
         if inputTransformPlug.isConnected():
+            inputTransformRotation = OpenMaya.MQuaternion()
             inputTransformFn.getRotation(inputTransformRotation, OpenMaya.MSpace.kWorld)
+            settings.inputRotation = (inputTransformRotation.x, inputTransformRotation.y, inputTransformRotation.z, inputTransformRotation.w)
 
-        for i in xrange(min(count, rotationArrayHandle.elementCount())):
-            
-            dist = math.fmod(curveStart + math.fmod(lengthIncrement * i + distOffset, effectiveCurveLength), curveLength)
-            param = max( min( curveFn.findParamFromLength( dist ), maxParam ), 0.0)
+            rotatePivot = OpenMaya.MVector(inputTransformFn.rotatePivot(OpenMaya.MSpace.kTransform ))
+            rotatePivot += OpenMaya.MVector(inputTransformFn.rotatePivotTranslation(OpenMaya.MSpace.kTransform ))
+            settings.rotatePivot = (rotatePivot.x, rotatePivot.y, rotatePivot.z)
+
+        # Translation offsets
+        localTranslationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalTranslationOffsetAttr.compound).asVector()
+        globalTranslationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputGlobalTranslationOffsetAttr.compound).asVector()
+        settings.localTranslationOffset = (localTranslationOffset.x, localTranslationOffset.y, localTranslationOffset.z)
+        settings.globalTranslationOffset = (globalTranslationOffset.x, globalTranslationOffset.y, globalTranslationOffset.z)
+
+        # All rotation offsets are in degrees
+        localRotationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalRotationOffsetAttr.compound).asVector() * math.radians(1)
+        globalRotationOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputGlobalRotationOffsetAttr.compound).asVector() * math.radians(1)
+        settings.localRotationOffset = quatFromEulerXYZ(localRotationOffset.x, localRotationOffset.y, localRotationOffset.z)
+        settings.globalRotationOffset = quatFromEulerXYZ(globalRotationOffset.x, globalRotationOffset.y, globalRotationOffset.z)
 
-            # Ramps are not modified by curve start/end, so objects can "slide"
-            normalizedDistance = dist / curveFn.length()
-            rampValue = self.getRampValueAtNormalizedPosition(rampValues, normalizedDistance)
+        localScaleOffset = dataBlock.inputValue(instanceAlongCurveLocator.inputLocalScaleOffsetAttr.compound).asVector()
+        settings.localScaleOffset = (localScaleOffset.x, localScaleOffset.y, localScaleOffset.z)
 
-            tangent = curveFn.tangent(param)
+        return settings
 
-            # Reference axis (Z) is now aligned with tangent
-            rot = referenceAxis.rotateTo(tangent)
+    # Evaluates a ramp for each instance, so that the kernel does not need to access Maya
+    def getRampChannel(self, dataBlock, rampAttr, normalize, samples, count):
 
-            # If the axis is parallel, but with inverse direction, rotate it PI over the up vector
-            if referenceAxis.isParallel(tangent) and (referenceAxis * tangent < 0):
-                rot = OpenMaya.MQuaternion(math.pi, referenceUp)
+        amplitudeValues = self.getAmplitudeSamples(rampAttr, count)
+        rampValues = instanceAlongCurveLocator.RampValueContainer(self.thisMObject(), dataBlock, rampAttr, normalize, amplitudeValues)
+        bakedRamp = self.getBakedRamp(rampAttr, rampValues.ramp)
+        values = bakedRamp.evaluate(samples.normalizedDistances[:count], rampValues.rampRepeat, rampValues.rampOffset)
 
-            # Rotate local axis to align with tangent
-            rot = localRotation * rot
-            
-            # The curve basis used for twisting        
-            basisForward = forward.rotateBy(rot)
-            basisUp = up.rotateBy(rot)
-            basisRight = right.rotateBy(rot)
+        if rampValues.useDynamicAmplitudeValues:
+            values = [values[i] * self.getRampAmplitudeForInstance(rampValues, i) for i in xrange(count)]
+        else:
+            values = [v * rampValues.rampAmplitude for v in values]
+
+        rampAxis = rampValues.rampAxis
+        return RampChannel(values, rampValues.rampRandomAmplitude, (rampAxis.x, rampAxis.y, rampAxis.z))
+
+    # Evaluates a channel with the given kernel function, reusing the cached values of the last evaluation
+    # when possible. Returns the values and the indices that changed, or None if all of them did.
+    # Hidden instances (visibility is None if all are visible) are skipped, and evaluated once revealed.
+    # Full evaluations are split over the worker pool if one is given
+    def evaluateChannel(self, dataBlock, channelAttr, rampAttr, normalize, evaluateFn, samples, settings, count, changedIndices, timer, rampStage, stage, visibility=None, workerPool=None):
+
+        cachedValues = self.channelValues.get(channelAttr)
+        cachedVisibility = self.channelVisibility.get(channelAttr)
+        self.channelVisibility[channelAttr] = visibility
+
+        if cachedValues is not None and len(cachedValues) == count and changedIndices is not None:
+
+            if visibility is not None or cachedVisibility is not None:
+                currentVisibility = visibility if visibility is not None else [True] * count
+                revealedIndices = getRevealedIndices(currentVisibility, cachedVisibility)
+                changedIndices = [i for i in sorted(set(changedIndices).union(revealedIndices)) if currentVisibility[i]]
+
+            if len(changedIndices) > 0:
+                stageStart = time.time()
+                ramp = self.getRampChannel(dataBlock, rampAttr, normalize, samples, count)
+                timer.add(rampStage, stageStart)
+
+                stageStart = time.time()
+                values = evaluateFn(samples, settings, ramp, count, changedIndices)
+
+                for j in xrange(len(changedIndices)):
+                    cachedValues[changedIndices[j]] = values[j]
+
+                timer.add(stage, stageStart)
+
+            return (cachedValues, changedIndices)
+
+        stageStart = time.time()
+        ramp = self.getRampChannel(dataBlock, rampAttr, normalize, samples, count)
+        timer.add(rampStage, stageStart)
+
+        stageStart = time.time()
+        visibleIndices = None
+
+        if visibility is not None:
+            visibleIndices = [i for i in xrange(count) if visibility[i]]
+
+        values = None
+
+        if workerPool is not None:
+            values = kWorkerPoolManager.evaluate(workerPool, evaluateFn, samples, settings, ramp, count, visibleIndices)
+
+        if values is None:
+            values = evaluateFn(samples, settings, ramp, count, visibleIndices)
+
+        if visibleIndices is not None:
+            values = scatterValues(values, visibleIndices, count, cachedValues)
+
+        timer.add(stage, stageStart)
+
+        self.channelValues[channelAttr] = values
+        return (values, None)
+
+    # Big instance counts are split over the shared worker pool, but only once it is running. Otherwise
+    # the pool is requested and started at the next safe point, and this evaluation stays in Maya's process
+    def getWorkerPool(self, dataBlock, count):
+
+        workerCount = dataBlock.inputValue(instanceAlongCurveLocator.workerCountAttr).asInt()
+        threshold = dataBlock.inputValue(instanceAlongCurveLocator.parallelThresholdAttr).asInt()
+
+        if workerCount == 0:
+            workerCount = multiprocessing.cpu_count()
+
+        if workerCount <= 1 or count < threshold:
+            return None
+
+        return kWorkerPoolManager.getPool(workerCount)
+
+    # Returns the visibility of each instance, or None if all of them are visible
+    def getInstanceVisibility(self, dataBlock, samples, count):
+
+        if not dataBlock.inputValue(instanceAlongCurveLocator.enableVisibilityAttr).asBool():
+            return None
+
+        ramp = OpenMaya.MRampAttribute(OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.visibilityRampAttr))
+        rampValues = self.getBakedRamp(instanceAlongCurveLocator.visibilityRampAttr, ramp).evaluate(samples.normalizedDistances[:count], 1.0, 0.0)
+        visibility = getInstanceVisibility(rampValues, dataBlock.inputValue(instanceAlongCurveLocator.visibilityThresholdAttr).asFloat())
+
+        return None if all(visibility) else visibility
+
+    # Visible instances stay visible if the visibility output has fewer elements than instances
+    def writeVisibility(self, dataBlock, visibility):
+
+        arrayHandle = dataBlock.outputArrayValue(instanceAlongCurveLocator.outputVisibilityAttr)
+
+        for i in xrange(arrayHandle.elementCount()):
+            arrayHandle.jumpToArrayElement(i)
+            arrayHandle.outputValue().setBool(visibility is None or i >= len(visibility) or visibility[i])
+
+        arrayHandle.setAllClean()
+        arrayHandle.setClean()
+
+    # If indices is given, only those elements are written, the rest keep their previous value
+    def writeOutputArray(self, dataBlock, outputAttr, values, indices=None):
+
+        arrayHandle = dataBlock.outputArrayValue(outputAttr.compound)
+
+        # Make sure there are enough handles...
+        elementCount = min(len(values), arrayHandle.elementCount())
+
+        for i in (xrange(elementCount) if indices is None else indices):
+
+            if i >= elementCount:
+                break
+
+            value = values[i]
+            arrayHandle.jumpToArrayElement(i)
+            arrayHandle.outputValue().set3Double(value[0], value[1], value[2])
+
+        arrayHandle.setAllClean()
+        arrayHandle.setClean()
+
+    # Writes the per-point arrays read by the particle instancer. Rotations are in degrees.
+    # The object index picks the prototype from the instancer hierarchy
+    def writeInstancerPoints(self, dataBlock, translations, rotations, scales, prototypeIndices=None, visibility=None):
+
+        arrayDataFn = OpenMaya.MFnArrayAttrsData()
+        arrayDataObj = arrayDataFn.create()
+
+        positionArray = arrayDataFn.vectorArray("position")
+        rotationArray = arrayDataFn.vectorArray("rotation")
+        scaleArray = arrayDataFn.vectorArray("scale")
+        idArray = arrayDataFn.doubleArray("id")
+
+        for i in xrange(len(translations)):
+            rotation = rotations[i]
+            positionArray.append(OpenMaya.MVector(*translations[i]))
+            rotationArray.append(OpenMaya.MVector(math.degrees(rotation[0]), math.degrees(rotation[1]), math.degrees(rotation[2])))
+            scaleArray.append(OpenMaya.MVector(*scales[i]))
+            idArray.append(i)
+
+        if prototypeIndices is not None:
+            objectIndexArray = arrayDataFn.doubleArray("objectIndex")
+
+            for i in xrange(len(translations)):
+                objectIndexArray.append(prototypeIndices[i])
+
+        if visibility is not None:
+            visibilityArray = arrayDataFn.doubleArray("visibility")
+
+            for i in xrange(len(translations)):
+                visibilityArray.append(1.0 if visibility[i] else 0.0)
+
+        outputHandle = dataBlock.outputValue(instanceAlongCurveLocator.outputInstancerPointsAttr)
+        outputHandle.setMObject(arrayDataObj)
+        outputHandle.setClean()
+
+    # Returns the per-instance amplitudes sampled from the shading network connected to the ramp amplitude,
+    # or None if it is not driven by one. Samples are cached by source plug and count, so ramps
+    # sharing the same source sample it once, and nothing is sampled until the source changes
+    def getAmplitudeSamples(self, rampAttr, count):
+
+        amplitudePlug = OpenMaya.MPlug(self.thisMObject(), rampAttr.rampAmplitude)
+
+        if not amplitudePlug.isConnected():
+            return None
+
+        connections = OpenMaya.MPlugArray()
+        amplitudePlug.connectedTo(connections, True, False)
+
+        if connections.length() != 1:
+            return None
+
+        # A single entry per source, replaced when the instance count changes
+        sourcePlug = connections[0]
+        key = sourcePlug.name()
+        cachedSamples = self.amplitudeSamples.get(key)
+
+        if cachedSamples is None or cachedSamples[0] != count:
+            cachedSamples = (count, sampleAmplitudeSource(sourcePlug, count))
+            self.amplitudeSamples[key] = cachedSamples
+
+        return cachedSamples[1]
+
+    # Writes the stage timings (in ms) to the profiling outputs, and keeps them in the history
+    def writeProfile(self, dataBlock, timer):
 
-            rampAmplitude = self.getRampAmplitudeForInstance(rampValues, i)
+        stages = sorted(timer.times)
+        stageArray = OpenMaya.MStringArray()
+        timeArray = OpenMaya.MDoubleArray()
+        callArray = OpenMaya.MIntArray()
 
-            twistNormal = self.getRandomizedValue(random, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.x                
-            twistNormal = OpenMaya.MQuaternion(math.radians(twistNormal), basisRight) #X
+        for stage in stages:
+            stageArray.append(stage)
+            timeArray.append(timer.times[stage] * 1000.0)
+            callArray.append(timer.calls[stage])
 
-            twistTangent = self.getRandomizedValue(random, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.y
-            twistTangent = OpenMaya.MQuaternion(math.radians(twistTangent), basisUp) #Y
+        outputHandle = dataBlock.outputValue(instanceAlongCurveLocator.profileStagesAttr)
+        outputHandle.setMObject(OpenMaya.MFnStringArrayData().create(stageArray))
+        outputHandle.setClean()
 
-            twistBitangent = self.getRandomizedValue(random, rampValues.rampRandomAmplitude, rampValue * rampAmplitude) * rampValues.rampAxis.z
-            twistBitangent = OpenMaya.MQuaternion(math.radians(twistBitangent), basisForward) #Z
+        outputHandle = dataBlock.outputValue(instanceAlongCurveLocator.profileTimesAttr)
+        outputHandle.setMObject(OpenMaya.MFnDoubleArrayData().create(timeArray))
+        outputHandle.setClean()
 
-            # Modify resulting rotation based on mode
-            if rotMode == 0:                    # Identity
-                rot = OpenMaya.MQuaternion()
-            elif rotMode == 1:                  # Input rotation
-                rot = inputTransformRotation;
-            elif rotMode == 3 and i % 2 == 1:   # Chain mode
-                rot *= OpenMaya.MQuaternion(math.pi * .5, tangent)
+        outputHandle = dataBlock.outputValue(instanceAlongCurveLocator.profileCallsAttr)
+        outputHandle.setMObject(OpenMaya.MFnIntArrayData().create(callArray))
+        outputHandle.setClean()
 
-            # Get the angle from handles, and rotate over tangent axis
-            if enableManipulators:
-                angle = self.getRotationForParam(param, axisHandlesSorted, curveForm, maxParam)
-                rot = rot * OpenMaya.MQuaternion(-angle, tangent)
+        self.profileHistory.append({"time": time.time(), "stages": timer.asDict()})
 
-            rot = ((rot * twistNormal * twistTangent * twistBitangent) * globalRotationOffset).asEulerRotation().asVector()
+    def getRampAmplitudeForInstance(self, rampValues, instanceIndex):
+
+        if rampValues.useDynamicAmplitudeValues:
+
+            if len(rampValues.rampAmplitudeValues) > instanceIndex:
+                return rampValues.rampAmplitudeValues[instanceIndex]
+
+        return rampValues.rampAmplitude
+
+    # Returns the cached ramp samples, baking them if the ramp entries changed
+    def getBakedRamp(self, rampAttr, ramp):
+
+        if rampAttr not in self.bakedRamps:
+
+            util = OpenMaya.MScriptUtil()
+            util.createFromDouble(0.0)
+            valuePtr = util.asFloatPtr()
+            values = []
 
-            rotationArrayHandle.jumpToArrayElement(i)
-            rotationHandle = rotationArrayHandle.outputValue()
-            rotationHandle.set3Double(rot.x, rot.y, rot.z)
+            for i in xrange(BakedRamp.kResolution + 1):
+                ramp.getValueAtPosition(i / float(BakedRamp.kResolution), valuePtr)
+                values.append(util.getFloat(valuePtr))
 
-        rotationArrayHandle.setAllClean()
-        rotationArrayHandle.setClean()
+            self.bakedRamps[rampAttr] = BakedRamp(values)
+
+        return self.bakedRamps[rampAttr]
 
     def isBounded(self):
         return True
 
+    # Bounds of all instances, computed from the cached outputs only after they change
     def boundingBox(self):
-        return OpenMaya.MBoundingBox(OpenMaya.MPoint(-1,-1,-1), OpenMaya.MPoint(1,1,1))
+
+        if self.boundingBoxCache is None:
+            self.boundingBoxCache = self.computeBoundingBox()
+
+        return OpenMaya.MBoundingBox(self.boundingBoxCache)
+
+    def computeBoundingBox(self):
+
+        # The locator itself is always included
+        boundingBox = OpenMaya.MBoundingBox(OpenMaya.MPoint(-1,-1,-1), OpenMaya.MPoint(1,1,1))
+        translations = self.channelValues.get(instanceAlongCurveLocator.outputTranslationAttr)
+
+        if not translations:
+            return boundingBox
+
+        # Instances are transformed around the source pivot, so the farthest corner from it defines their radius.
+        # Any instance may use any prototype, so the biggest one is used
+        radius = 0.0
+        includeSourceBounds = OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.includeSourceBoundsAttr).asBool()
+
+        if includeSourceBounds:
+            for prototypeFn in self.getPrototypeTransformFns():
+                sourceBounds = prototypeFn.boundingBox()
+                sourceMin = sourceBounds.min()
+                sourceMax = sourceBounds.max()
+                radius = max(radius, getBoundsRadius((sourceMin.x, sourceMin.y, sourceMin.z), (sourceMax.x, sourceMax.y, sourceMax.z), self.instancePivot))
+
+        scales = self.channelValues.get(instanceAlongCurveLocator.outputScaleAttr)
+        visibility = self.channelVisibility.get(instanceAlongCurveLocator.outputTranslationAttr)
+
+        # Hidden instances do not have valid values
+        if visibility is not None and len(visibility) == len(translations):
+            translations = [translations[i] for i in xrange(len(translations)) if visibility[i]]
+            scales = [scales[i] for i in xrange(len(scales)) if visibility[i]] if scales is not None and len(scales) == len(visibility) else None
+
+            if not translations:
+                return boundingBox
+
+        boundsMin, boundsMax = getInstanceBounds(translations, scales, self.instancePivot, radius)
+
+        boundingBox.expand(OpenMaya.MPoint(*boundsMin))
+        boundingBox.expand(OpenMaya.MPoint(*boundsMax))
+        return boundingBox
+
+    # Returns the mapped cache file, or None if it can't be read. Failures are kept until the path changes,
+    # so that a missing file is only reported once
+    def getInstanceCache(self, path):
+
+        if self.instanceCache is None:
+            self.instanceCache = False
+
+            if path:
+                try:
+                    self.instanceCache = InstanceCache(path)
+                except (EnvironmentError, ValueError, struct.error) as e:
+                    sys.stderr.write('Failed trying to read instance cache ' + path + ': ' + str(e) + '\n')
+
+        return self.instanceCache or None
+
+    def closeInstanceCache(self):
+
+        if self.instanceCache:
+            self.instanceCache.close()
+
+        self.instanceCache = None
+
+    # Writes the cached frame at the cache time to the outputs, without evaluating the curve
+    def computeFromCache(self, plug, dataBlock, instanceCache):
+
+        animationMode = dataBlock.inputValue(instanceAlongCurveLocator.evaluationModeAttr).asShort() == 1
+        frame = dataBlock.inputValue(instanceAlongCurveLocator.cacheTimeAttr).asTime().asUnits(OpenMaya.MTime.uiUnit())
+        translations, rotations, scales = instanceCache.getFrame(frame)
+
+        # Values are kept for the bounding box, and discarded when the cache is disabled
+        self.channelValues = {instanceAlongCurveLocator.outputTranslationAttr: translations,
+                              instanceAlongCurveLocator.outputRotationAttr: rotations,
+                              instanceAlongCurveLocator.outputScaleAttr: scales}
+        self.channelVisibility = {}
+        self.boundingBoxCache = None
+
+        if plug != instanceAlongCurveLocator.outputInstancerPointsAttr or not animationMode:
+
+            # Instances missing on this frame are hidden with a zero scale
+            padding = [(0.0, 0.0, 0.0)] * max(instanceCache.maxInstanceCount - len(translations), 0)
+
+            self.writeOutputArray(dataBlock, instanceAlongCurveLocator.outputTranslationAttr, translations + padding)
+            self.writeOutputArray(dataBlock, instanceAlongCurveLocator.outputRotationAttr, rotations + padding)
+            self.writeOutputArray(dataBlock, instanceAlongCurveLocator.outputScaleAttr, scales + padding)
+
+            # Hidden instances are baked with a zero scale
+            self.writeVisibility(dataBlock, None)
+
+        if plug == instanceAlongCurveLocator.outputInstancerPointsAttr or animationMode:
+
+            # Prototypes are evaluated from the curves, so they are only used if they match the cached frame
+            prototypeData = OpenMaya.MFnIntArrayData(dataBlock.inputValue(instanceAlongCurveLocator.outputPrototypeAttr).data()).array()
+            prototypeIndices = [prototypeData[i] for i in xrange(prototypeData.length())] if prototypeData.length() == len(translations) else None
+
+            self.writeInstancerPoints(dataBlock, translations, rotations, scales, prototypeIndices)
 
     def compute(self, plug, dataBlock):
         try:
-            curveDataHandle = dataBlock.inputValue(instanceAlongCurveLocator.inputCurveAttr)
-            curve = curveDataHandle.asNurbsCurveTransformed()
+            isOutputPlug = (plug == instanceAlongCurveLocator.outputTranslationAttr.compound)
+            isOutputPlug = isOutputPlug or (plug == instanceAlongCurveLocator.outputRotationAttr.compound)
+            isOutputPlug = isOutputPlug or (plug == instanceAlongCurveLocator.outputScaleAttr.compound)
+            isOutputPlug = isOutputPlug or (plug == instanceAlongCurveLocator.outputInstancerPointsAttr)
+            isOutputPlug = isOutputPlug or (plug == instanceAlongCurveLocator.outputVisibilityAttr)
 
-            updateTranslation = (plug == instanceAlongCurveLocator.outputTranslationAttr.compound)
-            updateRotation = (plug == instanceAlongCurveLocator.outputRotationAttr.compound)
-            updateScale = (plug == instanceAlongCurveLocator.outputScaleAttr.compound)
+            # Baked frames replace the evaluation. If the cache can't be read, the curve is evaluated as usual
+            instanceCache = None
+
+            if dataBlock.inputValue(instanceAlongCurveLocator.useCacheAttr).asBool():
+                instanceCache = self.getInstanceCache(dataBlock.inputValue(instanceAlongCurveLocator.cacheFileAttr).asString())
+
+            if isOutputPlug and instanceCache is not None:
+                self.computeFromCache(plug, dataBlock, instanceCache)
+                return
+
+            # Prototypes are not baked, so they are always evaluated from the curves
+            isPrototypePlug = (plug == instanceAlongCurveLocator.outputPrototypeAttr)
 
-            if not curve.isNull():
+            # All curves are evaluated at once, joining their instances in order
+            inputCurves = self.getInputCurves(dataBlock) if isOutputPlug or isPrototypePlug else []
 
-                if updateTranslation or updateRotation or updateScale:
-                    curveFn = OpenMaya.MFnNurbsCurve(curve)
+            if isPrototypePlug and not inputCurves:
+                self.writePrototypes(dataBlock, [])
 
-                    instanceCount = self.getInstanceCountByMode()
-                    distOffset = dataBlock.inputValue(instanceAlongCurveLocator.distOffsetAttr).asFloat()
-                    curveLength = curveFn.length()
+            if inputCurves:
 
-                    # Curve thresholds
-                    curveStart = dataBlock.inputValue(instanceAlongCurveLocator.curveStartAttr).asFloat() * curveLength
-                    curveEnd = dataBlock.inputValue(instanceAlongCurveLocator.curveEndAttr).asFloat() * curveLength
+                # Only outputs used by the current mode are updated implicitly. While playing a cache, those come from the cache
+                animationMode = dataBlock.inputValue(instanceAlongCurveLocator.evaluationModeAttr).asShort() == 1
+                modelingOutputs = not animationMode and instanceCache is None
+                animationOutputs = animationMode and instanceCache is None
 
-                    effectiveCurveLength = min(max(curveEnd - curveStart, 0.001), curveLength)
-                    lengthIncrement = self.getIncrementByMode(instanceCount, effectiveCurveLength)
+                # All dirty outputs are updated at once, so that the curve is only sampled once per evaluation
+                updateTranslation = (plug == instanceAlongCurveLocator.outputTranslationAttr.compound) or (modelingOutputs and not dataBlock.isClean(instanceAlongCurveLocator.outputTranslationAttr.compound))
+                updateRotation = (plug == instanceAlongCurveLocator.outputRotationAttr.compound) or (modelingOutputs and not dataBlock.isClean(instanceAlongCurveLocator.outputRotationAttr.compound))
+                updateScale = (plug == instanceAlongCurveLocator.outputScaleAttr.compound) or (modelingOutputs and not dataBlock.isClean(instanceAlongCurveLocator.outputScaleAttr.compound))
+                updateVisibility = (plug == instanceAlongCurveLocator.outputVisibilityAttr) or (modelingOutputs and not dataBlock.isClean(instanceAlongCurveLocator.outputVisibilityAttr))
+                updateInstancer = (plug == instanceAlongCurveLocator.outputInstancerPointsAttr) or (animationOutputs and not dataBlock.isClean(instanceAlongCurveLocator.outputInstancerPointsAttr))
+                updatePrototypes = isPrototypePlug or not dataBlock.isClean(instanceAlongCurveLocator.outputPrototypeAttr)
 
-                    # Common data
-                    inputTransformPlug = self.getInputTransformPlug()
-                    inputTransformFn = self.getInputTransformFn()
-                    
-                    # Force update of transformation 
-                    if OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputTransformAttr).isConnected():
-                        dataBlock.inputValue(inputTransformPlug).asMatrix()
+                # When profiling is off, the null timer ignores every stage
+                timer = StageTimer() if dataBlock.inputValue(instanceAlongCurveLocator.enableProfilingAttr).asBool() else kNullStageTimer
+                evaluationStart = time.time()
+
+                stageStart = time.time()
+                arcLengthTables = [self.getArcLengthTable(inputCurve, dataBlock) for inputCurve in inputCurves]
+                timer.add("arcLength", stageStart)
+
+                stageStart = time.time()
+                counts = [self.getCurveInstanceCount(arcLengthTables[i].curveLength, inputCurves[i].instanceCount, inputCurves[i].instanceLength) for i in xrange(len(inputCurves))]
+                instanceCount = sum(counts)
+
+                # In distance mode the count follows the curve length, so instances may be missing. They are
+                # reconciled once the curve stops changing, and only if the integer count is different
+                if not animationMode and self.reconciledInstanceCount is not None and instanceCount != self.reconciledInstanceCount:
+                    kInstanceUpdateScheduler.schedule(self)
+
+                timer.add("instanceCount", stageStart)
+
+                # Common data
+                inputTransformPlug = self.getInputTransformPlug()
+                inputTransformFn = self.getInputTransformFn()
+
+                # Force update of transformation
+                if OpenMaya.MPlug(self.thisMObject(), instanceAlongCurveLocator.inputTransformAttr).isConnected():
+                    dataBlock.inputValue(inputTransformPlug).asMatrix()
+
+                stageStart = time.time()
+                settings = self.getTransformSettings(dataBlock, inputTransformPlug, inputTransformFn)
+                timer.add("settings", stageStart)
+
+                # Scales do not depend on manipulator angles, so they only change if the curve is sampled again
+                stageStart = time.time()
+                samples, changedIndices, resampledIndices = self.getInstanceSamples(dataBlock, inputCurves, counts, settings.orientationMode)
+                timer.add("sampling", stageStart)
+
+                # Prototypes only change instances in modeling mode, which are replaced once the changes settle.
+                # Count changes are already reconciled, so only the instances in both lists are compared
+                stageStart = time.time()
+                prototypeIndices = self.getInstancePrototypes(dataBlock, samples, instanceCount, resampledIndices)
+                reconciledPrototypeIndices = self.reconciledPrototypeIndices
+
+                if not animationMode and reconciledPrototypeIndices is not None and prototypeIndices[:len(reconciledPrototypeIndices)] != reconciledPrototypeIndices[:instanceCount]:
+                    kInstanceUpdateScheduler.schedule(self)
 
-                    # Manipulator data
-                    curveAxisHandleArray = dataBlock.inputArrayValue(instanceAlongCurveLocator.curveAxisHandleAttr.compound)
-                    axisHandlesSorted = getSortedCurveAxisArray(self.thisMObject(), curveAxisHandleArray, instanceCount)
+                timer.add("prototypes", stageStart)
 
-                    if updateTranslation:
-                        self.updateInstancePositions(curveFn, dataBlock, instanceCount, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement, inputTransformPlug, inputTransformFn, axisHandlesSorted)
+                stageStart = time.time()
+                visibility = self.getInstanceVisibility(dataBlock, samples, instanceCount)
+                timer.add("visibility", stageStart)
 
-                    if updateRotation:
-                        self.updateInstanceRotations(curveFn, dataBlock, instanceCount, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement, inputTransformPlug, inputTransformFn, axisHandlesSorted)
+                # The math itself is done by the kernel; here we just marshal data in and out.
+                # Only the instances affected by the last changes are evaluated and written again
+                translations = None
+                rotations = None
+                scales = None
+                workerPool = self.getWorkerPool(dataBlock, instanceCount)
 
-                    if updateScale:
-                        self.updateInstanceScale(curveFn, dataBlock, instanceCount, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement)
+                if updateTranslation or updateInstancer:
+                    translations, translationIndices = self.evaluateChannel(dataBlock, instanceAlongCurveLocator.outputTranslationAttr, instanceAlongCurveLocator.positionRampAttr, False,
+                                                                            evaluateTranslations, samples, settings, instanceCount, changedIndices, timer, "positionRamp", "translation", visibility, workerPool)
+
+                if updateRotation or updateInstancer:
+                    rotations, rotationIndices = self.evaluateChannel(dataBlock, instanceAlongCurveLocator.outputRotationAttr, instanceAlongCurveLocator.rotationRampAttr, True,
+                                                                      evaluateRotations, samples, settings, instanceCount, changedIndices, timer, "rotationRamp", "rotation", visibility, workerPool)
+
+                if updateScale or updateInstancer:
+                    scales, scaleIndices = self.evaluateChannel(dataBlock, instanceAlongCurveLocator.outputScaleAttr, instanceAlongCurveLocator.scaleRampAttr, False,
+                                                                evaluateScales, samples, settings, instanceCount, resampledIndices, timer, "scaleRamp", "scale", visibility, workerPool)
+
+                # The bounding box is computed again the next time Maya asks for it
+                if translations is not None or scales is not None:
+                    self.boundingBoxCache = None
+                    self.instancePivot = settings.rotatePivot
+
+                stageStart = time.time()
+
+                if updateTranslation:
+                    self.writeOutputArray(dataBlock, instanceAlongCurveLocator.outputTranslationAttr, translations, translationIndices)
+
+                if updateRotation:
+                    self.writeOutputArray(dataBlock, instanceAlongCurveLocator.outputRotationAttr, rotations, rotationIndices)
+
+                if updateScale:
+                    self.writeOutputArray(dataBlock, instanceAlongCurveLocator.outputScaleAttr, scales, scaleIndices)
+
+                if updateVisibility:
+                    self.writeVisibility(dataBlock, visibility)
+
+                if updateInstancer:
+                    self.writeInstancerPoints(dataBlock, translations, rotations, scales, prototypeIndices, visibility)
+
+                if updatePrototypes:
+                    self.writePrototypes(dataBlock, prototypeIndices)
+
+                timer.add("output", stageStart)
+
+                if timer is not kNullStageTimer:
+                    timer.add("total", evaluationStart)
+                    self.writeProfile(dataBlock, timer)
 
         except:
             sys.stderr.write('Failed trying to compute locator. stack trace: \n')
@@ -839,6 +1763,73 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
     def nodeCreator():
         return OpenMayaMPx.asMPxPtr( instanceAlongCurveLocator() )
 
+    @classmethod
+    def addCurveArrayAttribute(cls, curveArrayAttr, attributeName):
+
+        # Schematic view of compound attribute:
+        # inputCurves[]
+        #   inputCurvesCurve
+        #   inputCurvesInstanceCount
+        #   inputCurvesInstanceLength
+
+        nAttr = OpenMaya.MFnNumericAttribute()
+        typedAttr = OpenMaya.MFnTypedAttribute()
+        cmpAttr = OpenMaya.MFnCompoundAttribute()
+
+        curveArrayAttr.curve = typedAttr.create(attributeName + "Curve", attributeName + "Curve", OpenMaya.MFnData.kNurbsCurve)
+        cls.addAttribute(curveArrayAttr.curve)
+
+        curveArrayAttr.instanceCount = nAttr.create(attributeName + "InstanceCount", attributeName + "InstanceCount", OpenMaya.MFnNumericData.kInt, 5)
+        nAttr.setMin(0)
+        nAttr.setSoftMax(100)
+        cls.addAttribute(curveArrayAttr.instanceCount)
+
+        curveArrayAttr.instanceLength = nAttr.create(attributeName + "InstanceLength", attributeName + "InstanceLength", OpenMaya.MFnNumericData.kFloat, 1.0)
+        nAttr.setMin(0.01)
+        nAttr.setSoftMax(1.0)
+        cls.addAttribute(curveArrayAttr.instanceLength)
+
+        # Build compound array attribute
+        curveArrayAttr.compound = cmpAttr.create(attributeName, attributeName)
+        cmpAttr.addChild(curveArrayAttr.curve)
+        cmpAttr.addChild(curveArrayAttr.instanceCount)
+        cmpAttr.addChild(curveArrayAttr.instanceLength)
+        cmpAttr.setArray( True )
+        cmpAttr.setUsesArrayDataBuilder( True )
+        cmpAttr.setDisconnectBehavior(OpenMaya.MFnAttribute.kDelete)
+
+        cls.addAttribute(curveArrayAttr.compound)
+
+    @classmethod
+    def addPrototypeArrayAttribute(cls, prototypeArrayAttr, attributeName):
+
+        # Schematic view of compound attribute:
+        # inputPrototypes[]
+        #   inputPrototypesMatrix
+        #   inputPrototypesWeight
+
+        nAttr = OpenMaya.MFnNumericAttribute()
+        matrixAttrFn = OpenMaya.MFnMatrixAttribute()
+        cmpAttr = OpenMaya.MFnCompoundAttribute()
+
+        prototypeArrayAttr.matrix = matrixAttrFn.create(attributeName + "Matrix", attributeName + "Matrix", OpenMaya.MFnMatrixAttribute.kFloat)
+        cls.addAttribute(prototypeArrayAttr.matrix)
+
+        prototypeArrayAttr.weight = nAttr.create(attributeName + "Weight", attributeName + "Weight", OpenMaya.MFnNumericData.kFloat, 1.0)
+        nAttr.setMin(0.0)
+        nAttr.setSoftMax(10.0)
+        cls.addAttribute(prototypeArrayAttr.weight)
+
+        # Build compound array attribute
+        prototypeArrayAttr.compound = cmpAttr.create(attributeName, attributeName)
+        cmpAttr.addChild(prototypeArrayAttr.matrix)
+        cmpAttr.addChild(prototypeArrayAttr.weight)
+        cmpAttr.setArray( True )
+        cmpAttr.setUsesArrayDataBuilder( True )
+        cmpAttr.setDisconnectBehavior(OpenMaya.MFnAttribute.kDelete)
+
+        cls.addAttribute(prototypeArrayAttr.compound)
+
     @classmethod
     def addCompoundVector3Attribute(cls, compoundAttribute, attributeName, unitType, arrayAttr, inputAttr, defaultValue):
 
@@ -957,9 +1948,23 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         node.inputShadingGroupAttr = msgAttributeFn.create("inputShadingGroup", "iSG")    
         node.addAttribute( node.inputShadingGroupAttr )
 
+        node.addPrototypeArrayAttribute(node.inputPrototypesAttr, "inputPrototypes")
+
+        # Weight of the input transform, relative to the weights of inputPrototypes
+        node.prototypeWeightAttr = nAttr.create("prototypeWeight", "ptw", OpenMaya.MFnNumericData.kFloat, 1.0)
+        nAttr.setMin(0.0)
+        nAttr.setSoftMax(10.0)
+        node.addAttribute( node.prototypeWeightAttr )
+
+        # Prototype ramp values are split in ranges proportional to the weights
+        node.prototypeRampAttr = OpenMaya.MRampAttribute.createCurveRamp("prototypeRamp", "prototypeRamp")
+        node.addAttribute( node.prototypeRampAttr )
+
         # Input curve transform
         node.inputCurveAttr = curveAttributeFn.create( 'inputCurve', 'curve', OpenMaya.MFnData.kNurbsCurve)
         node.addAttribute( node.inputCurveAttr )
+
+        node.addCurveArrayAttribute(node.inputCurvesAttr, "inputCurves")
         
         # Input instance count    
         node.instanceCountAttr = nAttr.create("instanceCount", "iic", OpenMaya.MFnNumericData.kInt, 5)
@@ -969,6 +1974,10 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         nAttr.setConnectable( False )
         node.addAttribute( node.instanceCountAttr)
 
+        node.randomSeedAttr = nAttr.create("randomSeed", "rsd", OpenMaya.MFnNumericData.kInt, 0)
+        nAttr.setMin(0)
+        node.addAttribute( node.randomSeedAttr)
+
         node.addCompoundVector3Attribute(node.inputLocalRotationOffsetAttr, "inputLocalRotationOffset", OpenMaya.MFnUnitAttribute.kDistance, False, True, OpenMaya.MVector(0.0, 0.0, 0.0))
         node.addCompoundVector3Attribute(node.inputGlobalRotationOffsetAttr, "inputGlobalRotationOffset", OpenMaya.MFnUnitAttribute.kDistance, False, True, OpenMaya.MVector(0.0, 0.0, 0.0))
 
@@ -995,6 +2004,74 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         nAttr.setKeyable( True )
         node.addAttribute( node.curveEndAttr)
 
+        node.enableDensityAttr = nAttr.create("enableDensity", "eden", OpenMaya.MFnNumericData.kBoolean, False)
+        nAttr.setChannelBox( False )
+        node.addAttribute( node.enableDensityAttr)
+
+        # Relative amount of instances over the normalized arc length
+        node.densityRampAttr = OpenMaya.MRampAttribute.createCurveRamp("densityRamp", "densityRamp")
+        node.addAttribute( node.densityRampAttr )
+
+        node.enableVisibilityAttr = nAttr.create("enableVisibility", "evis", OpenMaya.MFnNumericData.kBoolean, False)
+        nAttr.setChannelBox( False )
+        node.addAttribute( node.enableVisibilityAttr)
+
+        # Visibility over the normalized arc length, instances below the threshold are hidden
+        node.visibilityRampAttr = OpenMaya.MRampAttribute.createCurveRamp("visibilityRamp", "visibilityRamp")
+        node.addAttribute( node.visibilityRampAttr )
+
+        node.visibilityThresholdAttr = nAttr.create("visibilityThreshold", "vth", OpenMaya.MFnNumericData.kFloat, 0.5)
+        nAttr.setMin(0.0)
+        nAttr.setSoftMax(1.0)
+        nAttr.setKeyable( True )
+        node.addAttribute( node.visibilityThresholdAttr)
+
+        node.arcLengthToleranceAttr = nAttr.create("arcLengthTolerance", "alTol", OpenMaya.MFnNumericData.kFloat, 0.001)
+        nAttr.setMin(0.000001)
+        nAttr.setSoftMax(0.01)
+        nAttr.setChannelBox( False )
+        nAttr.setConnectable( False )
+        node.addAttribute( node.arcLengthToleranceAttr)
+
+        node.frameTableResolutionAttr = nAttr.create("frameTableResolution", "ftr", OpenMaya.MFnNumericData.kInt, 256)
+        nAttr.setMin(1)
+        nAttr.setSoftMax(4096)
+        nAttr.setChannelBox( False )
+        nAttr.setConnectable( False )
+        node.addAttribute( node.frameTableResolutionAttr)
+
+        node.includeSourceBoundsAttr = nAttr.create("includeSourceBounds", "isb", OpenMaya.MFnNumericData.kBoolean, True)
+        nAttr.setChannelBox( False )
+        nAttr.setConnectable( False )
+        node.addAttribute( node.includeSourceBoundsAttr)
+
+        # Results do not depend on the amount of workers, so these do not affect any output
+        node.workerCountAttr = nAttr.create("workerCount", "wkc", OpenMaya.MFnNumericData.kInt, 1)
+        nAttr.setMin(0)
+        nAttr.setSoftMax(32)
+        nAttr.setChannelBox( False )
+        nAttr.setConnectable( False )
+        node.addAttribute( node.workerCountAttr)
+
+        node.parallelThresholdAttr = nAttr.create("parallelThreshold", "pth", OpenMaya.MFnNumericData.kInt, 5000)
+        nAttr.setMin(1)
+        nAttr.setChannelBox( False )
+        nAttr.setConnectable( False )
+        node.addAttribute( node.parallelThresholdAttr)
+
+        node.useCacheAttr = nAttr.create("useCache", "uch", OpenMaya.MFnNumericData.kBoolean, False)
+        nAttr.setChannelBox( False )
+        node.addAttribute( node.useCacheAttr)
+
+        node.cacheFileAttr = curveAttributeFn.create("cacheFile", "cfl", OpenMaya.MFnData.kString)
+        curveAttributeFn.setUsedAsFilename( True )
+        node.addAttribute( node.cacheFileAttr)
+
+        # Usually connected to time1.outTime by the bake command
+        unitAttr = OpenMaya.MFnUnitAttribute()
+        node.cacheTimeAttr = unitAttr.create("cacheTime", "ctm", OpenMaya.MFnUnitAttribute.kTime, 0.0)
+        node.addAttribute( node.cacheTimeAttr)
+
         ## Max instances when defined by instance length
         node.maxInstancesByLengthAttr = nAttr.create("maxInstancesByLength", "mibl", OpenMaya.MFnNumericData.kInt, 50)
         nAttr.setMin(0)
@@ -1025,12 +2102,26 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         enumFn.addField( "Distance", 1 );
         node.addAttribute( node.instancingModeAttr )
 
+        # Enum for selection of evaluation mode
+        node.evaluationModeAttr = enumFn.create('evaluationMode', 'evaluationMode')
+        enumFn.addField( "Modeling", 0 );
+        enumFn.addField( "Animation", 1 );
+        node.addAttribute( node.evaluationModeAttr )
+
+        # Enum for selection of the prototype of each instance
+        node.prototypeSelectionModeAttr = enumFn.create('prototypeSelectionMode', 'prototypeSelectionMode')
+        enumFn.addField( "Weighted Random", 0 );
+        enumFn.addField( "Sequential", 1 );
+        enumFn.addField( "Ramp", 2 );
+        node.addAttribute( node.prototypeSelectionModeAttr )
+
          # Enum for selection of orientation mode
         node.orientationModeAttr = enumFn.create('orientationMode', 'orientationMode')
         enumFn.addField( "Identity", 0 );
         enumFn.addField( "Copy from Source", 1 );
         enumFn.addField( "Use Curve", 2 );
         enumFn.addField( "Chain", 3 );
+        enumFn.addField( "Parallel Transport", 4 );
         enumFn.setDefault("Use Curve")
         node.addAttribute( node.orientationModeAttr )
 
@@ -1058,6 +2149,43 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
         node.addCompoundVector3Attribute(node.outputRotationAttr, "outputRotation", OpenMaya.MFnUnitAttribute.kAngle, True, False, OpenMaya.MVector(0.0, 0.0, 0.0))
         node.addCompoundVector3Attribute(node.outputScaleAttr, "outputScale", OpenMaya.MFnUnitAttribute.kDistance, True, False, OpenMaya.MVector(1.0, 1.0, 1.0))
 
+        node.outputInstancerPointsAttr = curveAttributeFn.create("outputInstancerPoints", "oip", OpenMaya.MFnData.kDynArrayAttrs)
+        curveAttributeFn.setWritable( False )
+        curveAttributeFn.setStorable( False )
+        node.addAttribute( node.outputInstancerPointsAttr )
+
+        node.outputPrototypeAttr = curveAttributeFn.create("outputPrototype", "opt", OpenMaya.MFnData.kIntArray)
+        curveAttributeFn.setWritable( False )
+        curveAttributeFn.setStorable( False )
+        node.addAttribute( node.outputPrototypeAttr )
+
+        node.outputVisibilityAttr = nAttr.create("outputVisibility", "ovis", OpenMaya.MFnNumericData.kBoolean, True)
+        nAttr.setWritable( False )
+        nAttr.setStorable( False )
+        nAttr.setArray( True )
+        nAttr.setUsesArrayDataBuilder( True )
+        nAttr.setDisconnectBehavior(OpenMaya.MFnAttribute.kDelete)
+        node.addAttribute( node.outputVisibilityAttr )
+
+        # Profiling does not affect any output, results are written on each evaluation
+        node.enableProfilingAttr = nAttr.create("enableProfiling", "epf", OpenMaya.MFnNumericData.kBoolean, False)
+        node.addAttribute( node.enableProfilingAttr )
+
+        node.profileStagesAttr = curveAttributeFn.create("profileStages", "pfs", OpenMaya.MFnData.kStringArray)
+        curveAttributeFn.setWritable( False )
+        curveAttributeFn.setStorable( False )
+        node.addAttribute( node.profileStagesAttr )
+
+        node.profileTimesAttr = curveAttributeFn.create("profileTimes", "pft", OpenMaya.MFnData.kDoubleArray)
+        curveAttributeFn.setWritable( False )
+        curveAttributeFn.setStorable( False )
+        node.addAttribute( node.profileTimesAttr )
+
+        node.profileCallsAttr = curveAttributeFn.create("profileCalls", "pfc", OpenMaya.MFnData.kIntArray)
+        curveAttributeFn.setWritable( False )
+        curveAttributeFn.setStorable( False )
+        node.addAttribute( node.profileCallsAttr )
+
         ## Input instance count    
         node.enableManipulatorsAttr = nAttr.create("enableManipulators", "enableManipulators", OpenMaya.MFnNumericData.kBoolean)
         node.addAttribute( node.enableManipulatorsAttr)
@@ -1086,7 +2214,11 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
 
         # Translation affects
         node.attributeAffects( node.inputCurveAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.inputCurvesAttr.compound, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.arcLengthToleranceAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.frameTableResolutionAttr, node.outputTranslationAttr.compound )
         node.attributeAffects( node.instanceCountAttr, node.outputTranslationAttr.compound)
+        node.attributeAffects( node.randomSeedAttr, node.outputTranslationAttr.compound)
         node.attributeAffects( node.instanceLengthAttr, node.outputTranslationAttr.compound)
         node.attributeAffects( node.instancingModeAttr, node.outputTranslationAttr.compound)
         node.attributeAffects( node.maxInstancesByLengthAttr, node.outputTranslationAttr.compound)
@@ -1103,12 +2235,21 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
 
         node.attributeAffects( node.curveStartAttr, node.outputTranslationAttr.compound )
         node.attributeAffects( node.curveEndAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.enableDensityAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.densityRampAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.enableVisibilityAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.visibilityRampAttr, node.outputTranslationAttr.compound )
+        node.attributeAffects( node.visibilityThresholdAttr, node.outputTranslationAttr.compound )
 
         rampAttributeAffects(node.positionRampAttr, node.outputTranslationAttr.compound)
 
         # Rotation affects
         node.attributeAffects( node.inputCurveAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.inputCurvesAttr.compound, node.outputRotationAttr.compound )
+        node.attributeAffects( node.arcLengthToleranceAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.frameTableResolutionAttr, node.outputRotationAttr.compound )
         node.attributeAffects( node.instanceCountAttr, node.outputRotationAttr.compound)
+        node.attributeAffects( node.randomSeedAttr, node.outputRotationAttr.compound)
         node.attributeAffects( node.instanceLengthAttr, node.outputRotationAttr.compound)
         node.attributeAffects( node.instancingModeAttr, node.outputRotationAttr.compound)
         node.attributeAffects( node.maxInstancesByLengthAttr, node.outputRotationAttr.compound)
@@ -1128,10 +2269,18 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
 
         node.attributeAffects( node.curveStartAttr, node.outputRotationAttr.compound )
         node.attributeAffects( node.curveEndAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.enableDensityAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.densityRampAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.enableVisibilityAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.visibilityRampAttr, node.outputRotationAttr.compound )
+        node.attributeAffects( node.visibilityThresholdAttr, node.outputRotationAttr.compound )
 
         # Scale affects
         node.attributeAffects( node.inputCurveAttr, node.outputScaleAttr.compound )
+        node.attributeAffects( node.inputCurvesAttr.compound, node.outputScaleAttr.compound )
+        node.attributeAffects( node.arcLengthToleranceAttr, node.outputScaleAttr.compound )
         node.attributeAffects( node.instanceCountAttr, node.outputScaleAttr.compound)
+        node.attributeAffects( node.randomSeedAttr, node.outputScaleAttr.compound)
         node.attributeAffects( node.instanceLengthAttr, node.outputScaleAttr.compound)
         node.attributeAffects( node.instancingModeAttr, node.outputScaleAttr.compound)
         node.attributeAffects( node.maxInstancesByLengthAttr, node.outputScaleAttr.compound)
@@ -1147,9 +2296,64 @@ class instanceAlongCurveLocator(OpenMayaMPx.MPxLocatorNode):
 
         node.attributeAffects( node.curveStartAttr, node.outputScaleAttr.compound )
         node.attributeAffects( node.curveEndAttr, node.outputScaleAttr.compound )
+        node.attributeAffects( node.enableDensityAttr, node.outputScaleAttr.compound )
+        node.attributeAffects( node.densityRampAttr, node.outputScaleAttr.compound )
+        node.attributeAffects( node.enableVisibilityAttr, node.outputScaleAttr.compound )
+        node.attributeAffects( node.visibilityRampAttr, node.outputScaleAttr.compound )
+        node.attributeAffects( node.visibilityThresholdAttr, node.outputScaleAttr.compound )
 
         node.attributeAffects(node.inputLocalScaleOffsetAttr.compound, node.outputScaleAttr.compound )
 
+        # Instancer affects, everything that modifies any output transform
+        for attr in [node.inputCurveAttr, node.inputCurvesAttr.compound, node.arcLengthToleranceAttr, node.frameTableResolutionAttr, node.instanceCountAttr, node.randomSeedAttr, node.instanceLengthAttr, node.instancingModeAttr,
+                     node.maxInstancesByLengthAttr, node.orientationModeAttr, node.distOffsetAttr, node.inputTransformAttr, node.inputLocalOrientationAxisAttr,
+                     node.enableManipulatorsAttr, node.curveAxisHandleAttr.compound, node.curveStartAttr, node.curveEndAttr, node.enableDensityAttr, node.densityRampAttr, node.evaluationModeAttr,
+                     node.enableVisibilityAttr, node.visibilityRampAttr, node.visibilityThresholdAttr,
+                     node.inputLocalTranslationOffsetAttr.compound, node.inputGlobalTranslationOffsetAttr.compound,
+                     node.inputLocalRotationOffsetAttr.compound, node.inputGlobalRotationOffsetAttr.compound, node.inputLocalScaleOffsetAttr.compound]:
+            node.attributeAffects( attr, node.outputInstancerPointsAttr )
+
+        rampAttributeAffects(node.positionRampAttr, node.outputInstancerPointsAttr)
+        rampAttributeAffects(node.rotationRampAttr, node.outputInstancerPointsAttr)
+        rampAttributeAffects(node.scaleRampAttr, node.outputInstancerPointsAttr)
+
+        # Prototype affects. Samples are needed for the ramp mode, so anything that moves instances over the curves affects them too
+        for attr in [node.inputPrototypesAttr.compound, node.prototypeWeightAttr, node.prototypeSelectionModeAttr, node.prototypeRampAttr, node.inputTransformAttr]:
+            node.attributeAffects( attr, node.outputInstancerPointsAttr )
+
+        for attr in [node.inputPrototypesAttr.compound, node.prototypeWeightAttr, node.prototypeSelectionModeAttr, node.prototypeRampAttr, node.inputTransformAttr,
+                     node.inputCurveAttr, node.inputCurvesAttr.compound, node.arcLengthToleranceAttr, node.instanceCountAttr, node.randomSeedAttr, node.instanceLengthAttr,
+                     node.instancingModeAttr, node.maxInstancesByLengthAttr, node.distOffsetAttr, node.curveStartAttr, node.curveEndAttr, node.enableDensityAttr, node.densityRampAttr]:
+            node.attributeAffects( attr, node.outputPrototypeAttr )
+
+        # Visibility affects, anything that moves instances over the curves
+        for attr in [node.enableVisibilityAttr, node.visibilityRampAttr, node.visibilityThresholdAttr,
+                     node.inputCurveAttr, node.inputCurvesAttr.compound, node.arcLengthToleranceAttr, node.instanceCountAttr, node.instanceLengthAttr,
+                     node.instancingModeAttr, node.maxInstancesByLengthAttr, node.distOffsetAttr, node.curveStartAttr, node.curveEndAttr, node.enableDensityAttr, node.densityRampAttr]:
+            node.attributeAffects( attr, node.outputVisibilityAttr )
+
+        # Cache affects
+        for attr in [node.useCacheAttr, node.cacheFileAttr, node.cacheTimeAttr]:
+            for outputAttr in [node.outputTranslationAttr.compound, node.outputRotationAttr.compound, node.outputScaleAttr.compound, node.outputInstancerPointsAttr, node.outputVisibilityAttr]:
+                node.attributeAffects( attr, outputAttr )
+
+        # Inputs that modify where instances are placed over all curves. Curves, their counts and the tolerance are handled separately
+        node.instanceSamplingAttrs = [node.instancingModeAttr, node.maxInstancesByLengthAttr, node.distOffsetAttr, node.curveStartAttr, node.curveEndAttr,
+                                      node.enableManipulatorsAttr, node.enableDensityAttr, node.densityRampAttr]
+
+        # Inputs that modify every instance of all channels, without changing the samples
+        node.sharedChannelAttrs = [node.orientationModeAttr, node.inputLocalOrientationAxisAttr, node.inputTransformAttr,
+                                   node.randomSeedAttr, node.evaluationModeAttr, node.useCacheAttr, node.cacheFileAttr, node.frameTableResolutionAttr]
+
+        def getRampAttrs(rampAttributes):
+            return [rampAttributes.ramp, rampAttributes.rampOffset, rampAttributes.rampAmplitude, rampAttributes.rampAxis.compound,
+                    rampAttributes.rampRandomAmplitude, rampAttributes.rampRepeat]
+
+        # Inputs that only modify a single channel
+        node.channelAttrs = {node.outputTranslationAttr: getRampAttrs(node.positionRampAttr) + [node.inputLocalTranslationOffsetAttr.compound, node.inputGlobalTranslationOffsetAttr.compound],
+                             node.outputRotationAttr: getRampAttrs(node.rotationRampAttr) + [node.inputLocalRotationOffsetAttr.compound, node.inputGlobalRotationOffsetAttr.compound],
+                             node.outputScaleAttr: getRampAttrs(node.scaleRampAttr) + [node.inputLocalScaleOffsetAttr.compound]}
+
 ###############
 # AE TEMPLATE #
 ###############
@@ -1182,6 +2386,9 @@ class AEinstanceAlongCurveLocatorTemplate(pm.ui.AETemplate):
             self.beginLayout("General", collapse=0)
 
             # Base controls
+            annotation = "Modeling: each instance is a transform connected to the locator, so it can be selected and edited. <br> <br> Animation: instances are drawn by a particle instancer. Much faster for big counts and evaluated correctly when batch rendering, but instances cannot be selected. The source object transformations are applied on top of each instance, so it is recommended to freeze them."
+            self.addControl("evaluationMode", label="Evaluation Mode", changeCommand=lambda nodeName: self.updateDimming(nodeName, "evaluationMode"), annotation=annotation)
+
             annotation = "Defines if the amount of instances is defined manually or by a predefined distance."
             self.addControl("instancingMode", label="Instancing Mode", changeCommand=self.onInstanceModeChanged, annotation=annotation)
 
@@ -1208,12 +2415,15 @@ class AEinstanceAlongCurveLocatorTemplate(pm.ui.AETemplate):
             self.addSeparator()
 
             # Orientation controls
-            annotation = "Identity: objects have no rotation. <br> <br> Copy From Source: Each object will copy the rotation transformation from the original. <br> <br> Use Curve: Objects will be aligned by the curve tangent with respect to the selected axis. <br> <br> Chain: Same as Use Curve, but with an additional 90 degree twist for odd instances."
+            annotation = "Identity: objects have no rotation. <br> <br> Copy From Source: Each object will copy the rotation transformation from the original. <br> <br> Use Curve: Objects will be aligned by the curve tangent with respect to the selected axis. <br> <br> Chain: Same as Use Curve, but with an additional 90 degree twist for odd instances. <br> <br> Parallel Transport: Same as Use Curve, but the rotation around the tangent changes as little as possible over the curve, so objects do not flip on vertical sections or loops."
             self.addControl("orientationMode", label="Orientation Mode", changeCommand=lambda nodeName: self.updateOrientationChange(nodeName), annotation=annotation)
 
             annotation = "Each instance will be rotated so that this axis is parallel to the curve tangent."
             self.addControl("inputLocalOrientationAxis", label="Local Axis" , changeCommand=lambda nodeName: self.updateDimming(nodeName, "inputLocalOrientationAxis"), annotation=annotation)
 
+            annotation = "The amount of frames sampled over the curve in Parallel Transport mode. Instances interpolate the closest frames. <br> <br> Higher values follow tight curves more closely, but need more curve samples each time the curve changes."
+            self.addControl("frameTableResolution", label="Frame Resolution", annotation=annotation)
+
             self.addSeparator()
 
             # Manipulator controls
@@ -1286,6 +2496,39 @@ class AEinstanceAlongCurveLocatorTemplate(pm.ui.AETemplate):
             showRampControls("rotation")
             showRampControls("scale")
 
+            self.beginLayout("Prototypes", collapse=True)
+
+            annotation = "Weighted Random: each instance picks a random prototype, with a probability proportional to its weight. <br> <br> Sequential: prototypes are repeated in order, each one as many times as its weight. <br> <br> Ramp: the ramp value over the curve is split in ranges proportional to the weights, and each instance takes the prototype of its range. <br> <br> Prototypes are the input object and the objects connected to inputPrototypes."
+            self.addControl("prototypeSelectionMode", label="Selection Mode", changeCommand=lambda nodeName: self.updateDimming(nodeName, "prototypeSelectionMode"), annotation=annotation)
+
+            annotation = "The weight of the input object. The weights of the other prototypes are in inputPrototypes."
+            self.addControl("prototypeWeight", label="Input Object Weight", changeCommand=lambda nodeName: self.updateDimming(nodeName, "prototypeWeight"), annotation=annotation)
+
+            mel.eval('AEaddRampControl("' + nodeName + '.prototypeRamp"); ')
+
+            self.endLayout()
+
+            self.beginLayout("Density", collapse=True)
+
+            annotation = "When enabled, instances are distributed by the density ramp instead of uniformly. Curve start and end are kept."
+            self.addControl("enableDensity", label="Enable Density", changeCommand=lambda nodeName: self.updateDimming(nodeName, "enableDensity"), annotation=annotation)
+
+            mel.eval('AEaddRampControl("' + nodeName + '.densityRamp"); ')
+
+            self.endLayout()
+
+            self.beginLayout("Visibility", collapse=True)
+
+            annotation = "When enabled, instances where the visibility ramp is below the threshold are hidden, and their transforms are not evaluated."
+            self.addControl("enableVisibility", label="Enable Visibility", changeCommand=lambda nodeName: self.updateDimming(nodeName, "enableVisibility"), annotation=annotation)
+
+            annotation = "Instances are visible where the visibility ramp is equal or above this value."
+            self.addControl("visibilityThreshold", label="Threshold", changeCommand=lambda nodeName: self.updateDimming(nodeName, "visibilityThreshold"), annotation=annotation)
+
+            mel.eval('AEaddRampControl("' + nodeName + '.visibilityRamp"); ')
+
+            self.endLayout()
+
             self.beginLayout("Extra", collapse=True)
 
             # Additional info
@@ -1295,6 +2538,30 @@ class AEinstanceAlongCurveLocatorTemplate(pm.ui.AETemplate):
             annotation = "The shading group for the instances. When instantiating, they will be assigned this SG."
             self.addControl("inputShadingGroup", label="Shading Group", changeCommand=lambda nodeName: self.updateDimming(nodeName, "inputShadingGroup"), annotation=annotation)
 
+            annotation = "The relative error allowed when mapping distances over the curve to curve parameters. <br> <br> Lower values are more precise, but need more curve samples each time the curve changes."
+            self.addControl("arcLengthTolerance", label="Arc Length Tolerance", annotation=annotation)
+
+            annotation = "If enabled, the bounding box of the node includes the source object bounds around each instance. <br> <br> If disabled, only the instance positions are used."
+            self.addControl("includeSourceBounds", label="Include Source Bounds", annotation=annotation)
+
+            annotation = "The amount of worker processes used to evaluate the instances. <br> <br> 1 evaluates everything in Maya's process, 0 uses all cores. Workers are started in the background, so the first evaluations after a change are done in Maya's process."
+            self.addControl("workerCount", label="Worker Count", annotation=annotation)
+
+            annotation = "Instance counts below this value are always evaluated in Maya's process, since sending the data to the workers would take longer."
+            self.addControl("parallelThreshold", label="Parallel Threshold", annotation=annotation)
+
+            annotation = "If enabled, instances are read from the cache file instead of being evaluated. <br> <br> Caches are written with the instanceAlongCurveBake command."
+            self.addControl("useCache", label="Use Cache", annotation=annotation)
+
+            annotation = "The cache file with the baked instance transforms of each frame."
+            self.addControl("cacheFile", label="Cache File", annotation=annotation)
+
+            annotation = "The seed of the random values. Each instance keeps its random values when the instance count changes."
+            self.addControl("randomSeed", label="Random Seed", annotation=annotation)
+
+            annotation = "Records the time spent on each evaluation stage, in the profileStages, profileTimes and profileCalls attributes. <br> <br> The history of the last evaluations can be queried with the instanceAlongCurveProfile command."
+            self.addControl("enableProfiling", label="Enable Profiling", annotation=annotation)
+
             self.endLayout()
 
             self.endScrollLayout()
@@ -1387,6 +2654,7 @@ class AEinstanceAlongCurveLocatorTemplate(pm.ui.AETemplate):
     # When orientation changes, update related controls...  
     def updateOrientationChange(self, nodeName):
         self.updateDimming(nodeName, "orientationMode")
+        self.updateDimming(nodeName, "frameTableResolution", pm.PyNode(nodeName).orientationMode.get() == 4)
         self.updateManipCountDimming(nodeName)
 
     def onRampUpdate(self, attr):
@@ -1408,7 +2676,7 @@ class AEinstanceAlongCurveLocatorTemplate(pm.ui.AETemplate):
             node = pm.PyNode(nodeName)
             instanced = node.isInstanced()
             hasInputTransform = node.inputTransform.isConnected() or node.inputTransformMatrix.isConnected()
-            hasInputCurve = node.inputCurve.isConnected()
+            hasInputCurve = node.inputCurve.isConnected() or node.inputCurves.numConnectedElements() > 0
 
             self.dimControl(nodeName, attr, instanced or (not hasInputCurve) or (not hasInputTransform) or (not additionalCondition))
 
@@ -1503,13 +2771,27 @@ class instanceAlongCurveCommand(OpenMayaMPx.MPxCommand):
             list = OpenMaya.MSelectionList()
             OpenMaya.MGlobal.getActiveSelectionList(list)
 
-            if list.length() == 2:
+            # Curves first, then the shapes. Additional curves are connected to inputCurves, and
+            # additional shapes to inputPrototypes. The last object is always a shape
+            if list.length() >= 2:
                 curveDagPath = OpenMaya.MDagPath()
                 list.getDagPath(0, curveDagPath)
                 curveDagPath.extendToShape()
 
+                curveCount = 1
+
+                while curveCount < list.length() - 1:
+                    nextDagPath = OpenMaya.MDagPath()
+                    list.getDagPath(curveCount, nextDagPath)
+                    nextDagPath.extendToShape()
+
+                    if not nextDagPath.node().hasFn(OpenMaya.MFn.kNurbsCurve):
+                        break
+
+                    curveCount += 1
+
                 shapeDagPath = OpenMaya.MDagPath()
-                list.getDagPath(1, shapeDagPath)           
+                list.getDagPath(curveCount, shapeDagPath)
 
                 if(curveDagPath.node().hasFn(OpenMaya.MFn.kNurbsCurve)):
 
@@ -1555,6 +2837,22 @@ class instanceAlongCurveCommand(OpenMayaMPx.MPxCommand):
                     setupRamp(instanceAlongCurveLocator.rotationRampAttr)
                     setupRamp(instanceAlongCurveLocator.scaleRampAttr)
 
+                    # Prototypes are spread over the curve in order by default
+                    linearValues = OpenMaya.MFloatArray()
+                    linearValues.append(0.0)
+                    linearValues.append(1.0)
+
+                    prototypeRamp = OpenMaya.MRampAttribute(newNodeFn.findPlug(instanceAlongCurveLocator.prototypeRampAttr))
+                    prototypeRamp.addEntries(linearValues, linearValues, OpenMaya.MIntArray(2, 1))
+
+                    # Uniform density by default
+                    densityRamp = OpenMaya.MRampAttribute(newNodeFn.findPlug(instanceAlongCurveLocator.densityRampAttr))
+                    densityRamp.addEntries(OpenMaya.MFloatArray(1, 0.0), OpenMaya.MFloatArray(1, 1.0), OpenMaya.MIntArray(1, 1))
+
+                    # Everything visible by default
+                    visibilityRamp = OpenMaya.MRampAttribute(newNodeFn.findPlug(instanceAlongCurveLocator.visibilityRampAttr))
+                    visibilityRamp.addEntries(OpenMaya.MFloatArray(1, 0.0), OpenMaya.MFloatArray(1, 1.0), OpenMaya.MIntArray(1, 1))
+
                     # Select new node shape
                     OpenMaya.MGlobal.clearSelectionList()
                     msel = OpenMaya.MSelectionList()
@@ -1565,8 +2863,29 @@ class instanceAlongCurveCommand(OpenMayaMPx.MPxCommand):
                     mdagModifier = OpenMaya.MDagModifier()
                     self.mUndo.append(mdagModifier)               
                     mdagModifier.connect(curvePlug, newNodeFn.findPlug(instanceAlongCurveLocator.inputCurveAttr))
+
+                    inputCurvesPlug = newNodeFn.findPlug(instanceAlongCurveLocator.inputCurvesAttr.compound)
+
+                    for i in xrange(1, curveCount):
+                        extraCurveDagPath = OpenMaya.MDagPath()
+                        list.getDagPath(i, extraCurveDagPath)
+                        extraCurveDagPath.extendToShape()
+
+                        if extraCurveDagPath.node().hasFn(OpenMaya.MFn.kNurbsCurve):
+                            extraCurvePlug = OpenMaya.MFnDagNode(extraCurveDagPath).findPlug("worldSpace", False).elementByLogicalIndex(0)
+                            elementPlug = inputCurvesPlug.elementByLogicalIndex(i - 1)
+                            mdagModifier.connect(extraCurvePlug, elementPlug.child(instanceAlongCurveLocator.inputCurvesAttr.curve))
                     mdagModifier.connect(transformMessagePlug, newNodeFn.findPlug(instanceAlongCurveLocator.inputTransformAttr))
 
+                    inputPrototypesPlug = newNodeFn.findPlug(instanceAlongCurveLocator.inputPrototypesAttr.compound)
+
+                    for i in xrange(curveCount + 1, list.length()):
+                        prototypeDagPath = OpenMaya.MDagPath()
+                        list.getDagPath(i, prototypeDagPath)
+                        prototypeMatrixPlug = OpenMaya.MFnDagNode(prototypeDagPath.transform()).findPlug("worldMatrix", True).elementByLogicalIndex(0)
+                        elementPlug = inputPrototypesPlug.elementByLogicalIndex(i - curveCount - 1)
+                        mdagModifier.connect(prototypeMatrixPlug, elementPlug.child(instanceAlongCurveLocator.inputPrototypesAttr.matrix))
+
                     if shadingGroupFn is not None:
                         shadingGroupMessagePlug = shadingGroupFn.findPlug("message", True)
                         mdagModifier.connect(shadingGroupMessagePlug, newNodeFn.findPlug(instanceAlongCurveLocator.inputShadingGroupAttr))
@@ -1582,6 +2901,9 @@ class instanceAlongCurveCommand(OpenMayaMPx.MPxCommand):
                     instanceCountPlug = newNodeFn.findPlug("instanceCount", False)
                     instanceCountPlug.setInt(10)
 
+                    for i in xrange(inputCurvesPlug.numElements()):
+                        inputCurvesPlug.elementByPhysicalIndex(i).child(instanceAlongCurveLocator.inputCurvesAttr.instanceCount).setInt(10)
+
                     # Rotation offset initialized to original rotation
                     rotX = transformFn.findPlug("rotateX", False).asMAngle().asDegrees()
                     rotY = transformFn.findPlug("rotateY", False).asMAngle().asDegrees()
@@ -1611,7 +2933,7 @@ class instanceAlongCurveCommand(OpenMayaMPx.MPxCommand):
                 else:
                     sys.stderr.write("Please select a curve first")
             else:
-                sys.stderr.write("Please select a curve and a shape")
+                sys.stderr.write("Please select one or more curves and a shape")
         except:
             sys.stderr.write('Failed trying to create locator. stack trace: \n')
             sys.stderr.write(traceback.format_exc())
@@ -1620,6 +2942,139 @@ class instanceAlongCurveCommand(OpenMayaMPx.MPxCommand):
     def cmdCreator():
         return OpenMayaMPx.asMPxPtr( instanceAlongCurveCommand() )
 
+# Returns the profiling history of a node (or the selected one) as a JSON string
+class instanceAlongCurveProfileCommand(OpenMayaMPx.MPxCommand):
+
+    def __init__(self):
+        OpenMayaMPx.MPxCommand.__init__(self)
+
+    def isUndoable(self):
+        return False
+
+    def doIt(self, argList):
+
+        selectionList = OpenMaya.MSelectionList()
+
+        if argList.length() > 0:
+            selectionList.add(argList.asString(0))
+        else:
+            OpenMaya.MGlobal.getActiveSelectionList(selectionList)
+
+        nodeFn = getLocatorFromSelection(selectionList, kPluginProfileCmdName)
+
+        if nodeFn is not None:
+            self.setResult(json.dumps(list(nodeFn.userNode().profileHistory)))
+
+    @staticmethod
+    def cmdCreator():
+        return OpenMayaMPx.asMPxPtr( instanceAlongCurveProfileCommand() )
+
+# Evaluates a node (or the selected one) over a frame range, writing the instance transforms of each frame
+# to a cache file. The node is set to read that file, so that enabling useCache plays the baked frames
+class instanceAlongCurveBakeCommand(OpenMayaMPx.MPxCommand):
+
+    def __init__(self):
+        OpenMayaMPx.MPxCommand.__init__(self)
+
+    def isUndoable(self):
+        return False
+
+    def doIt(self, argList):
+
+        argData = OpenMaya.MArgDatabase(self.syntax(), argList)
+
+        selectionList = OpenMaya.MSelectionList()
+        argData.getObjects(selectionList)
+
+        nodeFn = getLocatorFromSelection(selectionList, kPluginBakeCmdName)
+
+        if nodeFn is None:
+            return
+
+        if not argData.isFlagSet("-f"):
+            OpenMaya.MGlobal.displayWarning(kPluginBakeCmdName + ": no cache file was given")
+            return
+
+        if nodeFn.findPlug("useCache", False).asBool():
+            OpenMaya.MGlobal.displayWarning(kPluginBakeCmdName + ": " + nodeFn.name() + " is playing a cache, disable useCache before baking")
+            return
+
+        path = argData.flagArgumentString("-f", 0)
+
+        # The playback range is baked by default
+        startFrame = argData.flagArgumentDouble("-s", 0) if argData.isFlagSet("-s") else OpenMaya.MAnimControl.minTime().asUnits(OpenMaya.MTime.uiUnit())
+        endFrame = argData.flagArgumentDouble("-e", 0) if argData.isFlagSet("-e") else OpenMaya.MAnimControl.maxTime().asUnits(OpenMaya.MTime.uiUnit())
+        frameStep = argData.flagArgumentDouble("-by", 0) if argData.isFlagSet("-by") else 1.0
+
+        if frameStep <= 0.0 or endFrame < startFrame:
+            OpenMaya.MGlobal.displayWarning(kPluginBakeCmdName + ": invalid frame range")
+            return
+
+        # The file may be mapped by the node if it was baked before
+        nodeFn.userNode().closeInstanceCache()
+
+        startTime = time.time()
+        frameCount = int(math.floor((endFrame - startFrame) / frameStep + 0.0001)) + 1
+        currentTime = OpenMaya.MAnimControl.currentTime()
+        pointsPlug = nodeFn.findPlug("outputInstancerPoints", False)
+        writer = InstanceCacheWriter(path, startFrame, frameStep)
+
+        try:
+            for f in xrange(frameCount):
+                OpenMaya.MAnimControl.setCurrentTime(OpenMaya.MTime(startFrame + f * frameStep, OpenMaya.MTime.uiUnit()))
+
+                # Pulling the instancer points evaluates all channels at once
+                arrayDataFn = OpenMaya.MFnArrayAttrsData(pointsPlug.asMObject())
+                positionArray = arrayDataFn.vectorArray("position")
+                rotationArray = arrayDataFn.vectorArray("rotation")
+                scaleArray = arrayDataFn.vectorArray("scale")
+
+                translations = [(positionArray[i].x, positionArray[i].y, positionArray[i].z) for i in xrange(positionArray.length())]
+                rotations = [(math.radians(rotationArray[i].x), math.radians(rotationArray[i].y), math.radians(rotationArray[i].z)) for i in xrange(rotationArray.length())]
+                scales = [(scaleArray[i].x, scaleArray[i].y, scaleArray[i].z) for i in xrange(scaleArray.length())]
+
+                # The cache has no visibility, so hidden instances are baked with a zero scale
+                if "visibility" in arrayDataFn.list():
+                    visibilityArray = arrayDataFn.doubleArray("visibility")
+                    scales = [scales[i] if i >= visibilityArray.length() or visibilityArray[i] > 0.0 else (0.0, 0.0, 0.0) for i in xrange(len(scales))]
+
+                writer.writeFrame(translations, rotations, scales)
+        finally:
+            writer.close()
+            OpenMaya.MAnimControl.setCurrentTime(currentTime)
+
+        # Point the node to the new cache, following the scene time
+        nodeFn.findPlug("cacheFile", False).setString(path)
+        cacheTimePlug = nodeFn.findPlug("cacheTime", False)
+
+        if not cacheTimePlug.isConnected():
+            timeList = OpenMaya.MSelectionList()
+            timeList.add("time1")
+            timeNode = OpenMaya.MObject()
+            timeList.getDependNode(0, timeNode)
+
+            mdgModifier = OpenMaya.MDGModifier()
+            mdgModifier.connect(OpenMaya.MFnDependencyNode(timeNode).findPlug("outTime", False), cacheTimePlug)
+            mdgModifier.doIt()
+
+        reportTiming("Baked " + str(frameCount) + " frames", startTime)
+        self.setResult(path)
+
+    @staticmethod
+    def cmdCreator():
+        return OpenMayaMPx.asMPxPtr( instanceAlongCurveBakeCommand() )
+
+    @staticmethod
+    def syntaxCreator():
+        syntax = OpenMaya.MSyntax()
+        syntax.addFlag("-f", "-file", OpenMaya.MSyntax.kString)
+        syntax.addFlag("-s", "-startFrame", OpenMaya.MSyntax.kDouble)
+        syntax.addFlag("-e", "-endFrame", OpenMaya.MSyntax.kDouble)
+        syntax.addFlag("-by", "-frameStep", OpenMaya.MSyntax.kDouble)
+        syntax.useSelectionAsDefault(True)
+        syntax.setObjectType(OpenMaya.MSyntax.kSelectionList, 0, 1)
+        return syntax
+
 class instanceAlongCurveLocatorManip(OpenMayaMPx.MPxManipContainer):
 
     def __init__(self):
@@ -1831,6 +3286,11 @@ def initializePlugin( mobject ):
         mplugin.registerNode( kPluginNodeName, kPluginNodeId, instanceAlongCurveLocator.nodeCreator,
                               instanceAlongCurveLocator.nodeInitializer, OpenMayaMPx.MPxNode.kLocatorNode, kPluginNodeClassify )
 
+        mplugin.registerCommand( kPluginProfileCmdName, instanceAlongCurveProfileCommand.cmdCreator )
+        mplugin.registerCommand( kPluginBakeCmdName, instanceAlongCurveBakeCommand.cmdCreator, instanceAlongCurveBakeCommand.syntaxCreator )
+
+        kInstanceUpdateScheduler.registerSceneCallbacks()
+
     except:
         sys.stderr.write('Failed to register plugin instanceAlongCurve. stack trace: \n')
         sys.stderr.write(traceback.format_exc())
@@ -1840,6 +3300,11 @@ def uninitializePlugin( mobject ):
     mplugin = OpenMayaMPx.MFnPlugin( mobject )
     try:
         mplugin.deregisterNode( kPluginNodeId )
+        mplugin.deregisterCommand( kPluginProfileCmdName )
+        mplugin.deregisterCommand( kPluginBakeCmdName )
+        kInstanceUpdateScheduler.cancel()
+        kInstanceUpdateScheduler.removeSceneCallbacks()
+        kWorkerPoolManager.close()
 
         if (OpenMaya.MGlobal.mayaState() != OpenMaya.MGlobal.kBatch) and (OpenMaya.MGlobal.mayaState() != OpenMaya.MGlobal.kLibraryApp):
             mplugin.deregisterCommand( kPluginCmdName )
@@ -1849,6 +3314,355 @@ def uninitializePlugin( mobject ):
         raise
 
 ### UTILS
+
+# Returns the function set of the first locator in selectionList, resolving transforms to their shape.
+# Warns and returns None if there is no such locator
+def getLocatorFromSelection(selectionList, commandName):
+
+    if selectionList.length() == 0:
+        OpenMaya.MGlobal.displayWarning(commandName + ": no node was given")
+        return None
+
+    node = OpenMaya.MObject()
+    selectionList.getDependNode(0, node)
+
+    # Transforms are resolved to their locator shape
+    if node.hasFn(OpenMaya.MFn.kTransform):
+        path = OpenMaya.MDagPath()
+        selectionList.getDagPath(0, path)
+        path.extendToShape()
+        node = path.node()
+
+    nodeFn = OpenMaya.MFnDependencyNode(node)
+
+    if nodeFn.typeId() != kPluginNodeId:
+        OpenMaya.MGlobal.displayWarning(commandName + ": " + nodeFn.name() + " is not an instanceAlongCurveLocator")
+        return None
+
+    return nodeFn
+
+# Kernel curve interface over MFnNurbsCurve
+class MayaCurve(object):
+
+    def __init__(self, curveFn):
+        self.curveFn = curveFn
+        self.point = OpenMaya.MPoint()
+
+    def length(self):
+        return self.curveFn.length()
+
+    def paramRange(self):
+        return (self.curveFn.findParamFromLength(0.0), self.curveFn.findParamFromLength(self.curveFn.length()))
+
+    def sampleCountHint(self):
+        return self.curveFn.numSpans() * self.curveFn.degree() * 4
+
+    def isClosed(self):
+        return self.curveFn.form() != OpenMaya.MFnNurbsCurve.kOpen
+
+    def pointAtParam(self, param):
+        self.curveFn.getPointAtParam(param, self.point)
+        return (self.point.x, self.point.y, self.point.z)
+
+    def tangentAtParam(self, param):
+        tangent = self.curveFn.tangent(param)
+        return (tangent.x, tangent.y, tangent.z)
+
+# Keeps track of the used logical indices of a sparse array, so that free indices
+# can be found without walking the whole array
+class LogicalIndexAllocator(object):
+
+    def __init__(self, usedIndices):
+        self.usedIndices = set(usedIndices)
+        self.nextIndex = max(self.usedIndices) + 1 if self.usedIndices else 0
+
+        # Holes below the highest used index. queuedIndices are the free ones among them: indices marked
+        # as used are only removed from the set, and their heap entries are skipped when popped
+        self.freeIndices = [i for i in xrange(self.nextIndex) if i not in self.usedIndices]
+        self.queuedIndices = set(self.freeIndices)
+
+    # Returns the lowest numIndices free indices, and marks them as used
+    def allocate(self, numIndices):
+
+        indices = []
+
+        while self.freeIndices and len(indices) < numIndices:
+            index = heapq.heappop(self.freeIndices)
+
+            # Stale entry, the index was used or already popped since it was pushed
+            if index not in self.queuedIndices or index in self.usedIndices:
+                continue
+
+            self.queuedIndices.discard(index)
+            self.usedIndices.add(index)
+            indices.append(index)
+
+        while len(indices) < numIndices:
+            self.usedIndices.add(self.nextIndex)
+            indices.append(self.nextIndex)
+            self.nextIndex += 1
+
+        return indices
+
+    def markUsed(self, index):
+
+        for i in xrange(self.nextIndex, index):
+            heapq.heappush(self.freeIndices, i)
+            self.queuedIndices.add(i)
+
+        self.nextIndex = max(self.nextIndex, index + 1)
+        self.usedIndices.add(index)
+        self.queuedIndices.discard(index)
+
+    def release(self, index):
+
+        if index in self.usedIndices:
+            self.usedIndices.discard(index)
+
+            if index not in self.queuedIndices:
+                heapq.heappush(self.freeIndices, index)
+                self.queuedIndices.add(index)
+
+# Samples a float or color plug of a shading network over a line in uv space, once per instance.
+# Colors are reduced to their normalized length. Returns None if the source is not a texture or shader
+def sampleAmplitudeSource(sourcePlug, count):
+
+    nodeFn = OpenMaya.MFnDependencyNode(sourcePlug.node())
+    classification = OpenMaya.MFnDependencyNode.classification(nodeFn.typeName())
+
+    # Only the root of each classification, since e.g. "drawdb/shader" is not a shading node. Utility nodes,
+    # like this one, are not sampled
+    if not any(c.split("/")[0] in ["texture", "shader"] for c in classification.split(":")):
+        return None
+
+    resultColors = OpenMaya.MFloatVectorArray()
+    resultTransparencies = OpenMaya.MFloatVectorArray()
+
+    uValues = OpenMaya.MFloatArray(count, 0.0)
+    vValues = OpenMaya.MFloatArray(count, 0.0)
+
+    # Sample a line, for more user flexibility
+    for i in xrange(count):
+        uValues.set(i / float(count), i)
+        vValues.set(i / float(count), i)
+
+    OpenMayaRender.MRenderUtil.sampleShadingNetwork(sourcePlug.name(), count, False, False, OpenMaya.MFloatMatrix(), None, uValues, vValues, None, None, None, None, None, resultColors, resultTransparencies)
+
+    # Float plugs are sampled into the first channel
+    if sourcePlug.isCompound() and sourcePlug.numChildren() == 3:
+        return [resultColors[i].length() / math.sqrt(3) for i in xrange(resultColors.length())]
+
+    return [resultColors[i].x for i in xrange(resultColors.length())]
+
+# Coalesces the instance updates requested while the user interacts with the scene, so that
+# instances are created or removed once, when no new request arrived for a while. Each pending
+# node is updated with its own modifier, which is only executed if the node reconciled all of its
+# instances, so that a failing node never applies half of its changes. Updates are requested from compute and connection
+# callbacks, where the DAG must not change, so they are always queued and only applied from safe
+# points: an idle timer in interactive sessions, after opening or importing a file, before saving,
+# exporting or rendering, and explicitly with flushInstanceUpdates(). Batch and library sessions have
+# no idle events, so there attribute changes are applied right away (their callbacks are outside of
+# compute), and the rest before each frame change. The worker pool requested by compute is started
+# from the same safe points
+class InstanceUpdateScheduler(object):
+
+    kDelay = 0.25 # Seconds without requests before updating
+    kPeriod = 0.1
+
+    kFlushMessages = ["kAfterOpen", "kAfterImport", "kBeforeSave", "kBeforeExport", "kBeforeSoftwareRender", "kBeforeSoftwareFrameRender"]
+
+    def __init__(self):
+        self.pendingNodes = {}
+        self.lastRequestTime = 0.0
+        self.callbackId = None
+        self.sceneCallbackIds = []
+        self.flushing = False
+
+    def registerSceneCallbacks(self):
+        for message in InstanceUpdateScheduler.kFlushMessages:
+            self.sceneCallbackIds.append(OpenMaya.MSceneMessage.addCallback(getattr(OpenMaya.MSceneMessage, message), self.onSceneMessage))
+
+        # Renderers other than Maya Software only change the time between frames
+        if not self.isInteractive():
+            self.sceneCallbackIds.append(OpenMaya.MDGMessage.addTimeChangeCallback(self.onTimeChange))
+
+    def removeSceneCallbacks(self):
+        for callbackId in self.sceneCallbackIds:
+            OpenMaya.MMessage.removeCallback(callbackId)
+
+        self.sceneCallbackIds = []
+
+    def onSceneMessage(self, clientData):
+        self.flush()
+
+    def onTimeChange(self, time, clientData):
+        if self.pendingNodes or kWorkerPoolManager.requestedWorkerCount is not None:
+            self.flush()
+
+    def isInteractive(self):
+        return OpenMaya.MGlobal.mayaState() != OpenMaya.MGlobal.kBatch and OpenMaya.MGlobal.mayaState() != OpenMaya.MGlobal.kLibraryApp
+
+    def schedule(self, locator):
+
+        self.pendingNodes[id(locator)] = (OpenMaya.MObjectHandle(locator.thisMObject()), locator)
+        self.wake()
+
+    def wake(self):
+
+        self.lastRequestTime = time.time()
+
+        # Without an event loop, timers never fire
+        if not self.isInteractive():
+            return
+
+        if self.callbackId is None:
+            self.callbackId = OpenMaya.MTimerMessage.addTimerCallback(InstanceUpdateScheduler.kPeriod, self.onTimer)
+
+    # Attribute change callbacks are safe points, so without idle events the update is applied right away.
+    # Attributes set while reading a file are applied once it is open
+    def scheduleFromCallback(self, locator):
+
+        self.schedule(locator)
+
+        if not self.isInteractive() and not OpenMaya.MFileIO.isReadingFile():
+            self.flush()
+
+    def onTimer(self, elapsedTime, lastTime, clientData):
+        if time.time() - self.lastRequestTime >= InstanceUpdateScheduler.kDelay:
+            self.flush()
+
+    # Executing the modifier evaluates nodes and sends messages, which may request new updates or even flush
+    # again. Those are left pending for the next flush, instead of changing the DAG while it is being changed.
+    # In interactive sessions, new requests start the timer again
+    def flush(self):
+
+        if self.flushing:
+            return
+
+        self.cancel()
+        self.flushing = True
+
+        try:
+            kWorkerPoolManager.startRequestedPool()
+
+            pendingNodes = self.pendingNodes.values()
+            self.pendingNodes = {}
+
+            for handle, locator in pendingNodes:
+
+                # The node may have been deleted since the update was requested
+                if not handle.isValid() or not handle.isAlive():
+                    continue
+
+                try:
+                    mdagModifier = OpenMaya.MDagModifier()
+                    instances = locator.reconcileInstances(mdagModifier)
+                    mdagModifier.doIt()
+                    locator.finishInstances(instances)
+                except:
+                    sys.stderr.write('Failed trying to update instances. stack trace: \n')
+                    sys.stderr.write(traceback.format_exc())
+
+        finally:
+            self.flushing = False
+
+    def cancel(self):
+        if self.callbackId is not None:
+            OpenMaya.MMessage.removeCallback(self.callbackId)
+            self.callbackId = None
+
+kInstanceUpdateScheduler = InstanceUpdateScheduler()
+
+# Applies all pending instance updates now, e.g. from scripts that query the instances after changing the count
+def flushInstanceUpdates():
+    kInstanceUpdateScheduler.flush()
+
+# Keeps one pool of worker processes (see WorkerPool) for all nodes. Workers are python interpreters started
+# with subprocess, never forked from Maya, and only from the safe points of the scheduler. Compute only uses
+# a pool that is already running, and falls back to the serial evaluation if anything goes wrong
+class WorkerPoolManager(object):
+
+    def __init__(self):
+        self.pool = None
+        self.requestedWorkerCount = None
+        self.failedWorkerCount = None # Not requested again until the worker count changes
+
+    def getPool(self, workerCount):
+
+        if self.pool is not None and self.pool.workerCount == workerCount and self.pool.isAlive():
+            return self.pool
+
+        if workerCount != self.failedWorkerCount and workerCount != self.requestedWorkerCount:
+            self.requestedWorkerCount = workerCount
+            kInstanceUpdateScheduler.wake()
+
+        return None
+
+    def startRequestedPool(self):
+
+        workerCount = self.requestedWorkerCount
+        self.requestedWorkerCount = None
+
+        if workerCount is None or (self.pool is not None and self.pool.workerCount == workerCount and self.pool.isAlive()):
+            return
+
+        self.close()
+        executable = getWorkerExecutable()
+
+        try:
+            if executable is None:
+                raise RuntimeError("No python interpreter found for the worker processes")
+
+            self.pool = WorkerPool(executable, workerCount)
+        except:
+            self.failedWorkerCount = workerCount
+            sys.stderr.write('Failed to start the instanceAlongCurve worker processes, evaluating in Maya instead. stack trace: \n')
+            sys.stderr.write(traceback.format_exc())
+            return
+
+        # Results do not depend on the pool, so nodes use it from their next evaluation
+        self.failedWorkerCount = None
+
+    # Returns None if the pool failed, which is then closed
+    def evaluate(self, pool, evaluateFn, samples, settings, ramp, count, indices=None):
+
+        try:
+            return pool.evaluate(evaluateFn, samples, settings, ramp, count, indices)
+        except:
+            sys.stderr.write('instanceAlongCurve worker processes failed, evaluating in Maya instead. stack trace: \n')
+            sys.stderr.write(traceback.format_exc())
+
+            self.failedWorkerCount = pool.workerCount
+            self.close()
+            return None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+kWorkerPoolManager = WorkerPoolManager()
+
+# mayapy when running inside Maya, since sys.executable is the Maya binary itself. Otherwise the current interpreter
+def getWorkerExecutable():
+
+    mayaLocation = os.environ.get("MAYA_LOCATION")
+
+    if mayaLocation:
+        path = os.path.join(mayaLocation, "bin", "mayapy.exe" if sys.platform == "win32" else "mayapy")
+
+        if os.path.isfile(path):
+            return path
+
+    if os.path.basename(sys.executable).lower().startswith(("python", "mayapy")):
+        return sys.executable
+
+    return None
+
+def reportTiming(label, startTime):
+    if kReportTimings:
+        OpenMaya.MGlobal.displayInfo("instanceAlongCurve: " + label + " in " + str(round((time.time() - startTime) * 1000.0, 2)) + " ms")
+
 def getSingleSourceObjectFromPlug(plug):
 
     if plug.isConnected():
@@ -1862,6 +3676,28 @@ def getSingleSourceObjectFromPlug(plug):
 
     return None
 
+# Walks up compound parents and arrays, so that any child/element plug can be compared against top level attributes
+def getRootPlug(plug):
+
+    while plug.isChild() or plug.isElement():
+        if plug.isChild():
+            plug = plug.parent()
+        else:
+            plug = plug.array()
+
+    return plug
+
+# Transform connected to the plug, from a DAG path to get the world transformations correctly
+def getTransformFnFromPlug(plug):
+    transform = getSingleSourceObjectFromPlug(plug)
+
+    if transform is not None and transform.hasFn(OpenMaya.MFn.kTransform):
+        path = OpenMaya.MDagPath()
+        OpenMaya.MFnDagNode(transform).getPath(path)
+        return OpenMaya.MFnTransform(path)
+
+    return None
+
 def getFnFromPlug(plug, fnType):
     node = getSingleSourceObjectFromPlug(plug)
 
@@ -1878,8 +3714,7 @@ def getFnFromPlug(plug, fnType):
 
     return None
 
-# TODO: cache this data to prevent recalculating when there is no manipulator being updated
-def getSortedCurveAxisArray(mObject, curveAxisHandleArray, count):
+def getSortedCurveAxisArray(mObject, curveAxisHandleArray):
     axisHandles = []
 
     expectedHandleCount = OpenMaya.MFnDependencyNode(mObject).findPlug(instanceAlongCurveLocator.curveAxisHandleCountAttr).asInt()
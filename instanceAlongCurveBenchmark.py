@@ -0,0 +1,229 @@
+import sys
+import time
+import math
+import json
+import argparse
+
+from instanceAlongCurveKernel import *
+
+#############
+# BENCHMARK #
+#############
+
+# Headless benchmark of the evaluation kernel, over synthetic curves. It only needs the kernel,
+# so it runs with a plain python interpreter:
+#
+#   python instanceAlongCurveBenchmark.py --output results.json --baseline baseline.json
+
+# Each sweep varies one parameter, leaving the others at their default value
+kBenchmarkDefaults = {"instanceCount": 1000, "cvCount": 64, "degree": 3, "handleCount": 0, "rampResolution": BakedRamp.kResolution, "orientationMode": 2}
+kBenchmarkSweeps = {"instanceCount": [10, 100, 1000, 10000, 100000],
+                    "cvCount": [4, 64, 1024, 16384],
+                    "degree": [1, 2, 3, 5],
+                    "handleCount": [0, 8, 128, 2048],
+                    "rampResolution": [16, 256, 4096],
+                    "orientationMode": [0, 1, 2, 3, 4]}
+
+# Stages reported by each case, in evaluation order. Results with other stages are rejected, so that
+# renamed stages do not silently drop out of the comparison with a baseline
+kBenchmarkStages = ["arcLength", "sampling", "frameTable", "ramps", "randomization", "prototypes", "visibility",
+                    "translation", "rotation", "scale", "output"]
+
+def validateStages(stages):
+
+    unknownStages = sorted(set(stages) - set(kBenchmarkStages))
+
+    if unknownStages:
+        raise ValueError("Unknown benchmark stages: " + ", ".join(unknownStages))
+
+# Evaluates the kernel once over a synthetic spiral and returns the time spent in each stage.
+# Randomization generates the random streams of every channel axis, and output packs the transforms
+# into the float32 layout of a cache frame, which is the part of output writing that does not need Maya.
+# If a WorkerPool is given, the channels are evaluated with it, like the node does for big counts
+def benchmarkKernelCase(instanceCount, cvCount, degree, handleCount, rampResolution, orientationMode, pool=None):
+
+    timer = StageTimer()
+    curve = NurbsCurve([(math.cos(i * .25) * 10.0, i * .1, math.sin(i * .25) * 10.0) for i in xrange(max(cvCount, degree + 1))], degree)
+
+    startTime = time.time()
+    arcLengthTable = ArcLengthTable.fromCurve(curve, 0.001)
+    timer.add("arcLength", startTime)
+
+    handleIndex = None
+    maxParam = arcLengthTable.maxParam
+
+    if handleCount > 0:
+        handleIndex = HandleIndex([(i, maxParam * i / float(handleCount), i * 15.0) for i in xrange(handleCount)])
+
+    settings = TransformSettings()
+    settings.orientationMode = orientationMode
+    settings.enableManipulators = handleIndex is not None
+
+    curveLength = arcLengthTable.curveLength
+
+    startTime = time.time()
+    samples = sampleInstances(curve, arcLengthTable, instanceCount, 0.0, 0.0, curveLength, curveLength / float(instanceCount), handleIndex)
+    timer.add("sampling", startTime)
+
+    if orientationMode == 4:
+        startTime = time.time()
+        samples.frameRotations = FrameTable.fromCurve(curve, arcLengthTable, 256).getRotations(samples.normalizedDistances, samples.tangents)
+        timer.add("frameTable", startTime)
+
+    startTime = time.time()
+    bakedRamp = BakedRamp([math.sin(i * math.pi / float(rampResolution)) for i in xrange(rampResolution + 1)])
+    rampValues = bakedRamp.evaluate(samples.normalizedDistances, 1.0, 0.0)
+    timer.add("ramps", startTime)
+
+    # The channels below draw their random values themselves, so without random amplitude
+    # they only measure the transform math
+    startTime = time.time()
+
+    for channel in [kRandomTranslation, kRandomRotation, kRandomScale]:
+        for axis in xrange(3):
+            getRandomValues(settings.randomSeed, channel, axis, instanceCount)
+
+    timer.add("randomization", startTime)
+
+    ramp = RampChannel(rampValues, 0.0, (1.0, 1.0, 1.0))
+
+    startTime = time.time()
+    getPrototypeIndices([1.0, 2.0, 0.5], 0, settings.randomSeed, instanceCount)
+    timer.add("prototypes", startTime)
+
+    startTime = time.time()
+    getInstanceVisibility(rampValues, 0.5)
+    timer.add("visibility", startTime)
+
+    channels = {}
+
+    for stage, evaluateFn in [("translation", evaluateTranslations), ("rotation", evaluateRotations), ("scale", evaluateScales)]:
+        startTime = time.time()
+
+        if pool is not None:
+            channels[stage] = pool.evaluate(evaluateFn, samples, settings, ramp, instanceCount)
+        else:
+            channels[stage] = evaluateFn(samples, settings, ramp, instanceCount)
+
+        timer.add(stage, startTime)
+
+    translations = channels["translation"]
+    rotations = channels["rotation"]
+    scales = channels["scale"]
+
+    startTime = time.time()
+    getCacheArray(getCacheValues(translations, rotations, scales))
+    timer.add("output", startTime)
+
+    return timer.asDict()
+
+# Runs all sweeps, keeping the best time of each stage over the repeats.
+# If outputPath is given, results are also written there as JSON. With more than one worker, channels
+# are evaluated by a WorkerPool of this interpreter, started before the first case
+def runKernelBenchmark(outputPath=None, repeats=3, sweeps=None, workerCount=1):
+
+    sweeps = sweeps if sweeps is not None else kBenchmarkSweeps
+    cases = []
+    pool = WorkerPool(sys.executable, workerCount) if workerCount > 1 else None
+
+    for parameter in sorted(sweeps):
+        for value in sweeps[parameter]:
+
+            arguments = dict(kBenchmarkDefaults)
+            arguments[parameter] = value
+            stages = {}
+
+            for r in xrange(repeats):
+                for stage, result in benchmarkKernelCase(pool=pool, **arguments).items():
+                    if stage not in stages or result["time"] < stages[stage]["time"]:
+                        stages[stage] = result
+
+            validateStages(stages)
+            cases.append({"sweep": parameter, "parameters": arguments, "stages": stages})
+
+    if pool is not None:
+        pool.close()
+
+    results = {"python": sys.version.split()[0], "repeats": repeats, "workers": workerCount, "cases": cases}
+
+    if outputPath is not None:
+        with open(outputPath, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return results
+
+# Compares results against a stored baseline (a dict or a JSON path). Returns a list of
+# (sweep, parameters, stage, baselineTime, time) for each stage slower than the allowed tolerance
+def compareKernelBenchmarks(results, baseline, tolerance=0.2, minTime=0.001):
+
+    if not isinstance(baseline, dict):
+        with open(baseline, "r") as f:
+            baseline = json.load(f)
+
+    baselineCases = {}
+
+    for case in baseline["cases"]:
+        validateStages(case["stages"])
+        baselineCases[json.dumps(case["parameters"], sort_keys=True)] = case
+
+    regressions = []
+
+    for case in results["cases"]:
+        validateStages(case["stages"])
+        baselineCase = baselineCases.get(json.dumps(case["parameters"], sort_keys=True))
+
+        if baselineCase is None:
+            continue
+
+        for stage in kBenchmarkStages:
+
+            if stage not in case["stages"] or stage not in baselineCase["stages"]:
+                continue
+
+            # Very short stages are mostly noise
+            baselineTime = baselineCase["stages"][stage]["time"]
+            stageTime = case["stages"][stage]["time"]
+
+            if stageTime > max(baselineTime * (1.0 + tolerance), minTime):
+                regressions.append((case["sweep"], case["parameters"], stage, baselineTime, stageTime))
+
+    return regressions
+
+# One line per case, with the time of each stage in ms
+def formatKernelBenchmark(results):
+
+    lines = []
+
+    for case in results["cases"]:
+        times = ["%s %.2f" % (stage, case["stages"][stage]["time"] * 1000.0) for stage in kBenchmarkStages if stage in case["stages"]]
+        lines.append("%s=%s: %s" % (case["sweep"], case["parameters"][case["sweep"]], ", ".join(times)))
+
+    return "\n".join(lines)
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(description="Benchmarks the instanceAlongCurve evaluation kernel")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON results to compare against. Exits with 1 if a stage is slower")
+    parser.add_argument("--repeats", type=int, default=3, help="Evaluations of each case, keeping the best time of each stage")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown against the baseline")
+    parser.add_argument("--sweep", action="append", choices=sorted(kBenchmarkSweeps), help="Only run the given sweeps")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes evaluating the channels, 1 evaluates them in this process")
+    options = parser.parse_args(arguments)
+
+    sweeps = dict((sweep, kBenchmarkSweeps[sweep]) for sweep in options.sweep) if options.sweep else None
+    results = runKernelBenchmark(options.output, options.repeats, sweeps, options.workers)
+    print(formatKernelBenchmark(results))
+
+    if options.baseline is None:
+        return 0
+
+    regressions = compareKernelBenchmarks(results, options.baseline, options.tolerance)
+
+    for sweep, parameters, stage, baselineTime, stageTime in regressions:
+        print("Slower %s=%s %s: %.2f ms, baseline %.2f ms" % (sweep, parameters[sweep], stage, stageTime * 1000.0, baselineTime * 1000.0))
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
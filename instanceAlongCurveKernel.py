@@ -0,0 +1,1269 @@
+import os
+import sys
+import time
+import math
+import bisect
+import cPickle
+import itertools
+import traceback
+import subprocess
+import struct
+import mmap
+import array
+
+##########
+# KERNEL #
+##########
+
+# Maya independent evaluation of the instance transforms. Everything here works with plain
+# python types (tuples and lists), so it can be evaluated and profiled outside of Maya.
+# Vectors are (x, y, z) tuples and quaternions are (x, y, z, w) tuples. Quaternion products
+# follow Maya's convention: quatMultiply(a, b) applies a first, then b, like MQuaternion a * b
+
+kIdentityQuaternion = (0.0, 0.0, 0.0, 1.0)
+kAxes = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+
+def vecDot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def vecCross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+def vecSub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def vecLength(v):
+    return math.sqrt(vecDot(v, v))
+
+def vecNormal(v):
+    length = vecLength(v)
+
+    if length > 0.0:
+        return (v[0] / length, v[1] / length, v[2] / length)
+
+    return v
+
+def quatFromAxisAngle(angle, axis):
+    axis = vecNormal(axis)
+    s = math.sin(angle * .5)
+    return (axis[0] * s, axis[1] * s, axis[2] * s, math.cos(angle * .5))
+
+def quatMultiply(a, b):
+    return (b[3] * a[0] + b[0] * a[3] + b[1] * a[2] - b[2] * a[1],
+            b[3] * a[1] - b[0] * a[2] + b[1] * a[3] + b[2] * a[0],
+            b[3] * a[2] + b[0] * a[1] - b[1] * a[0] + b[2] * a[3],
+            b[3] * a[3] - b[0] * a[0] - b[1] * a[1] - b[2] * a[2])
+
+def quatFromEulerXYZ(x, y, z):
+    return quatMultiply(quatMultiply(quatFromAxisAngle(x, kAxes[0]), quatFromAxisAngle(y, kAxes[1])), quatFromAxisAngle(z, kAxes[2]))
+
+# Same as MVector.rotateTo: the shortest rotation that takes a onto b
+def quatRotateTo(a, b):
+    a = vecNormal(a)
+    b = vecNormal(b)
+    axis = vecCross(a, b)
+    cosAngle = max(min(vecDot(a, b), 1.0), -1.0)
+
+    if vecDot(axis, axis) < 1.0e-20:
+
+        if cosAngle > 0.0:
+            return kIdentityQuaternion
+
+        # Opposite vectors, any perpendicular axis is valid
+        axis = vecCross(a, kAxes[0])
+
+        if vecDot(axis, axis) < 1.0e-20:
+            axis = vecCross(a, kAxes[1])
+
+    return quatFromAxisAngle(math.acos(cosAngle), axis)
+
+# Same as MVector.rotateBy(MQuaternion)
+def vecRotateBy(v, q):
+    qv = (q[0], q[1], q[2])
+    t = vecCross(qv, v)
+    t = (t[0] * 2.0, t[1] * 2.0, t[2] * 2.0)
+    u = vecCross(qv, t)
+    return (v[0] + q[3] * t[0] + u[0], v[1] + q[3] * t[1] + u[1], v[2] + q[3] * t[2] + u[2])
+
+# Same as MQuaternion.asEulerRotation() with the default XYZ rotation order, in radians
+def quatToEulerXYZ(q):
+    x, y, z, w = q
+
+    m00 = 1.0 - 2.0 * (y * y + z * z)
+    m10 = 2.0 * (x * y + z * w)
+    m20 = 2.0 * (x * z - y * w)
+    m21 = 2.0 * (y * z + x * w)
+    m22 = 1.0 - 2.0 * (x * x + y * y)
+
+    sinY = max(min(-m20, 1.0), -1.0)
+
+    # Gimbal lock, Z is folded into X
+    if math.fabs(sinY) > 0.9999999:
+        m01 = 2.0 * (x * y - z * w)
+        m11 = 1.0 - 2.0 * (x * x + z * z)
+        return (math.atan2(m01 * sinY, m11), math.asin(sinY), 0.0)
+
+    return (math.atan2(m21, m22), math.asin(sinY), math.atan2(m10, m00))
+
+kRandomMask = 0xFFFFFFFFFFFFFFFF
+
+# Random channels, so that each output gets its own streams
+kRandomTranslation = 0
+kRandomRotation = 1
+kRandomScale = 2
+kRandomPrototype = 3
+
+# SplitMix64 finalizer, mixes all bits of a 64 bit integer
+def mixBits(h):
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & kRandomMask
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & kRandomMask
+    return h ^ (h >> 31)
+
+def getRandomStreamKey(seed, channel, axis):
+    return mixBits(((seed & 0xFFFFFFFF) << 8 | channel << 2 | axis) & kRandomMask)
+
+# Value in [0, 1) for an instance of a stream, with 53 bits of precision
+def getStreamRandomValue(key, instance):
+    return (mixBits((key + (instance + 1) * 0x9E3779B97F4A7C15) & kRandomMask) >> 11) * (1.0 / 9007199254740992.0)
+
+# Stateless random value in [0, 1) for (seed, instance, channel, axis). Values depend only on their key,
+# so they do not change with the instance count and can be evaluated in any order
+def hashRandom(seed, instance, channel, axis):
+    return getStreamRandomValue(getRandomStreamKey(seed, channel, axis), instance)
+
+# Random values for the first count instances of a stream. The stream key is mixed only once
+def getRandomValues(seed, channel, axis, count):
+    key = getRandomStreamKey(seed, channel, axis)
+    return [getStreamRandomValue(key, i) for i in xrange(count)]
+
+# Random values for one axis of a ramp channel, for each of the given instance indices.
+# Without random amplitude they have no effect, so they are not generated
+def getRampRandomValues(settings, ramp, channel, axis, indices):
+
+    if ramp.randomAmplitude == 0.0:
+        return [0.5] * len(indices)
+
+    key = getRandomStreamKey(settings.randomSeed, channel, axis)
+    return [getStreamRandomValue(key, i) for i in indices]
+
+def getRandomizedValue(randomValue, randomAmplitude, value):
+    return (randomValue * 2.0 - 1.0) * randomAmplitude + value
+
+# Local (forward, up, right) axes of the instance, based on the inputLocalOrientationAxis enum
+def getLocalAxes(localAxisMode):
+
+    if localAxisMode == 0:
+        return (kAxes[0], kAxes[1], kAxes[2])
+    elif localAxisMode == 1:
+        return (kAxes[1], kAxes[2], kAxes[0])
+
+    return (kAxes[2], kAxes[1], kAxes[0])
+
+# Rotation that aligns the reference axis (Z) with the tangent
+def getCurveAlignmentRotation(tangent):
+
+    # If the axis is parallel, but with inverse direction, rotate it PI over the up vector
+    if vecDot(kAxes[2], vecNormal(tangent)) < -0.9999999999:
+        return quatFromAxisAngle(math.pi, kAxes[1])
+
+    return quatRotateTo(kAxes[2], tangent)
+
+def getCurveAlignmentRotations(tangents):
+    return [getCurveAlignmentRotation(tangent) for tangent in tangents]
+
+# Normalized linear interpolation, over the shortest path
+def quatNlerp(a, b, t):
+
+    if a[0] * b[0] + a[1] * b[1] + a[2] * b[2] + a[3] * b[3] < 0.0:
+        b = (-b[0], -b[1], -b[2], -b[3])
+
+    q = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t, a[2] + (b[2] - a[2]) * t, a[3] + (b[3] - a[3]) * t)
+    length = math.sqrt(q[0] * q[0] + q[1] * q[1] + q[2] * q[2] + q[3] * q[3])
+
+    return (q[0] / length, q[1] / length, q[2] / length, q[3] / length)
+
+# Angle that rotates a onto b around the given axis. a and b are expected to be perpendicular to it
+def getSignedAngle(a, b, axis):
+    return math.atan2(vecDot(vecCross(a, b), axis), vecDot(a, b))
+
+# Rotation minimizing frames over the curve, sampled uniformly by arc length. Each up vector is carried to the
+# next sample with two reflections (Wang et al., "Computation of Rotation Minimizing Frames", 2008), so frames
+# do not flip on vertical sections or loops like the shortest rotation from the reference axis does
+class FrameTable(object):
+
+    def __init__(self, rotations):
+        self.rotations = rotations
+
+    @staticmethod
+    def fromCurve(curve, arcLengthTable, resolution):
+
+        curveLength = arcLengthTable.curveLength
+        maxParam = arcLengthTable.maxParam
+        points = []
+        tangents = []
+
+        for i in xrange(resolution + 1):
+            param = max(min(arcLengthTable.findParamFromLength(curveLength * i / float(resolution)), maxParam), 0.0)
+            points.append(curve.pointAtParam(param))
+            tangents.append(vecNormal(curve.tangentAtParam(param)))
+
+        # The first frame is the same as in the Use Curve orientation mode
+        ups = [vecRotateBy(kAxes[1], getCurveAlignmentRotation(tangents[0]))]
+
+        for i in xrange(resolution):
+            ups.append(FrameTable.getReflectedUp(points[i], points[i + 1], tangents[i], tangents[i + 1], ups[i]))
+
+        # On closed curves, the twist left between the last and first frames is distributed over the curve
+        twist = 0.0
+
+        if curve.isClosed():
+            lastUp = vecRotateBy(ups[-1], quatRotateTo(tangents[-1], tangents[0]))
+            twist = getSignedAngle(lastUp, ups[0], tangents[0])
+
+        rotations = []
+
+        for i in xrange(resolution + 1):
+            rotation = getCurveAlignmentRotation(tangents[i])
+            angle = getSignedAngle(vecRotateBy(kAxes[1], rotation), ups[i], tangents[i]) + twist * i / float(resolution)
+            rotations.append(quatMultiply(rotation, quatFromAxisAngle(angle, tangents[i])))
+
+        return FrameTable(rotations)
+
+    @staticmethod
+    def getReflectedUp(point, nextPoint, tangent, nextTangent, up):
+
+        v1 = vecSub(nextPoint, point)
+        c1 = vecDot(v1, v1)
+
+        if c1 < 1.0e-20:
+            return up
+
+        # Reflect over the plane bisecting both points, then over the one bisecting the reflected and next tangents
+        k = 2.0 / c1
+        d = vecDot(v1, up) * k
+        reflectedUp = (up[0] - v1[0] * d, up[1] - v1[1] * d, up[2] - v1[2] * d)
+        d = vecDot(v1, tangent) * k
+        reflectedTangent = (tangent[0] - v1[0] * d, tangent[1] - v1[1] * d, tangent[2] - v1[2] * d)
+
+        v2 = vecSub(nextTangent, reflectedTangent)
+        c2 = vecDot(v2, v2)
+
+        if c2 < 1.0e-20:
+            return reflectedUp
+
+        d = vecDot(v2, reflectedUp) * 2.0 / c2
+        return (reflectedUp[0] - v2[0] * d, reflectedUp[1] - v2[1] * d, reflectedUp[2] - v2[2] * d)
+
+    # Interpolates the frames at each normalized arc length. Table tangents are an approximation between
+    # samples, so each frame is then aligned with the exact tangent of its instance
+    def getRotations(self, normalizedDistances, tangents):
+
+        table = self.rotations
+        resolution = len(table) - 1
+        rotations = []
+
+        for i in xrange(len(normalizedDistances)):
+            position = max(min(normalizedDistances[i], 1.0), 0.0) * resolution
+            index = min(int(position), resolution - 1)
+            rotation = quatNlerp(table[index], table[index + 1], position - index)
+            rotations.append(quatMultiply(rotation, quatRotateTo(vecRotateBy(kAxes[2], rotation), tangents[i])))
+
+        return rotations
+
+# Monotonic arc length to parameter table, so that distance queries are a binary search
+# instead of an iterative solve over the curve for each instance
+class ArcLengthTable(object):
+
+    # Bounds for the amount of samples used to approximate the curve
+    kMinSamples = 32
+    kMaxSamples = 16384
+
+    def __init__(self, lengths, params):
+        self.lengths = lengths
+        self.params = params
+        self.curveLength = lengths[-1]
+        self.maxParam = params[-1]
+
+    @staticmethod
+    def fromCurve(curve, tolerance):
+
+        curveLength = curve.length()
+        minParam, maxParam = curve.paramRange()
+
+        sampleCount = max(curve.sampleCountHint(), ArcLengthTable.kMinSamples)
+
+        # Refine until the polyline length is close enough to the real curve length
+        while True:
+            params = [minParam + (maxParam - minParam) * i / float(sampleCount) for i in xrange(sampleCount + 1)]
+            lengths = [0.0]
+
+            previousPoint = curve.pointAtParam(params[0])
+
+            for param in params[1:]:
+                point = curve.pointAtParam(param)
+                lengths.append(lengths[-1] + vecLength(vecSub(point, previousPoint)))
+                previousPoint = point
+
+            if curveLength <= 0.0 or math.fabs(curveLength - lengths[-1]) / curveLength <= tolerance or sampleCount >= ArcLengthTable.kMaxSamples:
+                break
+
+            sampleCount *= 2
+
+        # The polyline is always a bit shorter, so stretch it to match the actual curve length
+        if lengths[-1] > 0.0:
+            scale = curveLength / lengths[-1]
+            lengths = [l * scale for l in lengths]
+
+        return ArcLengthTable(lengths, params)
+
+    def findParamFromLength(self, length):
+
+        index = bisect.bisect_right(self.lengths, length)
+
+        if index <= 0:
+            return self.params[0]
+
+        if index >= len(self.lengths):
+            return self.params[-1]
+
+        segmentStart = self.lengths[index - 1]
+        segmentLength = self.lengths[index] - segmentStart
+
+        if segmentLength <= 0.0:
+            return self.params[index - 1]
+
+        t = (length - segmentStart) / segmentLength
+        return self.params[index - 1] + (self.params[index] - self.params[index - 1]) * t
+
+# Inverse of the cumulative density over the normalized arc length, sampled at uniform steps of density, so that
+# placing an instance is a table lookup instead of a search. Density is given at uniform positions over [0, 1],
+# and does not depend on the curve shape, so the table is only built again when the density changes.
+# Past the end of the curve, the density repeats, like distances over closed curves
+class DensityTable(object):
+
+    kResolution = 1024
+
+    def __init__(self, cumulativeDensities, positions):
+        self.cumulativeDensities = cumulativeDensities # normalized integral at each density sample, from 0 to 1
+        self.positions = positions # normalized arc length at each uniform step of the integral, from 0 to 1
+
+    # Returns None if there is no density anywhere, so that instances are distributed uniformly
+    @staticmethod
+    def fromDensities(densities, resolution=kResolution):
+
+        densities = [max(d, 0.0) for d in densities]
+        segmentCount = len(densities) - 1
+        cumulativeDensities = [0.0]
+
+        # Trapezoidal integration over each segment
+        for i in xrange(segmentCount):
+            cumulativeDensities.append(cumulativeDensities[-1] + (densities[i] + densities[i + 1]) * .5)
+
+        totalDensity = cumulativeDensities[-1]
+
+        if segmentCount <= 0 or totalDensity <= 0.0:
+            return None
+
+        cumulativeDensities = [c / totalDensity for c in cumulativeDensities]
+
+        # Both sequences are increasing, so the inversion is a single sweep. Segments without density are
+        # skipped, so that no position falls where there is no density, not even at the ends of the table
+        positions = []
+        segment = 0
+
+        for k in xrange(resolution + 1):
+            target = k / float(resolution)
+
+            while segment < segmentCount - 1 and (cumulativeDensities[segment + 1] < target or cumulativeDensities[segment + 1] <= cumulativeDensities[segment]):
+                segment += 1
+
+            segmentDensity = cumulativeDensities[segment + 1] - cumulativeDensities[segment]
+            t = (target - cumulativeDensities[segment]) / segmentDensity if segmentDensity > 0.0 else 0.0
+            positions.append((segment + min(max(t, 0.0), 1.0)) / float(segmentCount))
+
+        return DensityTable(cumulativeDensities, positions)
+
+    @staticmethod
+    def lookup(table, x):
+        turns = math.floor(x)
+        resolution = len(table) - 1
+        position = (x - turns) * resolution
+        index = min(int(position), resolution - 1)
+        return turns + table[index] + (table[index + 1] - table[index]) * (position - index)
+
+    # Integral of the density up to the normalized arc length
+    def getCumulativeDensity(self, normalizedDistance):
+        return DensityTable.lookup(self.cumulativeDensities, normalizedDistance)
+
+    # Normalized arc length where the integral of the density reaches the given value
+    def getNormalizedDistance(self, cumulativeDensity):
+        return DensityTable.lookup(self.positions, cumulativeDensity)
+
+    # Maps distances distributed uniformly over [0, windowLength) after windowStart to distances with the same
+    # window, distributed following the density. Distances are relative to windowStart, as given.
+    # Only the integral over the window is inverted. Interpolating the inverse table may still step a little
+    # outside of it next to regions without density, so distances are clamped to the window
+    def getDistances(self, distances, windowStart, windowLength, curveLength):
+
+        densityStart = self.getCumulativeDensity(windowStart / curveLength)
+        densityRange = self.getCumulativeDensity((windowStart + windowLength) / curveLength) - densityStart
+
+        # Without density in the window, instances stay uniform
+        if densityRange <= 0.0:
+            return distances
+
+        densityScale = densityRange / windowLength
+        windowDistances = []
+
+        for d in distances:
+            distance = self.getNormalizedDistance(densityStart + d * densityScale) * curveLength - windowStart
+            windowDistances.append(min(max(distance, 0.0), windowLength))
+
+        return windowDistances
+
+# Samples the curve once per instance. Arc length inversion, point and tangent queries are the
+# expensive part of the evaluation, so the resulting frames are shared by all output channels.
+# With a density table, instances are redistributed over [curveStart, curveStart + effectiveCurveLength)
+def sampleInstances(curve, arcLengthTable, count, distOffset, curveStart, effectiveCurveLength, lengthIncrement, handleIndex, densityTable=None):
+
+    curveLength = arcLengthTable.curveLength
+    maxParam = arcLengthTable.maxParam
+
+    params = []
+    normalizedDistances = []
+    points = []
+    tangents = []
+
+    distances = [math.fmod(lengthIncrement * i + distOffset, effectiveCurveLength) for i in xrange(count)]
+
+    if densityTable is not None and curveLength > 0.0:
+        distances = densityTable.getDistances(distances, curveStart, effectiveCurveLength, curveLength)
+
+    for i in xrange(count):
+
+        dist = math.fmod(curveStart + distances[i], curveLength)
+        param = max( min( arcLengthTable.findParamFromLength( dist ), maxParam ), 0.0)
+
+        # Ramps are not modified by curve start/end, so objects can "slide"
+        normalizedDistance = dist / curveLength
+
+        params.append(param)
+        normalizedDistances.append(normalizedDistance)
+        points.append(curve.pointAtParam(param))
+        tangents.append(curve.tangentAtParam(param))
+
+    handleAngles = getHandleAngles(handleIndex, params, curve.isClosed(), maxParam)
+    return InstanceSamples(params, normalizedDistances, points, tangents, handleAngles)
+
+# Get the angles from handles, all at once
+def getHandleAngles(handleIndex, params, wrapAround, curveMaxParam):
+
+    if handleIndex is not None:
+        return handleIndex.getAngles(params, wrapAround, curveMaxParam)
+
+    return [0.0] * len(params)
+
+# Curves are read by the kernel through a small interface: length(), paramRange(), sampleCountHint(),
+# isClosed(), pointAtParam(param) and tangentAtParam(param). MayaCurve implements it over MFnNurbsCurve,
+# and PolylineCurve and NurbsCurve are pure python stand-ins, so that the whole evaluation can run without Maya
+
+# Polyline parameterized by vertex index, like a degree 1 curve with uniform knots
+class PolylineCurve(object):
+
+    def __init__(self, points, closed=False):
+        self.points = [tuple(p) for p in points]
+        self.closed = closed
+
+        if closed:
+            self.points.append(self.points[0])
+
+    def length(self):
+        return sum(vecLength(vecSub(self.points[i + 1], self.points[i])) for i in xrange(len(self.points) - 1))
+
+    def paramRange(self):
+        return (0.0, float(len(self.points) - 1))
+
+    def sampleCountHint(self):
+        return len(self.points) - 1
+
+    def isClosed(self):
+        return self.closed
+
+    def getSegment(self, param):
+        index = max(min(int(math.floor(param)), len(self.points) - 2), 0)
+        return (index, param - index)
+
+    def pointAtParam(self, param):
+        index, t = self.getSegment(param)
+        a = self.points[index]
+        b = self.points[index + 1]
+        return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t, a[2] + (b[2] - a[2]) * t)
+
+    def tangentAtParam(self, param):
+        index, t = self.getSegment(param)
+        return vecNormal(vecSub(self.points[index + 1], self.points[index]))
+
+# Uniform B-spline over the given CVs, parameterized like Maya's uniform curves: open curves have clamped knots
+# and params in [0, spans], closed curves are periodic over all their CVs, with params in [0, cvCount]
+class NurbsCurve(object):
+
+    # Gauss-Legendre nodes and weights over [-1, 1], used to integrate the length of each knot span
+    kGaussNodes = (-0.9061798459386640, -0.5384693101056831, 0.0, 0.5384693101056831, 0.9061798459386640)
+    kGaussWeights = (0.2369268850561891, 0.4786286704993665, 0.5688888888888889, 0.4786286704993665, 0.2369268850561891)
+    kLengthSubdivisions = 4
+
+    def __init__(self, cvs, degree=3, closed=False):
+        cvs = [tuple(cv) for cv in cvs]
+
+        self.degree = degree
+        self.closed = closed
+
+        # Periodic curves repeat their first CVs, over unclamped knots
+        if closed:
+            self.cvs = cvs + cvs[:degree]
+            self.spans = len(cvs)
+            self.knots = [float(i - degree) for i in xrange(len(self.cvs) + degree + 1)]
+        else:
+            self.cvs = cvs
+            self.spans = len(cvs) - degree
+            self.knots = [0.0] * degree + [float(i) for i in xrange(self.spans + 1)] + [float(self.spans)] * degree
+
+        # The derivative is a curve of one degree less, over the inner knots
+        self.derivativeCvs = []
+        self.derivativeKnots = self.knots[1:-1]
+
+        for i in xrange(len(self.cvs) - 1):
+            knotRange = self.knots[i + degree + 1] - self.knots[i + 1]
+            scale = degree / knotRange if knotRange > 0.0 else 0.0
+            self.derivativeCvs.append(tuple(c * scale for c in vecSub(self.cvs[i + 1], self.cvs[i])))
+
+        self.curveLength = None
+
+    # De Boor's algorithm, on the knot span that contains param
+    @staticmethod
+    def evaluate(cvs, knots, degree, param):
+
+        span = max(min(bisect.bisect_right(knots, param) - 1, len(cvs) - 1), degree)
+        points = [cvs[span - degree + j] for j in xrange(degree + 1)]
+
+        for r in xrange(1, degree + 1):
+            for j in xrange(degree, r - 1, -1):
+                i = span - degree + j
+                knotRange = knots[i + degree + 1 - r] - knots[i]
+                alpha = (param - knots[i]) / knotRange if knotRange > 0.0 else 0.0
+                a = points[j - 1]
+                b = points[j]
+                points[j] = (a[0] + (b[0] - a[0]) * alpha, a[1] + (b[1] - a[1]) * alpha, a[2] + (b[2] - a[2]) * alpha)
+
+        return points[degree]
+
+    def derivativeAtParam(self, param):
+        return NurbsCurve.evaluate(self.derivativeCvs, self.derivativeKnots, self.degree - 1, param)
+
+    def length(self):
+
+        if self.curveLength is None:
+            self.curveLength = 0.0
+            minParam, maxParam = self.paramRange()
+            steps = self.spans * NurbsCurve.kLengthSubdivisions
+            stepLength = (maxParam - minParam) / float(steps)
+
+            for step in xrange(steps):
+                center = minParam + stepLength * (step + .5)
+
+                for node, weight in zip(NurbsCurve.kGaussNodes, NurbsCurve.kGaussWeights):
+                    self.curveLength += vecLength(self.derivativeAtParam(center + node * stepLength * .5)) * weight * stepLength * .5
+
+        return self.curveLength
+
+    def paramRange(self):
+        return (self.knots[self.degree], self.knots[len(self.cvs)])
+
+    def sampleCountHint(self):
+        return self.spans * self.degree * 4
+
+    def isClosed(self):
+        return self.closed
+
+    def pointAtParam(self, param):
+        return NurbsCurve.evaluate(self.cvs, self.knots, self.degree, param)
+
+    def tangentAtParam(self, param):
+        return vecNormal(self.derivativeAtParam(param))
+
+# Per-instance curve frames, sampled once and shared by translation, rotation and scale
+class InstanceSamples(object):
+
+    kSampleLists = ["params", "normalizedDistances", "points", "tangents", "handleAngles", "curveRotations", "frameRotations"]
+
+    def __init__(self, params, normalizedDistances, points, tangents, handleAngles):
+        self.params = params
+        self.normalizedDistances = normalizedDistances # Ramps are evaluated with these
+        self.points = points
+        self.tangents = tangents
+        self.handleAngles = handleAngles # Angles from manipulators over the tangent axis
+        self.curveRotations = getCurveAlignmentRotations(tangents)
+        self.frameRotations = None # Rotation minimizing frames, only set for the parallel transport mode
+
+    def __len__(self):
+        return len(self.params)
+
+    # Samples of several curves, one after the other. Frame rotations are only kept if all curves have them
+    @staticmethod
+    def join(samplesList):
+
+        if len(samplesList) == 1:
+            return samplesList[0]
+
+        joined = InstanceSamples.__new__(InstanceSamples)
+
+        for name in InstanceSamples.kSampleLists:
+            lists = [getattr(samples, name) for samples in samplesList]
+            setattr(joined, name, None if any(values is None for values in lists) else [v for values in lists for v in values])
+
+        return joined
+
+    # Rotations that align the reference axis with each tangent, based on the orientation mode
+    def getCurveRotations(self, orientationMode):
+
+        if orientationMode == 4 and self.frameRotations is not None:
+            return self.frameRotations
+
+        return self.curveRotations
+
+    # Replaces the manipulator angles, returning the indices of the instances whose angle changed
+    def updateHandleAngles(self, handleAngles):
+        changedIndices = [i for i in xrange(len(handleAngles)) if handleAngles[i] != self.handleAngles[i]]
+        self.handleAngles = handleAngles
+        return changedIndices
+
+# Ramp sampled at a fixed resolution over [0, 1], so that evaluating it for each instance
+# does not need to go through MRampAttribute
+class BakedRamp(object):
+
+    kResolution = 256
+
+    def __init__(self, values):
+        self.values = values
+
+    # Evaluates the ramp at each normalized position, honoring the ramp repeat and offset
+    def evaluate(self, normalizedPositions, rampRepeat, rampOffset):
+
+        values = self.values
+        resolution = len(values) - 1
+        result = []
+
+        for v in normalizedPositions:
+            position = max(min(math.fmod((v * rampRepeat) + rampOffset, 1.0), 1.0), 0.0) * resolution
+            index = min(int(position), resolution - 1)
+            t = position - index
+            result.append(values[index] + (values[index + 1] - values[index]) * t)
+
+        return result
+
+# Manipulator handles sorted by curve parameter, to interpolate their angles over the curve
+class HandleIndex(object):
+
+    def __init__(self, axisHandlesSorted):
+        self.params = [h[1] for h in axisHandlesSorted]
+        self.angles = [h[2] for h in axisHandlesSorted]
+
+    def getAngles(self, params, wrapAround, curveMaxParam):
+        return [self.getAngle(param, wrapAround, curveMaxParam) for param in params]
+
+    def getAngle(self, param, wrapAround, curveMaxParam):
+
+        handleCount = len(self.params)
+
+        if handleCount == 0:
+            return 0.0
+
+        # Find the range of indices that make up this curve segment
+        i = bisect.bisect_right(self.params, param)
+
+        if 0 < i < handleCount:
+            indexRange = (i - 1, i)
+        elif wrapAround:
+            indexRange = (handleCount - 1, 0)
+        elif i == 0:
+            indexRange = (0, 0)
+        else:
+            indexRange = (handleCount - 1, handleCount - 1)
+
+        # Now find the lerp value based on the range
+        minParam = self.params[indexRange[0]]
+        maxParam = self.params[indexRange[1]]
+
+        minAxis = self.angles[indexRange[0]]
+        maxAxis = self.angles[indexRange[1]]
+
+        if(math.fabs(minParam - maxParam) > 0.001):
+
+            if minParam > maxParam and wrapAround:
+
+                if param < maxParam:
+                    param = param + curveMaxParam
+
+                maxParam = maxParam + curveMaxParam
+
+            t = min(max((param - minParam) / (maxParam - minParam), 0.0), 1.0)
+
+            return minAxis + (maxAxis - minAxis) * t
+
+        return minAxis
+
+# Prototype of each instance, from the relative weight of each prototype. Sequential mode repeats each prototype
+# as many times as its rounded weight. Weighted random and ramp modes split [0, 1] in ranges proportional to the
+# weights, and pick the range of a random value or of the ramp value (given for each instance)
+def getPrototypeIndices(weights, selectionMode, seed, count, rampValues=None):
+
+    weights = [max(w, 0.0) for w in weights]
+    totalWeight = sum(weights)
+
+    if len(weights) <= 1 or totalWeight <= 0.0:
+        return [0] * count
+
+    if selectionMode == 1:                                  # Sequential
+        pattern = []
+
+        for p in xrange(len(weights)):
+            pattern.extend([p] * int(round(weights[p])))
+
+        # All weights were rounded to zero, so each prototype is used once
+        if not pattern:
+            pattern = [p for p in xrange(len(weights)) if weights[p] > 0.0]
+
+        return [pattern[i % len(pattern)] for i in xrange(count)]
+
+    if selectionMode == 2:                                  # Ramp
+        values = rampValues
+    else:                                                   # Weighted random
+        key = getRandomStreamKey(seed, kRandomPrototype, 0)
+        values = [getStreamRandomValue(key, i) for i in xrange(count)]
+
+    cumulativeWeights = []
+    accumulatedWeight = 0.0
+
+    for w in weights:
+        accumulatedWeight += w
+        cumulativeWeights.append(accumulatedWeight)
+
+    # Values at the end of the range must not pick a trailing prototype without weight
+    lastIndex = max(p for p in xrange(len(weights)) if weights[p] > 0.0)
+
+    return [min(bisect.bisect_right(cumulativeWeights, max(v, 0.0) * totalWeight), lastIndex) for v in values[:count]]
+
+# Ramp data for one channel, already evaluated for each instance
+class RampChannel(object):
+
+    def __init__(self, values, randomAmplitude, axis):
+        self.values = values # ramp value * amplitude
+        self.randomAmplitude = randomAmplitude
+        self.axis = axis
+
+# Node settings used by the kernel, read from the data block
+class TransformSettings(object):
+
+    def __init__(self):
+        self.orientationMode = 2
+        self.localAxisMode = 2
+        self.enableManipulators = False
+        self.randomSeed = 0
+        self.inputRotation = kIdentityQuaternion
+        self.rotatePivot = (0.0, 0.0, 0.0)
+        self.localTranslationOffset = (0.0, 0.0, 0.0)
+        self.globalTranslationOffset = (0.0, 0.0, 0.0)
+        self.localRotationOffset = kIdentityQuaternion
+        self.globalRotationOffset = kIdentityQuaternion
+        self.localScaleOffset = (1.0, 1.0, 1.0)
+
+# Rotation of each instance before ramps and offsets, based on the orientation mode.
+# curveRotation is the rotation that aligns the local forward axis with the tangent
+def getInstanceRotation(samples, settings, curveRotation, i):
+
+    tangent = samples.tangents[i]
+    rot = curveRotation
+
+    if settings.orientationMode == 0:                       # Identity
+        rot = kIdentityQuaternion
+    elif settings.orientationMode == 1:                     # Input rotation
+        rot = settings.inputRotation
+    elif settings.orientationMode == 3 and i % 2 == 1:      # Chain mode
+        rot = quatMultiply(rot, quatFromAxisAngle(math.pi * .5, tangent))
+
+    # Rotate over tangent axis by the angle from handles
+    if settings.enableManipulators:
+        rot = quatMultiply(rot, quatFromAxisAngle(-samples.handleAngles[i], tangent))
+
+    return rot
+
+# Channels are evaluated for all instances, or only for the given indices, returning values in the same order
+def evaluateTranslations(samples, settings, ramp, count, indices=None):
+
+    indices = xrange(count) if indices is None else indices
+
+    forward, up, right = getLocalAxes(settings.localAxisMode)
+
+    # Local offset is not considered for position
+    localRotation = quatRotateTo(forward, kAxes[2])
+
+    # Deterministic random
+    randomX = getRampRandomValues(settings, ramp, kRandomTranslation, 0, indices)
+    randomY = getRampRandomValues(settings, ramp, kRandomTranslation, 1, indices)
+    randomZ = getRampRandomValues(settings, ramp, kRandomTranslation, 2, indices)
+
+    offset = (settings.globalTranslationOffset[0] - settings.rotatePivot[0],
+              settings.globalTranslationOffset[1] - settings.rotatePivot[1],
+              settings.globalTranslationOffset[2] - settings.rotatePivot[2])
+
+    localOffset = settings.localTranslationOffset
+    curveRotations = samples.getCurveRotations(settings.orientationMode)
+    translations = []
+
+    for j, i in enumerate(indices):
+
+        # Transform rotation so that it is aligned with the tangent. This fixes unintentional twisting
+        rot = getInstanceRotation(samples, settings, quatMultiply(localRotation, curveRotations[i]), i)
+
+        # The curve basis used for twisting
+        basisForward = vecRotateBy(forward, rot)
+        basisUp = vecRotateBy(up, rot)
+        basisRight = vecRotateBy(right, rot)
+
+        value = ramp.values[i]
+        twistX = getRandomizedValue(randomX[j], ramp.randomAmplitude, value) * ramp.axis[0] + localOffset[0]
+        twistY = getRandomizedValue(randomY[j], ramp.randomAmplitude, value) * ramp.axis[1] + localOffset[1]
+        twistZ = getRandomizedValue(randomZ[j], ramp.randomAmplitude, value) * ramp.axis[2] + localOffset[2]
+
+        # Point + twist and local offset over the curve basis + global offset, without pivot
+        point = samples.points[i]
+        translations.append((point[0] + basisRight[0] * twistX + basisUp[0] * twistY + basisForward[0] * twistZ + offset[0],
+                             point[1] + basisRight[1] * twistX + basisUp[1] * twistY + basisForward[1] * twistZ + offset[1],
+                             point[2] + basisRight[2] * twistX + basisUp[2] * twistY + basisForward[2] * twistZ + offset[2]))
+
+    return translations
+
+def evaluateRotations(samples, settings, ramp, count, indices=None):
+
+    indices = xrange(count) if indices is None else indices
+
+    forward, up, right = getLocalAxes(settings.localAxisMode)
+
+    # Rotation to align selected (local) forward axis to the reference forward axis (which is aligned with tangent)
+    localRotation = quatMultiply(settings.localRotationOffset, quatRotateTo(forward, kAxes[2]))
+
+    # Deterministic random
+    randomX = getRampRandomValues(settings, ramp, kRandomRotation, 0, indices)
+    randomY = getRampRandomValues(settings, ramp, kRandomRotation, 1, indices)
+    randomZ = getRampRandomValues(settings, ramp, kRandomRotation, 2, indices)
+    curveRotations = samples.getCurveRotations(settings.orientationMode)
+    rotations = []
+
+    for j, i in enumerate(indices):
+
+        # The curve basis used for twisting is not modified by the orientation mode
+        curveRotation = quatMultiply(localRotation, curveRotations[i])
+        basisForward = vecRotateBy(forward, curveRotation)
+        basisUp = vecRotateBy(up, curveRotation)
+        basisRight = vecRotateBy(right, curveRotation)
+
+        value = ramp.values[i]
+        twistNormal = quatFromAxisAngle(math.radians(getRandomizedValue(randomX[j], ramp.randomAmplitude, value) * ramp.axis[0]), basisRight)
+        twistTangent = quatFromAxisAngle(math.radians(getRandomizedValue(randomY[j], ramp.randomAmplitude, value) * ramp.axis[1]), basisUp)
+        twistBitangent = quatFromAxisAngle(math.radians(getRandomizedValue(randomZ[j], ramp.randomAmplitude, value) * ramp.axis[2]), basisForward)
+
+        rot = getInstanceRotation(samples, settings, curveRotation, i)
+        rot = quatMultiply(quatMultiply(quatMultiply(quatMultiply(rot, twistNormal), twistTangent), twistBitangent), settings.globalRotationOffset)
+
+        rotations.append(quatToEulerXYZ(rot))
+
+    return rotations
+
+def evaluateScales(samples, settings, ramp, count, indices=None):
+
+    indices = xrange(count) if indices is None else indices
+
+    # Deterministic random. Scales are uniform, so a single axis is used
+    randomValues = getRampRandomValues(settings, ramp, kRandomScale, 0, indices)
+    scaleOffset = settings.localScaleOffset
+    scales = []
+
+    for j, i in enumerate(indices):
+
+        # Scales are unified... because it makes more sense
+        value = getRandomizedValue(randomValues[j], ramp.randomAmplitude, ramp.values[i])
+        scales.append((scaleOffset[0] + value * ramp.axis[0], scaleOffset[1] + value * ramp.axis[1], scaleOffset[2] + value * ramp.axis[2]))
+
+    return scales
+
+# Instances are visible where the visibility ramp reaches the threshold
+def getInstanceVisibility(rampValues, threshold):
+    return [v >= threshold for v in rampValues]
+
+# Instances that are visible, but were hidden in the previous visibility. None means all visible
+def getRevealedIndices(visibility, previousVisibility):
+
+    if previousVisibility is None or len(previousVisibility) != len(visibility):
+        return []
+
+    return [i for i in xrange(len(visibility)) if visibility[i] and not previousVisibility[i]]
+
+# Evaluated values of the given instances, in a list of count values. Hidden instances are not evaluated, so
+# they keep their previous value, or zero
+def scatterValues(values, indices, count, previousValues=None):
+
+    if previousValues is not None and len(previousValues) == count:
+        result = list(previousValues)
+    else:
+        result = [(0.0, 0.0, 0.0)] * count
+
+    for j, i in enumerate(indices):
+        result[i] = values[j]
+
+    return result
+
+# Distance from the pivot to the farthest corner of the given bounds
+def getBoundsRadius(boundsMin, boundsMax, pivot):
+    x = max(math.fabs(boundsMin[0] - pivot[0]), math.fabs(boundsMax[0] - pivot[0]))
+    y = max(math.fabs(boundsMin[1] - pivot[1]), math.fabs(boundsMax[1] - pivot[1]))
+    z = max(math.fabs(boundsMin[2] - pivot[2]), math.fabs(boundsMax[2] - pivot[2]))
+    return math.sqrt(x * x + y * y + z * z)
+
+# Bounds of the instances, as (min, max) tuples. Translations do not include the pivot, so it is added back.
+# Each instance is expanded by the radius of the source object under its biggest scale component
+def getInstanceBounds(translations, scales, pivot, radius):
+
+    boundsMin = [float("inf")] * 3
+    boundsMax = [float("-inf")] * 3
+
+    for i in xrange(len(translations)):
+
+        translation = translations[i]
+        instanceRadius = radius
+
+        if radius > 0.0 and scales is not None and i < len(scales):
+            scale = scales[i]
+            instanceRadius = radius * max(math.fabs(scale[0]), math.fabs(scale[1]), math.fabs(scale[2]))
+
+        for axis in xrange(3):
+            center = translation[axis] + pivot[axis]
+            boundsMin[axis] = min(boundsMin[axis], center - instanceRadius)
+            boundsMax[axis] = max(boundsMax[axis], center + instanceRadius)
+
+    return (tuple(boundsMin), tuple(boundsMax))
+
+# Batched evaluation of all channels. Returns translation, rotation (euler, radians) and scale lists
+def evaluateInstanceTransforms(samples, settings, positionRamp, rotationRamp, scaleRamp, count):
+    translations = evaluateTranslations(samples, settings, positionRamp, count)
+    rotations = evaluateRotations(samples, settings, rotationRamp, count)
+    scales = evaluateScales(samples, settings, scaleRamp, count)
+    return (translations, rotations, scales)
+
+# Parallel evaluation over worker processes. Workers are new python interpreters started with subprocess,
+# never forked from the caller, and only import this module. Each one evaluates chunks of instances sent
+# through its stdin. Chunks keep the index of each instance, which random values and chain mode depend on,
+# so results are identical to the serial evaluation. Only the sample lists read by each channel are sent,
+# packed as doubles, since pickling the tuples themselves takes longer than evaluating them
+
+# Sample lists read by each channel function. Rotations are the ones chosen by the orientation mode
+kChannelSampleLists = {evaluateTranslations: ["points", "tangents", "handleAngles", "curveRotations"],
+                       evaluateRotations: ["tangents", "handleAngles", "curveRotations"],
+                       evaluateScales: []}
+
+# Lists of floats or of tuples of floats, as (width, bytes). Anything else is sent as is, with width None
+def packValues(values):
+
+    try:
+        if len(values) > 0 and isinstance(values[0], tuple):
+            return (len(values[0]), array.array("d", itertools.chain.from_iterable(values)).tostring())
+
+        return (0, array.array("d", values).tostring())
+    except TypeError:
+        return (None, values)
+
+def unpackValues(packedValues):
+
+    width, data = packedValues
+
+    if width is None:
+        return data
+
+    values = array.array("d")
+    values.fromstring(data)
+
+    if width == 0:
+        return values.tolist()
+
+    iterator = iter(values)
+    return zip(*([iterator] * width))
+
+# The samples and ramp values of the instances in [start, end), sent to a worker
+class InstanceChunk(object):
+
+    def __init__(self, evaluateFn, samples, settings, ramp, start, end, indices=None):
+        self.start = start
+        self.end = end
+        self.indices = indices # Instances to evaluate, all of them if None
+        self.sampleLists = {}
+
+        for name in kChannelSampleLists.get(evaluateFn, InstanceSamples.kSampleLists):
+            values = samples.getCurveRotations(settings.orientationMode) if name == "curveRotations" else getattr(samples, name)
+
+            if values is not None:
+                self.sampleLists[name] = packValues(values[start:end])
+
+        self.rampValues = packValues(ramp.values[start:end])
+        self.randomAmplitude = ramp.randomAmplitude
+        self.axis = ramp.axis
+
+    # Instances before the chunk are left empty, so that each instance keeps its index
+    def evaluate(self, evaluateFn, settings):
+
+        padding = [None] * self.start
+        samples = InstanceSamples.__new__(InstanceSamples)
+
+        for name in InstanceSamples.kSampleLists:
+            setattr(samples, name, None)
+
+        for name, values in self.sampleLists.items():
+            setattr(samples, name, padding + unpackValues(values))
+
+        ramp = RampChannel(padding + unpackValues(self.rampValues), self.randomAmplitude, self.axis)
+        return evaluateFn(samples, settings, ramp, self.end, xrange(self.start, self.end) if self.indices is None else self.indices)
+
+kWorkerCommand = "import sys; sys.path.insert(0, %r); import instanceAlongCurveKernel; instanceAlongCurveKernel.runWorker()"
+
+class WorkerPool(object):
+
+    def __init__(self, executable, workerCount):
+        self.workerCount = workerCount
+        self.workers = []
+
+        command = [executable, "-c", kWorkerCommand % os.path.dirname(os.path.abspath(__file__))]
+
+        try:
+            for i in xrange(workerCount):
+                self.workers.append(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=(sys.platform != "win32")))
+        except:
+            self.close()
+            raise
+
+    def isAlive(self):
+        return len(self.workers) == self.workerCount and all(worker.poll() is None for worker in self.workers)
+
+    # Evaluates a channel like evaluateFn(samples, settings, ramp, count, indices), with one chunk per worker.
+    # Each worker gets a single chunk at a time, so that no pipe fills up while both of its ends are writing.
+    # If anything fails the pool is closed, since the workers may be out of sync
+    def evaluate(self, evaluateFn, samples, settings, ramp, count, indices=None):
+
+        if indices is None:
+            chunkSize = max(int(math.ceil(count / float(self.workerCount))), 1)
+            chunks = [InstanceChunk(evaluateFn, samples, settings, ramp, start, min(start + chunkSize, count)) for start in xrange(0, count, chunkSize)]
+        else:
+            chunkSize = max(int(math.ceil(len(indices) / float(self.workerCount))), 1)
+            parts = [indices[start:start + chunkSize] for start in xrange(0, len(indices), chunkSize)]
+            chunks = [InstanceChunk(evaluateFn, samples, settings, ramp, part[0], part[-1] + 1, part) for part in parts]
+
+        values = []
+
+        try:
+            for worker, chunk in zip(self.workers, chunks):
+                cPickle.dump((evaluateFn, settings, chunk), worker.stdin, 2)
+                worker.stdin.flush()
+
+            for worker in self.workers[:len(chunks)]:
+                status, result = cPickle.load(worker.stdout)
+
+                if status != "ok":
+                    raise RuntimeError("Worker failed evaluating instances:\n" + result)
+
+                values.extend(unpackValues(result))
+        except:
+            self.close()
+            raise
+
+        return values
+
+    def close(self):
+
+        for worker in self.workers:
+            try:
+                worker.stdin.close()
+
+                if worker.poll() is None:
+                    worker.terminate()
+
+                worker.wait()
+            except EnvironmentError:
+                pass
+
+        self.workers = []
+
+# Main loop of a worker process, until its stdin is closed. Results are written to the original stdout,
+# so anything printed while evaluating goes to stderr instead
+def runWorker():
+
+    input = sys.stdin
+    output = sys.stdout
+    sys.stdout = sys.stderr
+
+    if sys.platform == "win32":
+        import msvcrt
+        msvcrt.setmode(input.fileno(), os.O_BINARY)
+        msvcrt.setmode(output.fileno(), os.O_BINARY)
+
+    while True:
+        try:
+            evaluateFn, settings, chunk = cPickle.load(input)
+        except EOFError:
+            return
+
+        try:
+            result = ("ok", packValues(chunk.evaluate(evaluateFn, settings)))
+        except:
+            result = ("error", traceback.format_exc())
+
+        cPickle.dump(result, output, 2)
+        output.flush()
+
+# Accumulates the wall time and call count of each evaluation stage
+class StageTimer(object):
+
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+
+    def add(self, stage, startTime):
+        self.times[stage] = self.times.get(stage, 0.0) + time.time() - startTime
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def asDict(self):
+        return dict((stage, {"time": self.times[stage], "calls": self.calls[stage]}) for stage in self.times)
+
+# Used when profiling is disabled, so that stages can be reported unconditionally
+class NullStageTimer(object):
+
+    def add(self, stage, startTime):
+        pass
+
+kNullStageTimer = NullStageTimer()
+
+# Instance cache files store a header, then one chunk per frame with count * 9 float32 values (translation,
+# rotation in radians and scale of each instance), and a table with the offset and count of each chunk.
+# The table is written last, so that frames can be streamed while baking
+kCacheMagic = "IACC"
+kCacheVersion = 1
+kCacheHeaderFormat = "<4sIIIddQ"
+kCacheHeaderSize = 64
+kCacheFrameFormat = "<QII"
+kCacheFrameSize = struct.calcsize(kCacheFrameFormat)
+kCacheValuesPerInstance = 9
+
+# Values of a frame chunk, interleaved by instance
+def getCacheValues(translations, rotations, scales):
+
+    values = []
+
+    for i in xrange(len(translations)):
+        values.extend(translations[i])
+        values.extend(rotations[i])
+        values.extend(scales[i])
+
+    return values
+
+# Chunks are stored little endian, like the header
+def getCacheArray(values):
+
+    data = array.array('f', values)
+
+    if sys.byteorder == "big":
+        data.byteswap()
+
+    return data
+
+class InstanceCacheWriter(object):
+
+    def __init__(self, path, startFrame, frameStep):
+        self.file = open(path, "wb")
+        self.startFrame = startFrame
+        self.frameStep = frameStep
+        self.frames = []
+        self.maxInstanceCount = 0
+
+        # The header is written again when closing, once the table offset is known
+        self.file.write("\0" * kCacheHeaderSize)
+
+    def writeFrame(self, translations, rotations, scales):
+
+        count = len(translations)
+
+        self.frames.append((self.file.tell(), count))
+        self.maxInstanceCount = max(self.maxInstanceCount, count)
+        getCacheArray(getCacheValues(translations, rotations, scales)).tofile(self.file)
+
+    def close(self):
+
+        tableOffset = self.file.tell()
+
+        for offset, count in self.frames:
+            self.file.write(struct.pack(kCacheFrameFormat, offset, count, 0))
+
+        self.file.seek(0)
+        self.file.write(struct.pack(kCacheHeaderFormat, kCacheMagic, kCacheVersion, len(self.frames), self.maxInstanceCount,
+                                    self.startFrame, self.frameStep, tableOffset))
+        self.file.close()
+
+# Reads frames from a memory mapped cache file. Only the chunk of the requested frame is read,
+# so playback cost does not depend on the length of the cache
+class InstanceCache(object):
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.frameCount, self.maxInstanceCount, self.startFrame, self.frameStep, self.tableOffset = struct.unpack_from(kCacheHeaderFormat, self.map, 0)
+        except:
+            self.file.close()
+            raise
+
+        if magic != kCacheMagic or version != kCacheVersion:
+            self.close()
+            raise ValueError("not an instance cache, or an unsupported version")
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    # Frames outside of the baked range hold the first or last frame
+    def getFrameIndex(self, frame):
+        index = int(round((frame - self.startFrame) / self.frameStep))
+        return min(max(index, 0), self.frameCount - 1)
+
+    # Returns the raw values of a frame, as an array of count * kCacheValuesPerInstance floats
+    def getFrameValues(self, index):
+
+        offset, count, _ = struct.unpack_from(kCacheFrameFormat, self.map, self.tableOffset + index * kCacheFrameSize)
+
+        data = array.array('f')
+        data.fromstring(self.map[offset:offset + count * kCacheValuesPerInstance * data.itemsize])
+
+        if sys.byteorder == "big":
+            data.byteswap()
+
+        return data
+
+    # Returns the translations, rotations and scales of the closest baked frame
+    def getFrame(self, frame):
+
+        if self.frameCount == 0:
+            return ([], [], [])
+
+        data = self.getFrameValues(self.getFrameIndex(frame))
+        step = kCacheValuesPerInstance
+
+        translations = zip(data[0::step], data[1::step], data[2::step])
+        rotations = zip(data[3::step], data[4::step], data[5::step])
+        scales = zip(data[6::step], data[7::step], data[8::step])
+
+        return (translations, rotations, scales)
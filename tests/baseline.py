@@ -0,0 +1,113 @@
+# Evaluates the locator of the version before the kernel refactor (kBaselineRevision) over the same stand-ins,
+# to write the golden files of the cases it supports. Its source is read from git, so this is only needed to
+# write them again, never by the tests themselves:
+#
+#   python tests/baseline.py
+
+import imp
+import subprocess
+
+import headless
+from headless import OpenMaya
+
+kBaselineRevision = "6244d2a"
+
+def loadBaselinePlugin():
+
+    source = subprocess.check_output(["git", "show", kBaselineRevision + ":instanceAlongCurve.py"], cwd=headless.kTestsDirectory)
+    module = imp.new_module("instanceAlongCurveBaseline")
+    exec(compile(source, "instanceAlongCurve.py@" + kBaselineRevision, "exec"), module.__dict__)
+
+    module.instanceAlongCurveLocator.nodeInitializer()
+    return module
+
+# Attributes of a node class by name, including the children of its attribute containers. The baseline also
+# keeps the children of some attributes on their MObject, like rotationRampAttr.rampAxis.compound
+def getAttributesByName(value, attributes=None, depth=3):
+
+    attributes = {} if attributes is None else attributes
+
+    if isinstance(value, OpenMaya.MObject):
+        attributes[value.name] = value
+
+    if depth > 0 and hasattr(value, "__dict__"):
+        for child in vars(value).values():
+            getAttributesByName(child, attributes, depth - 1)
+
+    return attributes
+
+# Values of a current node, keyed by the baseline attributes with the same name. Compound values are dictionaries
+# by child attribute, so their keys are translated too
+def translateValue(value, attributes):
+
+    if isinstance(value, dict):
+        return dict((attributes[key.name], translateValue(v, attributes)) for key, v in value.items())
+
+    if isinstance(value, list):
+        return [translateValue(v, attributes) for v in value]
+
+    return value
+
+# Follows the steps of the baseline compute(), over a current node built by a golden case. Its values are
+# copied by attribute name, so attributes that the baseline does not have are ignored
+def evaluateBaselineLocator(plugin, node, curve, instanceCount, instanceLength=1.0):
+
+    BaselineLocator = plugin.instanceAlongCurveLocator
+    attributes = getAttributesByName(BaselineLocator)
+
+    baselineNode = BaselineLocator()
+    values = baselineNode.thisMObject().attributeValues
+
+    for attribute, value in node.thisMObject().attributeValues.items():
+        if attribute.name in attributes:
+            values[attributes[attribute.name]] = translateValue(value, attributes)
+
+    values[BaselineLocator.instanceCountAttr] = instanceCount
+    values[BaselineLocator.instanceLengthAttr] = instanceLength
+
+    # The baseline only counts instances by distance when the curve is connected
+    curveFn = OpenMaya.MFnNurbsCurve(curve)
+    baselineNode.getCurveFn = lambda: curveFn
+    isConnected = OpenMaya.MPlug.isConnected
+    OpenMaya.MPlug.isConnected = lambda plug: plug.attribute() == BaselineLocator.inputCurveAttr
+
+    try:
+        count = baselineNode.getInstanceCountByMode()
+    finally:
+        OpenMaya.MPlug.isConnected = isConnected
+
+    dataBlock = OpenMaya.MDataBlock(baselineNode.thisMObject())
+    distOffset = dataBlock.inputValue(BaselineLocator.distOffsetAttr).asFloat()
+    curveLength = curveFn.length()
+    curveStart = dataBlock.inputValue(BaselineLocator.curveStartAttr).asFloat() * curveLength
+    curveEnd = dataBlock.inputValue(BaselineLocator.curveEndAttr).asFloat() * curveLength
+    effectiveCurveLength = min(max(curveEnd - curveStart, 0.001), curveLength)
+    lengthIncrement = baselineNode.getIncrementByMode(count, effectiveCurveLength)
+
+    inputTransformPlug = OpenMaya.MPlug(baselineNode.thisMObject(), BaselineLocator.inputTransformAttr)
+    axisHandlesSorted = plugin.getSortedCurveAxisArray(baselineNode.thisMObject(), dataBlock.inputArrayValue(BaselineLocator.curveAxisHandleAttr.compound), count)
+
+    for outputAttr in [BaselineLocator.outputTranslationAttr, BaselineLocator.outputRotationAttr, BaselineLocator.outputScaleAttr]:
+        values[outputAttr.compound] = [None] * count
+
+    baselineNode.updateInstancePositions(curveFn, dataBlock, count, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement, inputTransformPlug, None, axisHandlesSorted)
+    baselineNode.updateInstanceRotations(curveFn, dataBlock, count, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement, inputTransformPlug, None, axisHandlesSorted)
+    baselineNode.updateInstanceScale(curveFn, dataBlock, count, distOffset, curveStart, curveEnd, effectiveCurveLength, lengthIncrement)
+
+    return {"count": count,
+            "translations": values[BaselineLocator.outputTranslationAttr.compound],
+            "rotations": values[BaselineLocator.outputRotationAttr.compound],
+            "scales": values[BaselineLocator.outputScaleAttr.compound]}
+
+def writeBaselineGoldens():
+
+    import testGolden
+
+    plugin = loadBaselinePlugin()
+
+    for name in testGolden.kBaselineCases:
+        node, arguments = testGolden.kCases[name]()
+        headless.writeGolden(name, evaluateBaselineLocator(plugin, node, testGolden.getCaseCurve(arguments), arguments.get("instanceCount", 7), arguments.get("instanceLength", 1.0)))
+
+if __name__ == "__main__":
+    writeBaselineGoldens()
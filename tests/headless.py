@@ -0,0 +1,89 @@
+# Imports the plugin with the OpenMaya stand-ins in mayaStandIn, and evaluates a locator over a pure python
+# curve following the same steps as compute(), so that the locator math can be tested without Maya
+
+import os
+import sys
+import json
+
+kTestsDirectory = os.path.dirname(os.path.abspath(__file__))
+kGoldenDirectory = os.path.join(kTestsDirectory, "golden")
+
+for path in [os.path.dirname(kTestsDirectory), os.path.join(kTestsDirectory, "mayaStandIn")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import maya.OpenMaya as OpenMaya
+import instanceAlongCurve
+import instanceAlongCurveKernel as kernel
+
+Locator = instanceAlongCurve.instanceAlongCurveLocator
+
+# Creates the attributes, with the same defaults as in Maya
+Locator.nodeInitializer()
+
+# When set, golden files are written with the current results instead of being compared
+kUpdateGolden = os.environ.get("IAC_UPDATE_GOLDEN", "") == "1"
+
+def createLocator(values=None):
+
+    node = Locator()
+    node.thisMObject().attributeValues.update(values or {})
+
+    return node
+
+# Entries are (position, value, interpolation) tuples
+def setRamp(node, rampAttributes, entries, amplitude, axis=None, offset=0.0, repeat=1.0, randomAmplitude=0.0):
+
+    values = node.thisMObject().attributeValues
+    values[rampAttributes.ramp] = list(entries)
+    values[rampAttributes.rampAmplitude] = amplitude
+    values[rampAttributes.rampOffset] = offset
+    values[rampAttributes.rampRepeat] = repeat
+    values[rampAttributes.rampRandomAmplitude] = randomAmplitude
+
+    if axis is not None:
+        values[rampAttributes.rampAxis.compound] = axis
+
+# Handles are (parameter, angle) tuples, in any order
+def setHandles(node, handles):
+
+    values = node.thisMObject().attributeValues
+    values[Locator.enableManipulatorsAttr] = True
+    values[Locator.curveAxisHandleCountAttr] = len(handles)
+    values[Locator.curveAxisHandleAttr.compound] = [{Locator.curveAxisHandleAttr.parameter: parameter, Locator.curveAxisHandleAttr.angle: angle} for parameter, angle in handles]
+
+# Returns the translation, rotation and scale of each instance over the curve (a kernel NurbsCurve)
+def evaluateLocator(node, curve, instanceCount, instanceLength=1.0):
+
+    dataBlock = OpenMaya.MDataBlock(node.thisMObject())
+    inputCurve = Locator.InputCurve(Locator.kPrimaryCurve, curve, instanceCount, instanceLength)
+    timer = instanceAlongCurve.kNullStageTimer
+
+    arcLengthTable = node.getArcLengthTable(inputCurve, dataBlock)
+    count = node.getCurveInstanceCount(arcLengthTable.curveLength, instanceCount, instanceLength)
+
+    settings = node.getTransformSettings(dataBlock, OpenMaya.MPlug(node.thisMObject(), Locator.inputTransformAttr), None)
+    samples, changedIndices, resampledIndices = node.getInstanceSamples(dataBlock, [inputCurve], [count], settings.orientationMode)
+
+    translations, _ = node.evaluateChannel(dataBlock, Locator.outputTranslationAttr, Locator.positionRampAttr, False, kernel.evaluateTranslations,
+                                           samples, settings, count, changedIndices, timer, "positionRamp", "translation")
+    rotations, _ = node.evaluateChannel(dataBlock, Locator.outputRotationAttr, Locator.rotationRampAttr, True, kernel.evaluateRotations,
+                                        samples, settings, count, changedIndices, timer, "rotationRamp", "rotation")
+    scales, _ = node.evaluateChannel(dataBlock, Locator.outputScaleAttr, Locator.scaleRampAttr, False, kernel.evaluateScales,
+                                     samples, settings, count, resampledIndices, timer, "scaleRamp", "scale")
+
+    return {"count": count, "translations": translations, "rotations": rotations, "scales": scales}
+
+def getGoldenPath(name):
+    return os.path.join(kGoldenDirectory, name + ".json")
+
+def writeGolden(name, results):
+
+    with open(getGoldenPath(name), "w") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+def readGolden(name):
+
+    with open(getGoldenPath(name), "r") as f:
+        return json.load(f)
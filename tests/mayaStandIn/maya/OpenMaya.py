@@ -0,0 +1,598 @@
+# Stand-in for the subset of maya.OpenMaya used by the locator math, so that the plugin can be imported
+# and its evaluation tested without Maya. Only what the plugin relies on is implemented. Anything else is
+# missing on purpose, so that tests fail loudly instead of evaluating something that does not match Maya
+
+import copy
+import math
+import bisect
+import instanceAlongCurveKernel as kernel
+
+# Node objects keep the values of their attributes, which MPlug and MDataBlock read and write.
+# Attribute objects keep their default value, used until a value is set on a node
+class MObject(object):
+
+    def __init__(self, name=None, defaultValue=None):
+        self.attributeValues = {}
+        self.name = name
+        self.defaultValue = defaultValue
+
+    def isNull(self):
+        return False
+
+class MTypeId(object):
+
+    def __init__(self, id):
+        self.id = id
+
+class MSpace(object):
+    kInvalid = 0
+    kTransform = 1
+    kPreTransform = 2
+    kPostTransform = 3
+    kWorld = 4
+    kObject = kPreTransform
+
+class MVector(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+
+        if isinstance(x, (MVector, MPoint)):
+            x, y, z = x.x, x.y, x.z
+
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __add__(self, other):
+        return MVector(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return MVector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __neg__(self):
+        return MVector(-self.x, -self.y, -self.z)
+
+    # Scaling by a number, or dot product with another vector
+    def __mul__(self, other):
+
+        if isinstance(other, MVector):
+            return self.x * other.x + self.y * other.y + self.z * other.z
+
+        return MVector(self.x * other, self.y * other, self.z * other)
+
+    __rmul__ = __mul__
+
+    # Cross product
+    def __xor__(self, other):
+        return MVector(*kernel.vecCross((self.x, self.y, self.z), (other.x, other.y, other.z)))
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z)[index]
+
+    def length(self):
+        return math.sqrt(self * self)
+
+    def normal(self):
+        return MVector(*kernel.vecNormal((self.x, self.y, self.z)))
+
+    def normalize(self):
+        self.x, self.y, self.z = kernel.vecNormal((self.x, self.y, self.z))
+
+    def isEquivalent(self, other, tolerance=1e-10):
+        return (self - other).length() <= tolerance
+
+    def isParallel(self, other, tolerance=1e-10):
+        return (self.normal() ^ other.normal()).length() <= tolerance
+
+    # Shortest arc rotation, identity for parallel vectors
+    def rotateTo(self, target):
+
+        axis = self ^ target
+
+        if axis.length() <= 1e-10:
+            return MQuaternion()
+
+        return MQuaternion(math.acos(max(min(self.normal() * target.normal(), 1.0), -1.0)), axis)
+
+    def rotateBy(self, quaternion):
+
+        u = MVector(quaternion.x, quaternion.y, quaternion.z)
+        t = (u ^ self) * 2.0
+        return self + t * quaternion.w + (u ^ t)
+
+class MPoint(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+
+        if isinstance(x, (MVector, MPoint)):
+            x, y, z = x.x, x.y, x.z
+
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+        self.w = float(w)
+
+    def __add__(self, vector):
+        return MPoint(self.x + vector.x, self.y + vector.y, self.z + vector.z)
+
+    def __sub__(self, other):
+
+        if isinstance(other, MPoint):
+            return MVector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+        return MPoint(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def distanceTo(self, other):
+        return (self - other).length()
+
+MVector.xAxis = MVector(1.0, 0.0, 0.0)
+MVector.yAxis = MVector(0.0, 1.0, 0.0)
+MVector.zAxis = MVector(0.0, 0.0, 1.0)
+
+# Products follow Maya: a * b applies a first, then b. Also built from an angle and an axis
+class MQuaternion(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+
+        if isinstance(y, MVector):
+            axis = y.normal()
+            s = math.sin(x * 0.5)
+            x, y, z, w = axis.x * s, axis.y * s, axis.z * s, math.cos(x * 0.5)
+
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+        self.w = float(w)
+
+    def __mul__(self, other):
+        return MQuaternion(*kernel.quatMultiply((self.x, self.y, self.z, self.w), (other.x, other.y, other.z, other.w)))
+
+    def conjugate(self):
+        return MQuaternion(-self.x, -self.y, -self.z, self.w)
+
+    def normal(self):
+        length = math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z + self.w * self.w)
+        return MQuaternion(self.x / length, self.y / length, self.z / length, self.w / length)
+
+    # XYZ order, read from the rotated axes
+    def asEulerRotation(self):
+
+        xAxis = MVector.xAxis.rotateBy(self)
+        yAxis = MVector.yAxis.rotateBy(self)
+        zAxis = MVector.zAxis.rotateBy(self)
+
+        return MEulerRotation(math.atan2(yAxis.z, zAxis.z), math.asin(max(min(-xAxis.z, 1.0), -1.0)), math.atan2(xAxis.y, xAxis.x))
+
+# Only the XYZ order
+class MEulerRotation(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def asQuaternion(self):
+        return MQuaternion(self.x, MVector.xAxis) * MQuaternion(self.y, MVector.yAxis) * MQuaternion(self.z, MVector.zAxis)
+
+    def asVector(self):
+        return MVector(self.x, self.y, self.z)
+
+class MFloatArray(list):
+
+    def __init__(self, count=0, value=0.0):
+
+        if isinstance(count, (list, tuple)):
+            list.__init__(self, count)
+        else:
+            list.__init__(self, [value] * count)
+
+    def length(self):
+        return len(self)
+
+    def set(self, value, index):
+        self[index] = value
+
+MIntArray = MFloatArray
+MDoubleArray = MFloatArray
+
+# Curve functions over a pure python curve (instanceAlongCurveKernel.NurbsCurve), in object space
+class MFnNurbsCurve(object):
+    kInvalid = 0
+    kOpen = 1
+    kClosed = 2
+    kPeriodic = 3
+
+    kLengthSamples = 4096
+
+    def __init__(self, curve):
+        self.curve = curve
+        self.lengthTable = None
+
+    def length(self, tolerance=0.001):
+        return self.curve.length()
+
+    def numSpans(self):
+        return self.curve.spans
+
+    def degree(self):
+        return self.curve.degree
+
+    def numCVs(self):
+        return len(self.curve.cvs)
+
+    def form(self):
+        return MFnNurbsCurve.kPeriodic if self.curve.isClosed() else MFnNurbsCurve.kOpen
+
+    def getPointAtParam(self, param, point, space=MSpace.kObject):
+        point.x, point.y, point.z = self.curve.pointAtParam(param)
+
+    # Like Maya, tangents are normalized
+    def tangent(self, param, space=MSpace.kObject):
+        return MVector(*self.curve.tangentAtParam(param))
+
+    # Inverse of a dense table of the length at uniform params, so that the ends are exact
+    def findParamFromLength(self, length):
+
+        minParam, maxParam = self.curve.paramRange()
+
+        if self.lengthTable is None:
+            params = [minParam + (maxParam - minParam) * i / float(MFnNurbsCurve.kLengthSamples) for i in range(MFnNurbsCurve.kLengthSamples + 1)]
+            lengths = [0.0]
+
+            for i in range(1, len(params)):
+                lengths.append(lengths[-1] + kernel.vecLength(kernel.vecSub(self.curve.pointAtParam(params[i]), self.curve.pointAtParam(params[i - 1]))))
+
+            scale = self.curve.length() / lengths[-1] if lengths[-1] > 0.0 else 1.0
+            self.lengthTable = ([l * scale for l in lengths], params)
+
+        if length <= 0.0:
+            return minParam
+
+        if length >= self.curve.length():
+            return maxParam
+
+        return kernel.ArcLengthTable(*self.lengthTable).findParamFromLength(length)
+
+class MFnNumericData(object):
+    kBoolean = 1
+    kShort = 3
+    kInt = 7
+    kFloat = 11
+    kDouble = 12
+
+class MFnData(object):
+    kString = 4
+    kStringArray = 6
+    kDoubleArray = 7
+    kIntArray = 9
+    kNurbsCurve = 15
+    kDynArrayAttrs = 22
+
+# Attribute function sets only keep what evaluation needs: the default value of each attribute.
+# Array attributes default to no elements, and compounds to a dictionary by child attribute
+class MFnAttribute(object):
+    kDelete = 0
+    kReset = 1
+    kNothing = 2
+
+    def __init__(self):
+        self.attributeObject = None
+
+    def createAttribute(self, name, defaultValue):
+        self.attributeObject = MObject(name, defaultValue)
+        return self.attributeObject
+
+    def setArray(self, isArray):
+        if isArray:
+            self.attributeObject.defaultValue = []
+
+    def setKeyable(self, state):
+        pass
+
+    setChannelBox = setKeyable
+    setConnectable = setKeyable
+    setStorable = setKeyable
+    setWritable = setKeyable
+    setReadable = setKeyable
+    setHidden = setKeyable
+    setUsesArrayDataBuilder = setKeyable
+    setDisconnectBehavior = setKeyable
+    setUsedAsFilename = setKeyable
+    setMin = setKeyable
+    setMax = setKeyable
+    setSoftMin = setKeyable
+    setSoftMax = setKeyable
+
+class MFnNumericAttribute(MFnAttribute):
+
+    # Either a single value of the given type, or the compound of three child attributes
+    def create(self, name, shortName, valueType, *args):
+
+        if isinstance(valueType, MObject):
+            return self.createAttribute(name, tuple(child.defaultValue for child in (valueType,) + args))
+
+        if args:
+            return self.createAttribute(name, args[0])
+
+        return self.createAttribute(name, False if valueType == MFnNumericData.kBoolean else 0)
+
+class MFnUnitAttribute(MFnAttribute):
+    kAngle = 1
+    kDistance = 2
+    kTime = 3
+
+    def create(self, name, shortName, unitType, defaultValue=0.0):
+        return self.createAttribute(name, defaultValue)
+
+# Enums default to their first field
+class MFnEnumAttribute(MFnAttribute):
+
+    def create(self, name, shortName, defaultValue=None):
+        self.fields = {}
+        return self.createAttribute(name, defaultValue)
+
+    def addField(self, fieldName, value):
+
+        self.fields[fieldName] = value
+
+        if self.attributeObject.defaultValue is None:
+            self.attributeObject.defaultValue = value
+
+    def setDefault(self, fieldName):
+        self.attributeObject.defaultValue = self.fields[fieldName]
+
+class MFnTypedAttribute(MFnAttribute):
+
+    def create(self, name, shortName, dataType, defaultData=None):
+        return self.createAttribute(name, "" if dataType == MFnData.kString else defaultData)
+
+class MFnMatrixAttribute(MFnAttribute):
+    kFloat = 0
+    kDouble = 1
+
+    def create(self, name, shortName, matrixType=kDouble):
+        return self.createAttribute(name, None)
+
+class MFnMessageAttribute(MFnAttribute):
+
+    def create(self, name, shortName):
+        return self.createAttribute(name, None)
+
+class MFnCompoundAttribute(MFnAttribute):
+
+    def create(self, name, shortName):
+        return self.createAttribute(name, {})
+
+    def addChild(self, child):
+        if isinstance(self.attributeObject.defaultValue, dict):
+            self.attributeObject.defaultValue[child] = child.defaultValue
+
+# Pointers are single values, written by the functions that take them
+class MScriptUtil(object):
+
+    class Pointer(object):
+
+        def __init__(self, value):
+            self.value = value
+
+    def __init__(self):
+        self.pointer = MScriptUtil.Pointer(0.0)
+
+    def createFromDouble(self, value):
+        self.pointer.value = value
+
+    def createFromInt(self, value):
+        self.pointer.value = value
+
+    def asFloatPtr(self):
+        return self.pointer
+
+    def asDoublePtr(self):
+        return self.pointer
+
+    def getFloat(self, pointer):
+        return pointer.value
+
+    def getDouble(self, pointer):
+        return pointer.value
+
+# Plugs read and write the values kept by their node. Stand-in plugs are never connected
+class MPlug(object):
+
+    def __init__(self, node=None, attribute=None):
+        self.nodeObject = node
+        self.attributeObject = attribute
+
+    def node(self):
+        return self.nodeObject
+
+    def attribute(self):
+        return self.attributeObject
+
+    def isConnected(self):
+        return False
+
+    # Defaults are copied to the node the first time they are read, so that arrays and ramps can be edited in place
+    def getValue(self):
+
+        values = self.nodeObject.attributeValues
+
+        if self.attributeObject not in values:
+            values[self.attributeObject] = copy.deepcopy(self.attributeObject.defaultValue)
+
+        return values[self.attributeObject]
+
+    def setValue(self, value):
+        self.nodeObject.attributeValues[self.attributeObject] = value
+
+    def asInt(self):
+        return int(self.getValue())
+
+    asShort = asInt
+
+    def asBool(self):
+        return bool(self.getValue())
+
+    def asFloat(self):
+        return float(self.getValue())
+
+    asDouble = asFloat
+
+    def asString(self):
+        return str(self.getValue())
+
+    def setInt(self, value):
+        self.setValue(int(value))
+
+    setShort = setInt
+
+    def setBool(self, value):
+        self.setValue(bool(value))
+
+    def setFloat(self, value):
+        self.setValue(float(value))
+
+    setDouble = setFloat
+
+    def setString(self, value):
+        self.setValue(str(value))
+
+    def setMVector(self, value):
+        self.setValue(MVector(value))
+
+# Element handles of output arrays write their value back to the array
+class MDataHandle(object):
+
+    def __init__(self, value, array=None, index=None):
+        self.value = value
+        self.array = array
+        self.index = index
+
+    def set3Double(self, x, y, z):
+        self.value = (x, y, z)
+        self.array[self.index] = self.value
+
+    def asInt(self):
+        return int(self.value)
+
+    asShort = asInt
+
+    def asBool(self):
+        return bool(self.value)
+
+    def asFloat(self):
+        return float(self.value)
+
+    asDouble = asFloat
+
+    def asString(self):
+        return str(self.value)
+
+    def asVector(self):
+        return MVector(*self.value) if isinstance(self.value, (tuple, list)) else MVector(self.value)
+
+    # Compound values are dictionaries by child attribute
+    def child(self, attribute):
+        return MDataHandle(self.value[attribute])
+
+# Array values are lists of element values, with logical indices equal to their physical ones
+class MArrayDataHandle(object):
+
+    def __init__(self, values):
+        self.values = values
+        self.index = 0
+
+    def elementCount(self):
+        return len(self.values)
+
+    def jumpToArrayElement(self, index):
+        self.index = index
+
+    def elementIndex(self):
+        return self.index
+
+    def inputValue(self):
+        return MDataHandle(self.values[self.index])
+
+    def outputValue(self):
+        return MDataHandle(self.values[self.index], self.values, self.index)
+
+    def setAllClean(self):
+        pass
+
+    setClean = setAllClean
+
+# Data blocks read the same values as the plugs of their node
+class MDataBlock(object):
+
+    def __init__(self, node):
+        self.node = node
+
+    def inputValue(self, attribute):
+
+        if isinstance(attribute, MPlug):
+            attribute = attribute.attribute()
+
+        return MDataHandle(MPlug(self.node, attribute).getValue())
+
+    def inputArrayValue(self, attribute):
+        return MArrayDataHandle(MPlug(self.node, attribute).getValue())
+
+    outputArrayValue = inputArrayValue
+
+class MFnDependencyNode(object):
+
+    def __init__(self, node):
+        self.nodeObject = node
+
+    def findPlug(self, attribute, wantNetworkedPlug=True):
+        return MPlug(self.nodeObject, attribute)
+
+# Curve ramps, kept as the value of their plug as a list of (position, value, interpolation) entries.
+# Spline entries are interpolated like smooth ones
+class MRampAttribute(object):
+    kNone = 0
+    kLinear = 1
+    kSmooth = 2
+    kSpline = 3
+
+    def __init__(self, plug):
+        self.plug = plug
+
+    @staticmethod
+    def createCurveRamp(name, shortName):
+        return MObject(name, [])
+
+    def getEntries(self):
+        return sorted(self.plug.getValue())
+
+    def addEntries(self, positions, values, interpolations):
+        self.plug.setValue(self.getEntries() + [(positions[i], values[i], interpolations[i]) for i in range(len(positions))])
+
+    def getValueAtPosition(self, position, valuePointer):
+
+        entries = self.getEntries()
+
+        if not entries:
+            valuePointer.value = 0.0
+            return
+
+        index = bisect.bisect_right([entry[0] for entry in entries], position)
+
+        if index == 0:
+            valuePointer.value = entries[0][1]
+            return
+
+        if index == len(entries):
+            valuePointer.value = entries[-1][1]
+            return
+
+        (startPosition, startValue, interpolation), (endPosition, endValue, _) = entries[index - 1], entries[index]
+        t = (position - startPosition) / (endPosition - startPosition) if endPosition > startPosition else 0.0
+
+        if interpolation == MRampAttribute.kNone:
+            t = 0.0
+        elif interpolation != MRampAttribute.kLinear:
+            t = t * t * (3.0 - 2.0 * t)
+
+        valuePointer.value = startValue + (endValue - startValue) * t
@@ -0,0 +1,38 @@
+# Stand-in for the proxy classes of maya.OpenMayaMPx. Proxy nodes own a stand-in MObject, which keeps
+# the values of their attributes
+
+import maya.OpenMaya as OpenMaya
+
+class MPxNode(object):
+    kLocatorNode = 2
+    kManipContainer = 6
+
+    def __init__(self):
+        self.nodeObject = OpenMaya.MObject()
+
+    def thisMObject(self):
+        return self.nodeObject
+
+    # Attributes are only kept by the class of the node, so registering them does nothing
+    @staticmethod
+    def addAttribute(attribute):
+        pass
+
+    @staticmethod
+    def attributeAffects(whenChanges, isAffected):
+        pass
+
+class MPxLocatorNode(MPxNode):
+    pass
+
+class MPxManipContainer(MPxNode):
+
+    @staticmethod
+    def addToManipConnectTable(nodeId):
+        pass
+
+class MPxCommand(object):
+    pass
+
+def asMPxPtr(proxy):
+    return proxy
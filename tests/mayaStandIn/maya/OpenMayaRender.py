@@ -0,0 +1 @@
+# Stand-in for maya.OpenMayaRender. Nothing in it is used by the tests
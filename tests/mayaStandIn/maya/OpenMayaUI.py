@@ -0,0 +1 @@
+# Stand-in for maya.OpenMayaUI. Nothing in it is used by the tests
@@ -0,0 +1 @@
+# Stand-in for maya.mel. Nothing in it is used by the tests
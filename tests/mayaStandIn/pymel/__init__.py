@@ -0,0 +1 @@
+# Stand-in for the pymel package, used by the tests to import the plugin without Maya
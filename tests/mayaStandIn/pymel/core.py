@@ -0,0 +1,8 @@
+# Stand-in for pymel.core. Only the base class of the AE template is needed to import the plugin
+
+class ui(object):
+
+    class AETemplate(object):
+
+        def __init__(self, nodeName):
+            self.nodeName = nodeName
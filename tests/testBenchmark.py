@@ -0,0 +1,28 @@
+# Runs a small sweep of the headless benchmark, so that it keeps working with the kernel
+
+import unittest
+
+import headless
+import instanceAlongCurveBenchmark as benchmark
+
+class BenchmarkTest(unittest.TestCase):
+
+    def testSweepReportsKnownStages(self):
+
+        results = benchmark.runKernelBenchmark(repeats=1, sweeps={"degree": [1, 3], "orientationMode": [4]})
+
+        self.assertEqual(3, len(results["cases"]))
+
+        for case in results["cases"]:
+            self.assertEqual(set(benchmark.kBenchmarkStages) - set(case["stages"]), set() if case["parameters"]["orientationMode"] == 4 else set(["frameTable"]))
+
+    def testUnknownStagesAreRejected(self):
+        self.assertRaises(ValueError, benchmark.validateStages, {"arcLength": {}, "writing": {}})
+
+    def testComparisonAgainstItself(self):
+
+        results = benchmark.runKernelBenchmark(repeats=1, sweeps={"instanceCount": [10]})
+        self.assertEqual([], benchmark.compareKernelBenchmarks(results, results))
+
+if __name__ == "__main__":
+    unittest.main()
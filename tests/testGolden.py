@@ -0,0 +1,154 @@
+# Evaluates the locator headlessly and compares its outputs with the golden files in tests/golden.
+# The golden files are a regression baseline: run with IAC_UPDATE_GOLDEN=1 to write them again after an
+# intended change of the results, and review the diff. Cases in kBaselineCases are written by baseline.py
+# instead, with the version before the kernel refactor, so they check that the refactor kept its results
+
+import unittest
+
+import headless
+from headless import Locator, kernel
+
+kTolerance = 1e-6
+
+# The arc length table is an approximation of findParamFromLength, which the baseline uses. With the default
+# arcLengthTolerance, instances move by up to 0.01, so baseline cases are evaluated with a much finer table.
+# Baked ramps and the euler angles of the manipulators still differ by up to 5e-5
+kBaselineArcLengthTolerance = 1e-7
+kBaselineTolerance = 1e-4
+
+# Not symmetric and not planar, so that every rotation axis is exercised
+kCurveCVs = [(0.0, 0.0, 0.0), (2.0, 1.0, 0.0), (4.0, -1.0, 1.0), (6.0, 0.0, 2.0), (8.0, 1.0, 0.0), (10.0, 0.0, -1.0)]
+
+# Each case returns its node, and the instanceCount, instanceLength and degree it is evaluated with, if not the defaults
+
+def countModeCase():
+    return headless.createLocator(), {}
+
+def distanceModeCase():
+
+    node = headless.createLocator({Locator.instancingModeAttr: 1,
+                                   Locator.instanceLengthAttr: 0.75,
+                                   Locator.curveStartAttr: 0.1,
+                                   Locator.curveEndAttr: 0.9})
+
+    return node, {"instanceLength": 0.75}
+
+def chainModeCase():
+
+    node = headless.createLocator({Locator.orientationModeAttr: 3,
+                                   Locator.inputLocalOrientationAxisAttr: 0})
+
+    return node, {"degree": 2}
+
+def parallelTransportModeCase():
+
+    node = headless.createLocator({Locator.orientationModeAttr: 4,
+                                   Locator.frameTableResolutionAttr: 64})
+
+    return node, {"instanceCount": 9}
+
+def manipulatorsCase():
+
+    node = headless.createLocator({Locator.distOffsetAttr: 0.25})
+    headless.setHandles(node, [(1.5, 90.0), (0.2, 30.0), (2.6, -45.0)])
+
+    return node, {"instanceCount": 11}
+
+def rampsCase():
+
+    node = headless.createLocator({Locator.inputLocalRotationOffsetAttr.compound: (0.0, 45.0, 0.0),
+                                   Locator.inputGlobalTranslationOffsetAttr.compound: (0.0, 0.0, 2.0)})
+
+    headless.setRamp(node, Locator.positionRampAttr, [(0.0, 0.0, 1), (0.5, 1.0, 1), (1.0, 0.25, 1)], 2.0)
+    headless.setRamp(node, Locator.rotationRampAttr, [(0.0, 0.0, 2), (1.0, 1.0, 2)], 90.0, axis=(1.0, 1.0, 0.0), repeat=2.0)
+    headless.setRamp(node, Locator.scaleRampAttr, [(0.0, 1.0, 0), (0.4, 0.5, 0), (0.8, 2.0, 0)], 1.0, offset=0.1)
+
+    return node, {"instanceCount": 13}
+
+# Random values come from the hashed streams of the kernel, which intentionally replaced the random module
+# seeded with the instance count. The baseline results can not be reproduced, so this golden is not a baseline one
+def randomRampsCase():
+
+    node, arguments = rampsCase()
+    values = node.thisMObject().attributeValues
+    values[Locator.randomSeedAttr] = 7
+    values[Locator.positionRampAttr.rampRandomAmplitude] = 0.5
+    values[Locator.scaleRampAttr.rampRandomAmplitude] = 0.25
+
+    return node, arguments
+
+kCases = {"countMode": countModeCase,
+          "distanceMode": distanceModeCase,
+          "chainMode": chainModeCase,
+          "parallelTransportMode": parallelTransportModeCase,
+          "manipulators": manipulatorsCase,
+          "ramps": rampsCase,
+          "randomRamps": randomRampsCase}
+
+# Parallel transport did not exist before the refactor, and random values intentionally changed
+kBaselineCases = ["countMode", "distanceMode", "chainMode", "manipulators", "ramps"]
+
+def getCaseCurve(arguments):
+    return kernel.NurbsCurve(kCurveCVs, arguments.get("degree", 3))
+
+class GoldenTest(unittest.TestCase):
+
+    def assertGolden(self, name):
+
+        node, arguments = kCases[name]()
+
+        if name in kBaselineCases:
+            node.thisMObject().attributeValues[Locator.arcLengthToleranceAttr] = kBaselineArcLengthTolerance
+
+        results = headless.evaluateLocator(node, getCaseCurve(arguments), arguments.get("instanceCount", 7), arguments.get("instanceLength", 1.0))
+
+        if name in kBaselineCases:
+            self.assertAlmostEqualTree(headless.readGolden(name), results, name, kBaselineTolerance)
+            return
+
+        if headless.kUpdateGolden:
+            headless.writeGolden(name, results)
+            return
+
+        self.assertAlmostEqualTree(headless.readGolden(name), results, name, kTolerance)
+
+    def assertAlmostEqualTree(self, expected, actual, path, tolerance):
+
+        if isinstance(expected, dict):
+            self.assertEqual(sorted(expected.keys()), sorted(actual.keys()), path)
+
+            for key in expected:
+                self.assertAlmostEqualTree(expected[key], actual[key], path + "." + key, tolerance)
+
+        elif isinstance(expected, list):
+            self.assertEqual(len(expected), len(actual), path)
+
+            for i in xrange(len(expected)):
+                self.assertAlmostEqualTree(expected[i], actual[i], "%s[%d]" % (path, i), tolerance)
+
+        else:
+            self.assertTrue(abs(expected - actual) <= tolerance, "%s: expected %r, got %r" % (path, expected, actual))
+
+    def testCountMode(self):
+        self.assertGolden("countMode")
+
+    def testDistanceMode(self):
+        self.assertGolden("distanceMode")
+
+    def testChainMode(self):
+        self.assertGolden("chainMode")
+
+    def testParallelTransportMode(self):
+        self.assertGolden("parallelTransportMode")
+
+    def testManipulators(self):
+        self.assertGolden("manipulators")
+
+    def testRamps(self):
+        self.assertGolden("ramps")
+
+    def testRandomRamps(self):
+        self.assertGolden("randomRamps")
+
+if __name__ == "__main__":
+    unittest.main()
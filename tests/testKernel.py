@@ -0,0 +1,138 @@
+# Tests of the Maya-free kernel, which is also used by the stand-in curves of the golden tests
+
+import sys
+import math
+import unittest
+
+import headless
+from headless import kernel
+
+class NurbsCurveTest(unittest.TestCase):
+
+    def assertVectorAlmostEqual(self, expected, actual, places=6):
+        for i in xrange(3):
+            self.assertAlmostEqual(expected[i], actual[i], places)
+
+    def testLinearCurveIsPolyline(self):
+
+        cvs = [(0.0, 0.0, 0.0), (1.0, 2.0, 0.0), (3.0, 2.0, 1.0), (4.0, 0.0, 0.0)]
+        curve = kernel.NurbsCurve(cvs, 1)
+        polyline = kernel.PolylineCurve(cvs)
+
+        self.assertAlmostEqual(polyline.length(), curve.length())
+
+        for param in [0.0, 0.3, 1.0, 1.7, 2.5, 3.0]:
+            self.assertVectorAlmostEqual(polyline.pointAtParam(param), curve.pointAtParam(param))
+
+    def testOpenCurveInterpolatesEnds(self):
+
+        cvs = [(0.0, 0.0, 0.0), (2.0, 1.0, 0.0), (4.0, -1.0, 1.0), (6.0, 0.0, 2.0), (8.0, 1.0, 0.0)]
+        curve = kernel.NurbsCurve(cvs, 3)
+        minParam, maxParam = curve.paramRange()
+
+        self.assertVectorAlmostEqual(cvs[0], curve.pointAtParam(minParam))
+        self.assertVectorAlmostEqual(cvs[-1], curve.pointAtParam(maxParam))
+        self.assertFalse(curve.isClosed())
+
+    def testClosedCurveMeetsItself(self):
+
+        curve = kernel.NurbsCurve([(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (-1.0, 0.0, 0.0), (0.0, -1.0, 0.0)], 3, True)
+        minParam, maxParam = curve.paramRange()
+
+        self.assertVectorAlmostEqual(curve.pointAtParam(minParam), curve.pointAtParam(maxParam))
+        self.assertVectorAlmostEqual(curve.tangentAtParam(minParam), curve.tangentAtParam(maxParam))
+        self.assertTrue(curve.isClosed())
+
+    def testTangentMatchesFiniteDifferences(self):
+
+        curve = kernel.NurbsCurve([(0.0, 0.0, 0.0), (2.0, 1.0, 0.0), (4.0, -1.0, 1.0), (6.0, 0.0, 2.0), (8.0, 1.0, 0.0)], 3)
+        epsilon = 1e-6
+
+        for param in [0.1, 0.9, 1.5]:
+            difference = kernel.vecSub(curve.pointAtParam(param + epsilon), curve.pointAtParam(param - epsilon))
+            self.assertVectorAlmostEqual(kernel.vecNormal(difference), curve.tangentAtParam(param), 5)
+
+class DensityTableTest(unittest.TestCase):
+
+    def testUniformDensity(self):
+
+        table = kernel.DensityTable.fromDensities([1.0] * 9)
+        distances = [i * 0.5 for i in xrange(8)]
+
+        for expected, actual in zip(distances, table.getDistances(distances, 2.0, 4.0, 10.0)):
+            self.assertAlmostEqual(expected, actual)
+
+    # Density starts rising at 0.49 of the curve, so a window that starts at 0.2 has none at its start
+    def testWindowStartsWithoutDensity(self):
+
+        table = kernel.DensityTable.fromDensities([0.0] * 50 + [1.0] * 51)
+        windowStart = 2.0
+        windowLength = 4.0
+        distances = table.getDistances([i * 0.5 for i in xrange(8)], windowStart, windowLength, 10.0)
+
+        for distance in distances:
+            self.assertTrue(0.0 <= distance <= windowLength, distance)
+
+            # All of the density of the window is in [4.9, 6)
+            self.assertTrue(windowStart + distance >= 4.9 - 1e-6, windowStart + distance)
+
+        self.assertEqual(sorted(distances), distances)
+
+    def testSampledInstancesStayInTheWindow(self):
+
+        curve = kernel.PolylineCurve([(float(i), 0.0, 0.0) for i in xrange(11)])
+        arcLengthTable = kernel.ArcLengthTable.fromCurve(curve, 0.001)
+        table = kernel.DensityTable.fromDensities([0.0] * 50 + [1.0] * 51)
+        samples = kernel.sampleInstances(curve, arcLengthTable, 8, 0.0, 2.0, 4.0, 0.5, None, table)
+
+        for point in samples.points:
+            self.assertTrue(4.9 - 1e-6 <= point[0] <= 6.0 + 1e-6, point)
+
+    # Density ends at 0.5 of the curve, so that the table ends on a region without density
+    def testWindowEndsWithoutDensity(self):
+
+        table = kernel.DensityTable.fromDensities([1.0] * 50 + [0.0] * 51)
+        distances = table.getDistances([i * 0.5 for i in xrange(8)], 4.0, 4.0, 10.0)
+
+        for distance in distances:
+            self.assertTrue(0.0 <= 4.0 + distance <= 5.0 + 1e-6, distance)
+
+# Workers are started from the current interpreter, like mayapy does in Maya
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = kernel.WorkerPool(sys.executable, 2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def evaluate(self, orientationMode, indices=None):
+
+        curve = kernel.NurbsCurve([(math.cos(i * .5) * 4.0, i * .2, math.sin(i * .5) * 4.0) for i in xrange(12)], 3)
+        arcLengthTable = kernel.ArcLengthTable.fromCurve(curve, 0.001)
+        count = 101
+        samples = kernel.sampleInstances(curve, arcLengthTable, count, 0.0, 0.0, arcLengthTable.curveLength, arcLengthTable.curveLength / count, None)
+
+        settings = kernel.TransformSettings()
+        settings.orientationMode = orientationMode
+        ramp = kernel.RampChannel([i / float(count) for i in xrange(count)], 0.5, (1.0, 0.5, 0.25))
+
+        for evaluateFn in [kernel.evaluateTranslations, kernel.evaluateRotations, kernel.evaluateScales]:
+            self.assertEqual(evaluateFn(samples, settings, ramp, count, indices), self.pool.evaluate(evaluateFn, samples, settings, ramp, count, indices))
+
+    def testMatchesSerialEvaluation(self):
+        self.evaluate(2)
+
+    def testChainModeMatchesSerialEvaluation(self):
+        self.evaluate(3)
+
+    def testIndicesMatchSerialEvaluation(self):
+        self.evaluate(2, [i for i in xrange(101) if i % 3 != 1])
+
+    def testPoolStaysUsable(self):
+        self.evaluate(2)
+        self.evaluate(2, [5, 50, 100])
+        self.assertTrue(self.pool.isAlive())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Logical indices of the instance connections, which must never be handed out twice
+
+import unittest
+
+import headless
+
+LogicalIndexAllocator = headless.instanceAlongCurve.LogicalIndexAllocator
+
+class LogicalIndexAllocatorTest(unittest.TestCase):
+
+    def testAllocatesHolesFirst(self):
+
+        allocator = LogicalIndexAllocator([0, 2, 5])
+
+        self.assertEqual([1, 3, 4, 6], allocator.allocate(4))
+        self.assertEqual([7], allocator.allocate(1))
+
+    def testReleasedIndicesAreReused(self):
+
+        allocator = LogicalIndexAllocator([0, 1, 2, 3])
+        allocator.release(2)
+        allocator.release(0)
+
+        self.assertEqual([0, 2, 4], allocator.allocate(3))
+
+    def testReleaseAfterMarkUsedIsQueuedOnce(self):
+
+        allocator = LogicalIndexAllocator([0, 1, 2])
+        allocator.release(1)
+        allocator.markUsed(1)
+        allocator.release(1)
+
+        self.assertEqual([1, 3, 4], allocator.allocate(3))
+
+    # Instances replaced on the same index release it, and mark it as used again when reconnected
+    def testReplacedIndexIsNotAllocated(self):
+
+        allocator = LogicalIndexAllocator([0, 1, 2])
+        allocator.release(1)
+        allocator.markUsed(1)
+
+        self.assertEqual([3, 4], allocator.allocate(2))
+        self.assertNotIn(1, allocator.queuedIndices)
+
+    def testReleaseTwiceIsQueuedOnce(self):
+
+        allocator = LogicalIndexAllocator([0, 1])
+        allocator.release(0)
+        allocator.release(0)
+
+        self.assertEqual([0, 2], allocator.allocate(2))
+
+    def testMarkUsedBeyondTheEndLeavesHoles(self):
+
+        allocator = LogicalIndexAllocator([])
+        allocator.markUsed(3)
+
+        self.assertEqual([0, 1, 2, 4], allocator.allocate(4))
+
+    def testNoDuplicatesOverManyOperations(self):
+
+        allocator = LogicalIndexAllocator([0, 3, 4])
+        used = set([0, 3, 4])
+
+        for step in xrange(200):
+            index = (step * 7) % 13
+
+            if step % 3 == 0:
+                allocator.release(index)
+                used.discard(index)
+            elif step % 3 == 1:
+                allocator.markUsed(index)
+                used.add(index)
+            else:
+                indices = allocator.allocate(2)
+                self.assertEqual(len(set(indices)), len(indices))
+                self.assertFalse(used.intersection(indices))
+                used.update(indices)
+
+if __name__ == "__main__":
+    unittest.main()